@@ -0,0 +1,21 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+
+class BlogQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Бюджеты блога; подкласс повторяет их на каталоге x10."""
+
+    def test_list(self):
+        self.assertBudget(reverse('blog:list'), 5, 50_000)
+
+    def test_page(self):
+        self.assertBudget(reverse('blog:list') + '?page=2', 5, 50_000)
+
+    def test_detail(self):
+        self.assertBudget(reverse('blog:detail', args=['post-1']), 5, 40_000)
+
+
+class BlogQueryBudgetX10TestCase(BlogQueryBudgetTestCase):
+    SCALE = 10
@@ -1,12 +1,23 @@
+from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404
+from core import images, pagecache
+from core.conditional import conditional, field_last_modified
+
 from .models import BlogPost
 
+PER_PAGE = 12
+
 
+@conditional('blog')
 def list_view(request):
-    posts = BlogPost.objects.filter(is_published=True)
-    return render(request, 'blog/list.html', {'posts': posts})
+    page_obj = Paginator(BlogPost.objects.filter(is_published=True), PER_PAGE).get_page(request.GET.get('page'))
+    images.prime_fields(page_obj.object_list, 'cover')
+    pagecache.tag(request, 'blog')
+    return render(request, 'blog/list.html', {'posts': page_obj.object_list, 'page_obj': page_obj})
 
 
+@conditional('blog', last_modified=field_last_modified(BlogPost.objects.filter(is_published=True), 'pub_date'))
 def detail_view(request, slug):
     post = get_object_or_404(BlogPost, slug=slug, is_published=True)
+    pagecache.tag(request, post)
     return render(request, 'blog/detail.html', {'post': post})
@@ -14,6 +14,9 @@ SECRET_KEY = env('SECRET_KEY', default='unsafe-dev-key')
 # Отладочный режим (по умолчанию True для разработки)
 DEBUG = env.bool('DEBUG', default=True)
 
+# Версия релиза для ETag страниц (core.conditional); пусто — по времени изменения шаблонов
+APP_RELEASE = env('APP_RELEASE', default='')
+
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['localhost', '127.0.0.1'])
 CSRF_TRUSTED_ORIGINS = env.list('CSRF_TRUSTED_ORIGINS', default=[])  # важно для Django 4.2+
 
@@ -37,6 +40,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Учёт SQL на запрос и Server-Timing — первым, чтобы видеть все middleware (core.querytrace)
+    'core.querytrace.QueryTraceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -44,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Полностраничный кэш анонимных страниц — последним (см. core.pagecache)
+    'core.pagecache.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -78,11 +85,33 @@ DATABASES = {
     )
 }
 
+# Кэш: счётчики поколений и пулы каталога (core.cache).
+# В dev хватает памяти процесса; в prod нужен общий для всех воркеров бэкенд.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Полностраничный кэш (core.pagecache): срок жизни записи и s-maxage для Caddy
+PAGE_CACHE_TIMEOUT = env.int('PAGE_CACHE_TIMEOUT', default=60 * 60)
+PAGE_CACHE_EDGE_TTL = env.int('PAGE_CACHE_EDGE_TTL', default=60)
+
+# Пререндер страниц на диск для Caddy (core.prerender); пусто — выключен
+PRERENDER_ROOT = env('PRERENDER_ROOT', default='')
+PRERENDER_HOST = env('PRERENDER_HOST', default='')
+
+# Журнал заявок (core.leads): форма пишет сюда, flush_leads переносит в базу; пусто — сразу в базу
+LEAD_JOURNAL_PATH = env('LEAD_JOURNAL_PATH', default='')
+
 # статика/медиа
 STATIC_URL = "/static/"
 MEDIA_URL = "/media/"
 STATIC_ROOT = os.getenv("DJANGO_STATIC_ROOT", BASE_DIR / "static_collected")
 MEDIA_ROOT = os.getenv("DJANGO_MEDIA_ROOT", BASE_DIR / "media")
+# Загрузки именуются хэшем содержимого (core.storage): одинаковые файлы хранятся один раз
+STORAGES = {
+    "default": {"BACKEND": "core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
 # Папка с общими статическими файлами проекта (CSS, JS, изображения и т.д.)
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
@@ -97,6 +126,9 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Хранилище резервных копий (manage.py backup / restore_backup)
+BACKUP_ROOT = env('BACKUP_ROOT', default=str(BASE_DIR / 'backups'))
+
 # Почта по умолчанию SMTP (перекроем в dev)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = env('EMAIL_HOST', default='')
@@ -104,8 +136,14 @@ EMAIL_PORT = env.int('EMAIL_PORT', default=587)
 EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=True)
+EMAIL_TIMEOUT = env.int('EMAIL_TIMEOUT', default=10)
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='noreply@example.com')
 
+# Учёт SQL-запросов (core.querytrace): доля запросов со сводкой в логе и порог N+1
+SQL_TRACE = env.bool('SQL_TRACE', default=True)
+SQL_TRACE_SAMPLE = env.float('SQL_TRACE_SAMPLE', default=0.01)
+SQL_TRACE_N_PLUS_ONE = env.int('SQL_TRACE_N_PLUS_ONE', default=5)
+
 # Логирование — чтобы видеть 500 в логах контейнера
 LOG_LEVEL = env('LOG_LEVEL', default='INFO')
 LOGGING = {
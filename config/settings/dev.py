@@ -8,5 +8,8 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 INTERNAL_IPS = ['127.0.0.1', 'localhost']
 
+# Сводки core.querytrace по выборке в разработке и тестах не пишутся (N+1 — пишутся)
+SQL_TRACE_SAMPLE = env.float('SQL_TRACE_SAMPLE', default=0)
+
 # Для локальной разработки используем пути из base.py
 # Статика и медиа раздаются через Django в режиме DEBUG=True
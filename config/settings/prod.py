@@ -7,6 +7,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DEBUG = os.getenv('DJANGO_DEBUG', 'False').lower() == 'true'
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'unsafe-dev-key-change-in-production')
 
+# Версия релиза для ETag страниц (core.conditional); пусто — по времени изменения шаблонов
+APP_RELEASE = os.getenv('APP_RELEASE', '')
+
 # Домены для продакшена
 ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', 'thaidreamphuket.com,www.thaidreamphuket.com').split(',')
 CSRF_TRUSTED_ORIGINS = [f'https://{host}' for host in ALLOWED_HOSTS]
@@ -26,6 +29,11 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.getenv('DJANGO_STATIC_ROOT', '/app/staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.getenv('DJANGO_MEDIA_ROOT', '/app/media')
+# Медиа по хэшу содержимого (core.storage): /media/cas/ Caddy отдаёт как immutable
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 # Статические файлы проекта
 STATICFILES_DIRS = [
@@ -49,6 +57,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Учёт SQL на запрос и Server-Timing — первым, чтобы видеть все middleware (core.querytrace)
+    'core.querytrace.QueryTraceMiddleware',
+    # GET/HEAD читают из replica; воркеры, команды и POST — из default (core.sqlite.routers)
+    'core.sqlite.routers.ReplicaReadsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -57,6 +69,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Полностраничный кэш анонимных страниц — последним (см. core.pagecache)
+    'core.pagecache.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -74,6 +88,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "core.context_processors.site_settings",
                 "core.context_processors.active_page",
+                "core.context_processors.navigation_categories",
             ],
         },
     },
@@ -81,13 +96,32 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# База данных для продакшена
+# База данных для продакшена: SQLite в WAL с профилем PRAGMA (core.sqlite).
+# Чтения идут в отдельное соединение только для чтения к тому же файлу, запись
+# и транзакции — в default; соединения живут в воркере между запросами.
+# Файл — на томе /app/data, общем для web и воркеров (prerender, images, leads, notify)
+DB_NAME = os.getenv('DJANGO_DB_NAME', '/app/data/db.sqlite3')
+DB_CONN_MAX_AGE = int(os.getenv('DJANGO_DB_CONN_MAX_AGE', 600))
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.getenv('DJANGO_DB_NAME', '/data/db.sqlite3'),
-    }
+        'ENGINE': 'core.sqlite',
+        'NAME': DB_NAME,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        # BEGIN IMMEDIATE: запись берёт блокировку сразу и ждёт busy_timeout,
+        # а не падает при попытке повысить чтение до записи
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+    'replica': {
+        'ENGINE': 'core.sqlite',
+        'NAME': DB_NAME,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'read_only': True},
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['core.sqlite.routers.ReadReplicaRouter']
 
 # Создаем директорию для базы данных если её нет
 try:
@@ -95,6 +129,49 @@ try:
 except OSError:
     pass
 
+# Общий кэш для всех воркеров gunicorn (поколения каталога, пулы выборок).
+# Файловый бэкенд не требует отдельного сервиса и переживает перезапуск воркеров.
+# Каталог должен быть общим для всех контейнеров (web, prerender, images, notify):
+# сбросы страниц, поколения каталога и метаданные изображений из фоновых
+# сервисов иначе не доходят до web, а они сами видят устаревшие записи.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('DJANGO_CACHE_DIR', '/app/data/cache'),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Счётчики поколений (core.cache): без срока жизни и без случайного вытеснения —
+    # потерянный счётчик сбрасывает всё пространство имён. Ключей — по одному на
+    # пространство и объект со страницей, лимит с запасом
+    'generations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('DJANGO_GENERATIONS_DIR', '/app/data/generations'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+}
+
+# Полностраничный кэш (core.pagecache): записи сбрасываются сигналами по
+# суррогатным ключам, s-maxage ограничивает, сколько страницу держит Caddy
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', 60 * 60))
+PAGE_CACHE_EDGE_TTL = int(os.getenv('PAGE_CACHE_EDGE_TTL', 60))
+
+# Пререндер страниц (core.prerender): /app/data у Caddy смонтирован как /srv/tdp-data/data
+PRERENDER_ROOT = os.getenv('PRERENDER_ROOT', '/app/data/pages')
+PRERENDER_HOST = os.getenv('PRERENDER_HOST', ALLOWED_HOSTS[0])
+
+# Журнал заявок (core.leads): отдельная SQLite в WAL, переносит сервис leads (flush_leads --watch)
+LEAD_JOURNAL_PATH = os.getenv('LEAD_JOURNAL_PATH', '/app/data/lead-journal.sqlite3')
+
+# Резервные копии (core.backup): хранилище объектов и манифестов, лучше на отдельном диске
+BACKUP_ROOT = os.getenv('BACKUP_ROOT', '/backups')
+
+# Учёт SQL-запросов (core.querytrace): доля запросов со сводкой в логе и порог N+1
+SQL_TRACE = os.getenv('SQL_TRACE', 'True').lower() == 'true'
+SQL_TRACE_SAMPLE = float(os.getenv('SQL_TRACE_SAMPLE', 0.01))
+SQL_TRACE_N_PLUS_ONE = int(os.getenv('SQL_TRACE_N_PLUS_ONE', 5))
+
 # Логирование для продакшена
 LOGGING = {
     'version': 1,
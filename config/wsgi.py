@@ -13,4 +13,14 @@ os.environ.setdefault(
 
 from django.core.wsgi import get_wsgi_application
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Прогрев индекса подсказок (core.suggest) при старте воркера,
+# чтобы первый запрос к /api/suggest/ не ждал его сборки
+from django.db import DatabaseError
+
+try:
+	from core.suggest import get_index
+	get_index()
+except DatabaseError:
+	pass
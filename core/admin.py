@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import SiteSettings, Tag, Lead
+
+from . import imagejobs
+from .models import ImageJob, SiteSettings, Tag, Lead
 
 @admin.register(SiteSettings)
 class SiteSettingsAdmin(admin.ModelAdmin):
@@ -10,13 +12,45 @@ class SiteSettingsAdmin(admin.ModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'tours_count', 'services_count')
     prepopulated_fields = {"slug": ("name",)}
     search_fields = ('name',)
 
 @admin.register(Lead)
 class LeadAdmin(admin.ModelAdmin):
-    list_display = ('created_at', 'name', 'phone', 'utm_source', 'status')
+    list_display = ('created_at', 'name', 'phone', 'utm_source', 'status', 'attempts')
     list_filter  = ('status', 'utm_source')
     search_fields = ('name', 'phone', 'email', 'utm_campaign')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'delivered', 'attempts', 'next_attempt_at', 'last_error')
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'created_at', 'finished_at', 'error_short')
+    list_filter = ('status',)
+    search_fields = ('name',)
+    readonly_fields = [f.name for f in ImageJob._meta.fields]
+    actions = ('retry_jobs',)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='Ошибка')
+    def error_short(self, obj):
+        return obj.error[:80]
+
+    @admin.action(description='Повторить упавшие задания')
+    def retry_jobs(self, request, queryset):
+        count = imagejobs.retry(queryset)
+        self.message_user(request, f'Возвращено в очередь: {count}')
+
+    def changelist_view(self, request, extra_context=None):
+        # Прогресс очереди в заголовке списка
+        counts = imagejobs.progress()
+        total = sum(counts.values())
+        title = (
+            f"Обработка изображений: готово {counts[ImageJob.DONE]} из {total}, "
+            f"в очереди {counts[ImageJob.PENDING]}, в работе {counts[ImageJob.RUNNING]}, "
+            f"ошибок {counts[ImageJob.FAILED]}"
+        )
+        return super().changelist_view(request, {'title': title, **(extra_context or {})})
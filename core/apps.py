@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
-    verbose_name = 'Базовые настройки'
\ No newline at end of file
+    verbose_name = 'Базовые настройки'
+
+    def ready(self):
+        from . import signals  # noqa: F401
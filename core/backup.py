@@ -0,0 +1,354 @@
+"""
+Инкрементальные резервные копии: базы SQLite и медиафайлы.
+
+Копия — это каталог-хранилище (``BACKUP_ROOT``)::
+
+    objects/3f/3fa9…c1.gz      сжатое содержимое, имя — хэш исходных байтов
+    manifests/20250914T104500123456.json
+
+Манифест перечисляет базы и медиафайлы со ссылками на объекты. Одинаковое
+содержимое хранится один раз — во всех копиях и под любыми именами.
+
+* Базы снимаются онлайн через backup API SQLite (``Connection.backup``) по
+  ``BACKUP_PAGES`` страниц с паузой между шагами: живая база не копируется
+  побайтно посреди записи, а в WAL чтение не мешает писателям. Снимок
+  проверяется ``PRAGMA quick_check`` до сохранения.
+* Медиафайл с тем же размером и mtime, что в прошлом манифесте, не читается —
+  объект берётся из манифеста. Изменённые файлы хэшируются и сжимаются за один
+  проход; уже сжатые форматы (JPEG, WebP…) пишутся без сжатия. Время копии
+  зависит от объёма изменений, а не от размера медиа.
+* Восстановление (``restore``) распаковывает объекты потоком во временный файл
+  рядом с целью, сверяет хэш и, для базы, ``PRAGMA integrity_check`` и только
+  потом подменяет файл (``os.replace``). Повреждённая копия текущие данные не трогает.
+  Базу подменяют только под ``BEGIN EXCLUSIVE``: если её держит открытой
+  другой процесс (веб, воркеры), восстановление отказывается — сервисы
+  нужно остановить (restore.sh делает это сам).
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .storage import CHUNK_SIZE, DIGEST_SIZE
+
+VERSION = 1
+BACKUP_PAGES = 1024
+# Сколько секунд ждать эксклюзивной блокировки базы перед восстановлением
+LOCK_TIMEOUT = 5
+BACKUP_SLEEP = 0.005
+COMPRESS_LEVEL = 6
+KEEP = 14
+# Уже сжатое содержимое второй раз не сжимается — только тратит CPU
+STORED = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".mp4", ".webm", ".zip", ".gz", ".pdf"}
+
+
+class BackupError(Exception):
+    pass
+
+
+def databases():
+    """{имя: путь} баз SQLite, которые попадают в копию."""
+    found = {}
+    conn = connections["default"]
+    if conn.vendor == "sqlite" and not conn.is_in_memory_db():
+        found["default"] = str(conn.settings_dict["NAME"])
+    journal = getattr(settings, "LEAD_JOURNAL_PATH", "")
+    if journal and os.path.exists(journal):
+        found["leads"] = journal
+    return found
+
+
+# =========================
+#  Объекты
+# =========================
+def object_path(root, digest):
+    return Path(root) / "objects" / digest[:2] / f"{digest}.gz"
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def store(root, path):
+    """
+    Сохраняет файл как объект. Хэш и сжатие — за одно чтение; если такой объект
+    уже есть, новый не пишется. Возвращает (хэш, размер, записано байт).
+    """
+    level = 0 if Path(path).suffix.lower() in STORED else COMPRESS_LEVEL
+    objects = Path(root) / "objects"
+    objects.mkdir(parents=True, exist_ok=True)
+    hasher, size = _hasher(), 0
+    fd, tmp = tempfile.mkstemp(dir=objects, prefix=".tmp-")
+    try:
+        with open(path, "rb") as src, os.fdopen(fd, "wb") as raw:
+            # mtime=0: одинаковое содержимое даёт одинаковые байты объекта
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level, mtime=0) as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    dst.write(chunk)
+        digest = hasher.hexdigest()
+        target = object_path(root, digest)
+        if target.exists():
+            return digest, size, 0
+        target.parent.mkdir(exist_ok=True)
+        written = os.path.getsize(tmp)
+        os.replace(tmp, target)
+        return digest, size, written
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def extract(root, digest, target, size=None):
+    """
+    Распаковывает объект потоком во временный файл рядом с ``target`` и сверяет
+    хэш. Возвращает путь временного файла; подменять цель — вызывающему.
+    """
+    source = object_path(root, digest)
+    if not source.exists():
+        raise BackupError(f"Нет объекта {digest} для {target}")
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.restore-")
+    hasher, written = _hasher(), 0
+    try:
+        with gzip.open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            while chunk := src.read(CHUNK_SIZE):
+                hasher.update(chunk)
+                written += len(chunk)
+                dst.write(chunk)
+    except (OSError, EOFError, gzip.BadGzipFile) as exc:
+        os.unlink(tmp)
+        raise BackupError(f"Объект {digest} повреждён: {exc}") from exc
+    if hasher.hexdigest() != digest or (size is not None and written != size):
+        os.unlink(tmp)
+        raise BackupError(f"Объект {digest} не совпадает с хэшем или размером ({target})")
+    return tmp
+
+
+# =========================
+#  Манифесты
+# =========================
+def manifests(root):
+    """Имена манифестов от старых к новым."""
+    directory = Path(root) / "manifests"
+    if not directory.exists():
+        return []
+    return sorted(path.name for path in directory.glob("*.json"))
+
+
+def load(root, name=None):
+    """Манифест по имени (или пути); без имени — последний. None — копий нет."""
+    if name is None:
+        names = manifests(root)
+        if not names:
+            return None
+        name = names[-1]
+    path = Path(name) if os.sep in str(name) else Path(root) / "manifests" / name
+    with open(path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != VERSION:
+        raise BackupError(f"Неизвестная версия манифеста: {manifest.get('version')}")
+    return manifest
+
+
+def _save_manifest(root, manifest):
+    directory = Path(root) / "manifests"
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%dT%H%M%S%f}.json"
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, directory / name)
+    return name
+
+
+# =========================
+#  Копия
+# =========================
+def snapshot(source, target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Онлайн-снимок SQLite по ``pages`` страниц за шаг; проверяется quick_check."""
+    src = sqlite3.connect(f"file:{quote(str(source))}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst, pages=pages, sleep=sleep)
+        # Снимок — отдельный файл без -wal: переводим в обычный журнал
+        dst.execute("PRAGMA journal_mode=DELETE")
+        result = dst.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    if result != "ok":
+        raise BackupError(f"Снимок {source} не прошёл проверку: {result}")
+
+
+def _media_files(media_root):
+    for directory, _, files in os.walk(media_root):
+        for filename in files:
+            if filename.startswith("."):
+                continue
+            path = Path(directory) / filename
+            yield path, path.relative_to(media_root).as_posix()
+
+
+def backup(root, media_root=None, dbs=None):
+    """
+    Создаёт копию. Возвращает {"manifest", "databases", "files", "changed",
+    "reused", "written"} — сколько медиафайлов в копии, сколько прочитано
+    заново, сколько взято из прошлого манифеста и сколько байт записано.
+    """
+    media_root = settings.MEDIA_ROOT if media_root is None else media_root
+    dbs = databases() if dbs is None else dbs
+    previous = (load(root) or {}).get("media", {})
+    stats = {"databases": 0, "files": 0, "changed": 0, "reused": 0, "written": 0}
+    manifest = {"version": VERSION, "created": timezone.now().isoformat(), "databases": {}, "media": {}}
+
+    os.makedirs(root, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=root, prefix=".tmp-") as tmp:
+        for alias, path in dbs.items():
+            copy = os.path.join(tmp, f"{alias}.sqlite3")
+            snapshot(path, copy)
+            digest, size, written = store(root, copy)
+            manifest["databases"][alias] = {"object": digest, "size": size}
+            stats["databases"] += 1
+            stats["written"] += written
+
+    if media_root and os.path.isdir(media_root):
+        for path, name in _media_files(media_root):
+            stat = path.stat()
+            entry = previous.get(name)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                stats["reused"] += 1
+            else:
+                digest, size, written = store(root, path)
+                entry = {"object": digest, "size": size, "mtime": stat.st_mtime_ns}
+                stats["changed"] += 1
+                stats["written"] += written
+            manifest["media"][name] = entry
+            stats["files"] += 1
+
+    stats["manifest"] = _save_manifest(root, manifest)
+    return stats
+
+
+def prune(root, keep=KEEP):
+    """Оставляет ``keep`` последних манифестов и объекты, на которые они ссылаются."""
+    names = manifests(root)
+    for name in names[:-keep] if keep else []:
+        (Path(root) / "manifests" / name).unlink()
+    used = set()
+    for name in manifests(root):
+        manifest = load(root, name)
+        used.update(entry["object"] for entry in manifest["databases"].values())
+        used.update(entry["object"] for entry in manifest["media"].values())
+    removed = 0
+    for path in (Path(root) / "objects").glob("*/*.gz"):
+        if path.name[:-3] not in used:
+            path.unlink()
+            removed += 1
+    return removed
+
+
+# =========================
+#  Восстановление
+# =========================
+def _file_digest(path):
+    hasher = _hasher()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _lock(target):
+    """
+    Соединение с базой ``target`` под ``BEGIN EXCLUSIVE``. В эксклюзивном режиме
+    блокировки SQLite не берёт её, пока базу держит открытой любое другое
+    соединение: процессы с открытой базой продолжили бы писать в старый файл.
+    """
+    conn = sqlite3.connect(target, timeout=LOCK_TIMEOUT, isolation_level=None)
+    try:
+        conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+        conn.execute("BEGIN EXCLUSIVE")
+    except sqlite3.Error as exc:
+        conn.close()
+        raise BackupError(f"База {target} открыта другим процессом ({exc}): остановите сервисы перед восстановлением")
+    return conn
+
+
+def _restore_database(root, entry, target):
+    tmp = extract(root, entry["object"], target, entry["size"])
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+        if result != "ok":
+            raise BackupError(f"База {target} из копии не прошла integrity_check: {result}")
+        # Собственные соединения Django тоже держат базу открытой
+        for conn in connections.all(initialized_only=True):
+            if conn.vendor == "sqlite" and os.path.abspath(str(conn.settings_dict["NAME"])) == os.path.abspath(target):
+                conn.close()
+        lock = _lock(target) if os.path.exists(target) else None
+        try:
+            # Старый WAL относится к прежней базе и испортил бы восстановленную
+            for suffix in ("-wal", "-shm"):
+                Path(f"{target}{suffix}").unlink(missing_ok=True)
+            os.replace(tmp, target)
+        finally:
+            if lock is not None:
+                lock.close()
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def restore(root, name=None, media_root=None, dbs=None, verify_only=False):
+    """
+    Восстанавливает копию ``name`` (по умолчанию последнюю). Медиафайлы, которые
+    уже совпадают с копией, не переписываются; лишние файлы не удаляются
+    (осиротевшие убирает ``sweep_media``). С ``verify_only`` только проверяет
+    все объекты. Возвращает {"manifest", "databases", "files", "skipped"}.
+    """
+    manifest = load(root, name)
+    if manifest is None:
+        raise BackupError(f"В {root} нет резервных копий")
+    media_root = settings.MEDIA_ROOT if media_root is None else media_root
+    dbs = databases() if dbs is None else dbs
+    stats = {"manifest": name or manifests(root)[-1], "databases": 0, "files": 0, "skipped": 0}
+
+    if verify_only:
+        with tempfile.TemporaryDirectory() as tmp:
+            entries = list(manifest["databases"].values()) + list(manifest["media"].values())
+            for entry in {entry["object"]: entry for entry in entries}.values():
+                os.unlink(extract(root, entry["object"], Path(tmp) / "check", entry["size"]))
+        stats["databases"], stats["files"] = len(manifest["databases"]), len(manifest["media"])
+        return stats
+
+    for alias, entry in manifest["databases"].items():
+        if alias not in dbs:
+            raise BackupError(f"Не задан путь для базы {alias!r}")
+        _restore_database(root, entry, dbs[alias])
+        stats["databases"] += 1
+
+    for relative, entry in manifest["media"].items():
+        target = Path(media_root) / relative
+        if target.exists() and target.stat().st_size == entry["size"] and _file_digest(target) == entry["object"]:
+            stats["skipped"] += 1
+            continue
+        tmp = extract(root, entry["object"], target, entry["size"])
+        os.replace(tmp, target)
+        # Тот же mtime, что в манифесте: следующая копия не перечитает файл
+        os.utime(target, ns=(entry["mtime"], entry["mtime"]))
+        stats["files"] += 1
+    return stats
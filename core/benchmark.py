@@ -0,0 +1,223 @@
+"""
+Нагрузочный замер страниц в процессе, без сети (``benchmark``).
+
+Запросы идут прямо в WSGI-приложение проекта (``get_wsgi_application``) —
+со всеми middleware, кэшем страниц, шаблонами и базой, но без gunicorn и
+Caddy: замер показывает стоимость самого Django и не зависит от сети. Каждый
+адрес нагружается отдельно: ``concurrency`` потоков делают ``requests``
+запросов, после ``warmup`` запросов прогрева. Потоки, как и воркеры gunicorn
+с ``--threads``, делят GIL, поэтому пропускная способность — оценка одного
+процесса.
+
+Результат — JSON (версия ``VERSION``): параметры прогона, размер каталога и по
+каждому адресу — запросов в секунду, среднее и перцентили p50/p95/p99 в мс.
+``compare()`` сравнивает прогон с сохранённым базовым: регрессия — p95 выше
+или пропускная способность ниже базовой больше чем на ``tolerance``. Замеры
+сравнимы только на одинаковом каталоге — ``generate_catalog`` с тем же
+``--scale`` и ``--seed``.
+"""
+import io
+import math
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import BlogPost
+from news.models import NewsPost
+from reviews.models import Review
+from services.models import Service
+from tours.models import Tour, TourCategory
+
+from .models import Lead, Tag
+
+VERSION = 1
+CONCURRENCY = 8
+REQUESTS = 200
+WARMUP = 5
+TOLERANCE = 0.2
+# Разница p95 меньше этой не считается регрессией: шум планировщика потоков
+MIN_DELTA_MS = 2.0
+PERCENTILES = (50, 95, 99)
+# Cookie сессии отключает полностраничный кэш (core.pagecache) — замер самих вьюх
+NO_PAGE_CACHE_COOKIE = f"{settings.SESSION_COOKIE_NAME}=benchmark"
+CATALOG_MODELS = (Tour, TourCategory, Tag, Service, Review, BlogPost, NewsPost, Lead)
+
+
+def endpoints():
+    """[(имя, адрес), ...] публичных страниц и API на объектах из текущей базы."""
+    tours = Tour.objects.filter(is_active=True)
+    tour = tours.order_by("pk")[tours.count() // 2:][:1].first()
+    root = TourCategory.objects.filter(parent__isnull=True, tours_count__gt=0).order_by("pk").first()
+    leaf = TourCategory.objects.filter(parent__isnull=False, tours_count__gt=0).order_by("pk").first()
+    tag = Tag.objects.filter(tours_count__gt=0).order_by("-tours_count", "pk").first()
+    service = Service.objects.filter(is_active=True).order_by("pk").first()
+    post = BlogPost.objects.filter(is_published=True).order_by("pk").first()
+    news = NewsPost.objects.filter(is_published=True).order_by("pk").first()
+
+    found = [
+        ("home", reverse("core:home")),
+        ("tours", reverse("tours:list")),
+        ("tours_page", reverse("tours:list") + "?page=5"),
+        ("tours_cursor", reverse("tours:list") + "?paginate=cursor"),
+        ("tours_search", reverse("tours:list") + "?" + urlencode({"q": "остров"})),
+        ("tours_more", reverse("tours:list_more")),
+        ("services", reverse("services:list")),
+        ("reviews", reverse("reviews:list")),
+        ("blog", reverse("blog:list")),
+        ("news", reverse("news:list")),
+        ("prices", reverse("prices:list")),
+        ("api_tours_all", reverse("core:get_all_tours")),
+        ("api_suggest", reverse("core:suggest") + "?" + urlencode({"q": "пх"})),
+    ]
+    if tour:
+        found.append(("tour_detail", tour.get_absolute_url()))
+    if root:
+        found += [
+            ("tours_root_category", reverse("tours:by_category", args=[root.slug])),
+            ("api_subcategories", reverse("core:get_subcategories", args=[root.pk])),
+            ("api_category_tours", reverse("core:get_tours_by_category", args=[root.pk])),
+        ]
+    if leaf:
+        found.append(("tours_leaf_category", reverse("tours:by_category", args=[leaf.slug])))
+    if tag:
+        found.append(("tours_tag", reverse("tours:by_tag", args=[tag.slug])))
+    if service:
+        found.append(("service_detail", reverse("services:detail", args=[service.slug])))
+    if post:
+        found.append(("blog_detail", post.get_absolute_url()))
+    if news:
+        found.append(("news_detail", news.get_absolute_url()))
+    return found
+
+
+def catalog():
+    """Размер каталога — чтобы не сравнивать прогоны на разных данных."""
+    return {model._meta.label: model.objects.count() for model in CATALOG_MODELS}
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; ``values`` отсортированы."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+class Client:
+    """GET в WSGI-приложение без сети; безопасен для вызова из нескольких потоков."""
+
+    def __init__(self, host="localhost", page_cache=True):
+        self.app = get_wsgi_application()
+        self.host = host
+        self.cookie = "" if page_cache else NO_PAGE_CACHE_COOKIE
+
+    def environ(self, url):
+        parts = urlsplit(url)
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": parts.path,
+            "QUERY_STRING": parts.query,
+            "HTTP_HOST": self.host,
+            "SERVER_NAME": self.host,
+            "HTTP_ACCEPT": "text/html,application/json",
+            "HTTP_ACCEPT_ENCODING": "gzip",
+            # Как за Caddy: запрос пришёл по HTTPS (SECURE_SSL_REDIRECT не срабатывает)
+            "HTTP_X_FORWARDED_PROTO": "https",
+            "wsgi.url_scheme": "https",
+            "wsgi.input": io.BytesIO(),
+        }
+        if self.cookie:
+            environ["HTTP_COOKIE"] = self.cookie
+        setup_testing_defaults(environ)
+        return environ
+
+    def get(self, url):
+        """(статус, байт ответа, секунд)."""
+        status = []
+        started = time.perf_counter()
+        result = self.app(self.environ(url), lambda code, headers, exc_info=None: status.append(code))
+        try:
+            size = sum(len(chunk) for chunk in result)
+        finally:
+            # close() шлёт request_finished: Django закрывает соединения с базой, как в gunicorn
+            result.close()
+        return int(status[0].split()[0]), size, time.perf_counter() - started
+
+
+def measure(client, url, requests=REQUESTS, concurrency=CONCURRENCY, warmup=WARMUP):
+    """Статистика одного адреса под нагрузкой."""
+    for _ in range(warmup):
+        client.get(url)
+    started = time.perf_counter()
+    if concurrency == 1:
+        samples = [client.get(url) for _ in range(requests)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda _: client.get(url), range(requests)))
+    wall = time.perf_counter() - started
+    latencies = sorted(seconds * 1000 for _, _, seconds in samples)
+    stats = {
+        "path": url,
+        "requests": requests,
+        "errors": sum(1 for status, _, _ in samples if status >= 400),
+        "bytes": samples[-1][1] if samples else 0,
+        "rps": round(requests / wall, 1) if wall else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+    }
+    stats.update({f"p{p}_ms": round(percentile(latencies, p), 2) for p in PERCENTILES})
+    return stats
+
+
+def run(urls=None, requests=REQUESTS, concurrency=CONCURRENCY, warmup=WARMUP,
+        page_cache=True, host="localhost", progress=None):
+    """
+    Прогон по адресам ``urls`` ([(имя, адрес), ...], по умолчанию ``endpoints()``).
+    ``progress(имя, статистика)`` вызывается после каждого адреса.
+    """
+    client = Client(host, page_cache)
+    results = {}
+    for name, url in urls if urls is not None else endpoints():
+        results[name] = measure(client, url, requests, concurrency, warmup)
+        if progress:
+            progress(name, results[name])
+    return {
+        "version": VERSION,
+        "created_at": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "options": {"requests": requests, "concurrency": concurrency, "warmup": warmup, "page_cache": page_cache},
+        "catalog": catalog(),
+        "endpoints": results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """
+    Регрессии прогона ``current`` относительно ``baseline``:
+    [{"endpoint", "metric", "baseline", "current", "change"}, ...].
+    """
+    regressions = []
+    for name, stats in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if base is None:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance) and stats["p95_ms"] - base["p95_ms"] >= MIN_DELTA_MS:
+            regressions.append(_regression(name, "p95_ms", base, stats))
+        if stats["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(_regression(name, "rps", base, stats))
+        if stats["errors"] > base["errors"]:
+            regressions.append(_regression(name, "errors", base, stats))
+    return regressions
+
+
+def _regression(name, metric, base, stats):
+    change = (stats[metric] - base[metric]) / base[metric] if base[metric] else None
+    return {
+        "endpoint": name, "metric": metric, "baseline": base[metric], "current": stats[metric],
+        "change": round(change, 3) if change is not None else None,
+    }
@@ -0,0 +1,113 @@
+"""
+Версионированный кэш каталога.
+
+У каждого пространства имён (tours, services, reviews, blog, news ...) в общем
+кэше хранится счётчик поколения. Ключи данных включают текущее поколение,
+поэтому инвалидация — это один инкремент счётчика, который сразу видят все
+воркеры gunicorn, а устаревшие записи просто истекают по таймауту.
+
+``cache.incr`` файлового и locmem-бэкендов — это ``get`` + ``set`` с таймаутом
+по умолчанию: счётчик терял бы ``timeout=None`` и истекал, а параллельные
+инкременты теряли бы друг друга. Поэтому счётчики меняются через
+``increment()`` под блокировкой — между потоками процесса и, для файлового
+кэша, между процессами (``flock`` на файле в каталоге кэша). Если настроен кэш
+``GENERATIONS``, поколения хранятся в нём: вытеснение по ``MAX_ENTRIES``
+общего кэша их не затрагивает.
+"""
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+GENERATION_KEY = "gen:{}"
+# Отдельный кэш для счётчиков поколений (если есть в CACHES)
+GENERATIONS = "generations"
+# Общее поколение каталога: туры, услуги, категории, теги и связи между ними
+CATALOG = "catalog"
+# Срок жизни данных под версионированными ключами: старые поколения просто истекают
+DEFAULT_TIMEOUT = 60 * 60 * 24
+# Файл блокировки в каталоге файлового кэша (не *.djcache — очистка его не трогает)
+LOCK_FILE = "counters.lock"
+
+_thread_lock = threading.Lock()
+
+
+def _initial_generation() -> int:
+    # Стартуем с миллисекунд: если счётчик вытеснен из кэша, новое значение
+    # будет больше прежнего и не совпадёт со старыми ключами.
+    return int(time.time() * 1000)
+
+
+def generation_cache():
+    """Кэш, в котором лежат счётчики поколений."""
+    return caches[GENERATIONS] if GENERATIONS in settings.CACHES else cache
+
+
+@contextmanager
+def _locked(store):
+    with _thread_lock:
+        directory = getattr(store, "_dir", None)
+        if directory is None:
+            yield
+            return
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, LOCK_FILE), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+
+
+def increment(key, delta=1, store=None, initial=0):
+    """
+    Атомарный инкремент счётчика ``key`` без срока жизни; отсутствующий
+    счётчик начинается с ``initial``. Возвращает новое значение.
+    """
+    store = cache if store is None else store
+    with _locked(store):
+        value = store.get(key)
+        value = (initial if value is None else value) + delta
+        store.set(key, value, timeout=None)
+    return value
+
+
+def get_generation(namespace: str) -> int:
+    """Текущее поколение пространства имён (создаёт счётчик при первом обращении)."""
+    store = generation_cache()
+    key = GENERATION_KEY.format(namespace)
+    value = store.get(key)
+    if value is None:
+        with _locked(store):
+            value = store.get(key)
+            if value is None:
+                value = _initial_generation()
+                store.set(key, value, timeout=None)
+    return value
+
+
+def bump_generation(*namespaces: str) -> None:
+    """Делает недействительными все данные, закэшированные для указанных пространств."""
+    store = generation_cache()
+    for namespace in namespaces:
+        increment(GENERATION_KEY.format(namespace), store=store, initial=_initial_generation())
+
+
+def versioned_key(namespace: str, *parts) -> str:
+    """Ключ кэша, привязанный к текущему поколению пространства имён."""
+    suffix = ":".join(str(p) for p in parts)
+    return f"{namespace}:{get_generation(namespace)}:{suffix}"
+
+
+def cached(namespace: str, key: str, builder, timeout=DEFAULT_TIMEOUT):
+    """
+    Значение из кэша по версионированному ключу; при промахе вызывает ``builder()``
+    и сохраняет результат. Инвалидируется через ``bump_generation(namespace)``.
+    """
+    full_key = versioned_key(namespace, key)
+    value = cache.get(full_key)
+    if value is None:
+        value = builder()
+        cache.set(full_key, value, timeout)
+    return value
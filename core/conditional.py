@@ -0,0 +1,78 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304) для страниц каталога и контента.
+
+Валидатор считается без рендера шаблона и без запросов к БД — из поколений
+core.cache, от которых зависит страница (каталог, отзывы, блог, новости,
+настройки сайта), адреса запроса и версии релиза. Меню категорий в шапке есть
+на каждой странице, поэтому поколение каталога входит во все ETag. Если у клиента актуальная
+копия, Django отвечает 304 и вьюха не выполняется вовсе. Детальные страницы
+дополнительно отдают Last-Modified из ``updated_at``/``pub_date`` (один
+запрос по уникальному индексу slug).
+
+В ETag входят cookie сессии и сообщений: страница зависит от входа в систему
+и flash-сообщений. CSRF-токена в разметке нет (формы получают его через
+static/js/csrf.js), поэтому анонимные страницы общие и для core.pagecache.
+"""
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.views.decorators.http import condition
+
+from .cache import CATALOG, get_generation
+from .context_processors import SITE
+
+# Cookie, от которых зависит содержимое страницы для конкретного клиента
+CLIENT_COOKIES = (settings.SESSION_COOKIE_NAME, "messages")
+
+
+@lru_cache(maxsize=None)
+def release():
+    """
+    Версия разметки: ``APP_RELEASE`` из настроек или время последнего изменения
+    шаблонов проекта (новые шаблоны после деплоя дают новые ETag).
+    """
+    configured = getattr(settings, "APP_RELEASE", "")
+    if configured:
+        return configured
+    latest = 0.0
+    for engine in settings.TEMPLATES:
+        for directory in engine.get("DIRS", ()):
+            for path in Path(directory).rglob("*.html"):
+                latest = max(latest, path.stat().st_mtime)
+    return str(int(latest))
+
+
+def make_etag(request, namespaces, *extra):
+    parts = [release(), request.get_full_path()]
+    parts += [str(get_generation(ns)) for ns in dict.fromkeys((SITE, CATALOG, *namespaces))]
+    parts += [request.COOKIES.get(name, "") for name in CLIENT_COOKIES]
+    parts += [str(value) for value in extra]
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def conditional(*namespaces, last_modified=None):
+    """
+    Декоратор вьюхи: ETag из поколений ``namespaces`` (плюс настройки сайта и
+    каталог для шапки), ``last_modified(request, *args, **kwargs)`` —
+    необязательная дата изменения.
+    """
+    def etag(request, *args, **kwargs):
+        return make_etag(request, namespaces)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def catalog_page(last_modified=None):
+    """Страницы каталога: зависят от туров, услуг, категорий и тегов."""
+    return conditional(CATALOG, last_modified=last_modified)
+
+
+def field_last_modified(queryset, field, lookup="slug"):
+    """Last-Modified из поля ``field`` объекта, найденного по ``lookup`` из URL."""
+    def last_modified(request, *args, **kwargs):
+        rows = queryset.filter(**{lookup: kwargs[lookup]}).order_by().values_list(field, flat=True)[:1]
+        return next(iter(rows), None)
+
+    return last_modified
@@ -1,36 +1,59 @@
-from .models import SiteSettings
-from tours.models import TourCategory
+"""
+Глобальные контекст-процессоры.
+
+Они выполняются при каждом рендере шаблона (включая админку и частичные
+шаблоны), поэтому данные для шапки и подвала берутся из общего кэша под
+поколениями core.cache и вычисляются лениво: страница, которая не обращается
+к ``nav_tour_categories``, не платит за них ничего.
+"""
+from django.utils.functional import SimpleLazyObject
+
 from services.models import ServiceCategory
-from django.db.models import Count, Q
+from tours.models import TourCategory
+
+from .cache import CATALOG, cached
+from .models import SiteSettings
+
+# Пространство имён настроек сайта в core.cache (сбрасывается в core.signals)
+SITE = "site"
+
+
+def get_site_settings():
+    """Настройки сайта (или None, если их ещё не создали) из кэша."""
+    def build():
+        try:
+            settings = SiteSettings.objects.first()
+        except Exception:
+            settings = None
+        # Кортеж, чтобы отсутствие настроек тоже кэшировалось
+        return (settings,)
+    return cached(SITE, "settings", build)[0]
+
 
 def site_settings(request):
-    try:
-        settings = SiteSettings.objects.first()
-    except Exception:
-        settings = None
-    return {'site_settings': settings}
+    return {'site_settings': SimpleLazyObject(get_site_settings)}
+
+
+def _nav_tour_categories():
+    # Родительские категории туров, где есть активные туры (счётчик — core.counters)
+    return list(TourCategory.objects.roots().filter(tours_count__gt=0).order_by('name'))
+
+
+def _nav_service_categories():
+    # Родительские категории услуг, где есть активные услуги
+    return list(ServiceCategory.objects.roots().filter(services_count__gt=0).order_by('name'))
+
 
 def navigation_categories(request):
     """Добавляет категории туров и услуг для навигации"""
-    # Родительские категории туров с количеством туров
-    tour_categories = TourCategory.objects.filter(
-        parent__isnull=True
-    ).annotate(
-        tours_count=Count('tours', filter=Q(tours__is_active=True))
-    ).filter(tours_count__gt=0).order_by('name')
-    
-    # Родительские категории услуг с количеством услуг
-    service_categories = ServiceCategory.objects.filter(
-        parent__isnull=True
-    ).annotate(
-        services_count=Count('services', filter=Q(services__is_active=True))
-    ).filter(services_count__gt=0).order_by('name')
-    
     return {
-        'nav_tour_categories': tour_categories,
-        'nav_service_categories': service_categories,
+        'nav_tour_categories': SimpleLazyObject(
+            lambda: cached(CATALOG, 'nav:tours', _nav_tour_categories)),
+        'nav_service_categories': SimpleLazyObject(
+            lambda: cached(CATALOG, 'nav:services', _nav_service_categories)),
     }
 
+
 def active_page(request):
     """Определяет активную страницу для меню"""
     path = request.path
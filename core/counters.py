@@ -0,0 +1,108 @@
+"""
+Денормализованные счётчики активных туров и услуг.
+
+  * ``TourCategory.tours_count`` / ``ServiceCategory.services_count`` — активные
+    элементы во всём поддереве категории (как в списках «включая подкатегории»);
+  * ``Tag.tours_count`` / ``Tag.services_count`` — активные элементы с тегом.
+
+Вместо агрегатов по M2M на каждой странице шаблоны и фильтры читают колонки
+(``tours_count__gt=0``). Сигналы core.signals при изменении активности,
+удалении элемента и правке его связей пересчитывают только затронутые строки —
+одним UPDATE с коррелированным подзапросом внутри той же транзакции. Пересчёт,
+а не ``F() ± 1``, потому что в поддереве элемент считается один раз, даже если
+он привязан к нескольким подкатегориям. ``recount_catalog`` чинит расхождения.
+"""
+from django.db.models import OuterRef
+
+from services.models import Service, ServiceCategory
+from tours.models import Tour, TourCategory
+
+from .models import Tag
+from .tree import count_subquery, outer_subtree_q, path_ids
+
+# (модель элемента, поле M2M, модель со счётчиком, поле счётчика)
+COUNTERS = (
+    (Tour, "categories", TourCategory, "tours_count"),
+    (Tour, "tags", Tag, "tours_count"),
+    (Service, "categories", ServiceCategory, "services_count"),
+    (Service, "tags", Tag, "services_count"),
+)
+
+
+def _is_tree(model):
+    # По наличию поля, а не по базовому классу: так работает и с моделями миграций
+    return any(f.name == "path" for f in model._meta.concrete_fields)
+
+
+def counters_for(item_model):
+    """Счётчики, зависящие от элементов модели: [(поле M2M, модель со счётчиком)]."""
+    return [(m2m, target) for item, m2m, target, _ in COUNTERS if item is item_model]
+
+
+def counters_on(target):
+    """Счётчики, хранящиеся в модели ``target``: [(модель элемента, поле M2M)]."""
+    return [(item, m2m) for item, m2m, model, _ in COUNTERS if model is target]
+
+
+def _count_expr(item_model, m2m_field, target):
+    items = item_model.objects.filter(is_active=True)
+    if _is_tree(target):
+        items = items.filter(outer_subtree_q(f"{m2m_field}__"))
+    else:
+        items = items.filter(**{m2m_field: OuterRef("pk")})
+    return count_subquery(items)
+
+
+def update_counter(item_model, m2m_field, target, field, pks=None):
+    """Один UPDATE: ``target.field`` = число активных ``item_model`` для строк ``pks`` (или всех)."""
+    qs = target.objects.all()
+    if pks is not None:
+        pks = set(pks)
+        if not pks:
+            return 0
+        qs = qs.filter(pk__in=pks)
+    return qs.update(**{field: _count_expr(item_model, m2m_field, target)})
+
+
+def recount(item_model, m2m_field, pks=None):
+    """Пересчитывает счётчик, зависящий от ``item_model.m2m_field``. Возвращает число строк."""
+    for item, m2m, target, field in COUNTERS:
+        if item is item_model and m2m == m2m_field:
+            return update_counter(item, m2m, target, field, pks)
+    raise LookupError(f"Нет счётчика для {item_model.__name__}.{m2m_field}")
+
+
+def recount_all():
+    """Пересчёт всех счётчиков каталога: {«Модель.поле»: строк}."""
+    return {
+        f"{target.__name__}.{field}": recount(item, m2m)
+        for item, m2m, target, field in COUNTERS
+    }
+
+
+def affected_ids(target, pks):
+    """Строки счётчика, которые затрагивает элемент, привязанный к ``pks``: для деревьев — с предками."""
+    pks = set(pks)
+    if not pks or not _is_tree(target):
+        return pks
+    ids = set()
+    for path in target.objects.filter(pk__in=pks).values_list("path", flat=True):
+        ids.update(path_ids(path))
+    return ids
+
+
+def covered_ids(instance, m2m_field, target):
+    """Строки счётчика, в которые сейчас входит элемент ``instance``."""
+    if _is_tree(target):
+        ids = set()
+        for path in getattr(instance, m2m_field).values_list("path", flat=True):
+            ids.update(path_ids(path))
+        return ids
+    return set(getattr(instance, m2m_field).values_list("pk", flat=True))
+
+
+def own_ids(node):
+    """Строки счётчика, которые затрагивает изменение связей самого узла (reverse M2M)."""
+    if _is_tree(type(node)) and node.path:
+        return set(path_ids(node.path))
+    return {node.pk}
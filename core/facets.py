@@ -0,0 +1,148 @@
+"""
+Фасетная навигация по турам и услугам.
+
+Параметры запроса (можно повторять): ``category``, ``tag`` (слаги),
+``price`` (ключ диапазона из PRICE_BUCKETS), ``duration``, ``location``.
+Внутри одного фасета значения объединяются через ИЛИ, между фасетами — через И.
+
+Счётчики каждого фасета считаются одним агрегирующим запросом по выборке,
+отфильтрованной всеми остальными фасетами (так в счётчике видно, сколько
+результатов станет после добавления значения). Итого на страницу —
+не больше одного запроса на фасет, сколько бы значений в нём ни было.
+"""
+from django.db.models import Count, Q
+
+# (ключ, подпись, от, до) — цены в батах, верхняя граница не включается
+PRICE_BUCKETS = (
+    ("0-1000", "до 1 000 ฿", None, 1000),
+    ("1000-2500", "1 000 – 2 500 ฿", 1000, 2500),
+    ("2500-5000", "2 500 – 5 000 ฿", 2500, 5000),
+    ("5000-", "от 5 000 ฿", 5000, None),
+)
+
+TOUR_FACETS = ("category", "tag", "price", "duration", "location")
+SERVICE_FACETS = ("category", "tag", "price", "location")
+
+FACET_TITLES = {
+    "category": "Категории",
+    "tag": "Теги",
+    "price": "Цена",
+    "duration": "Длительность",
+    "location": "Локация",
+}
+
+
+def _price_q(key):
+    for bucket_key, _, low, high in PRICE_BUCKETS:
+        if bucket_key == key:
+            q = Q()
+            if low is not None:
+                q &= Q(price_adult__gte=low)
+            if high is not None:
+                q &= Q(price_adult__lt=high)
+            return q
+    return None
+
+
+class FacetedSearch:
+    """
+    ``FacetedSearch(request.GET, qs, TOUR_FACETS)``:
+    ``queryset`` — выборка с применёнными фасетами, ``facets()`` — счётчики для шаблона.
+    """
+
+    def __init__(self, params, queryset, facets):
+        self.params = params
+        self.base = queryset
+        self.names = facets
+        self.selected = {
+            name: [v for v in params.getlist(name) if v]
+            for name in facets
+        }
+
+    # ---------- фильтрация ----------
+    def _apply(self, qs, name, values):
+        model = qs.model
+        if name in ("category", "tag"):
+            field = "categories" if name == "category" else "tags"
+            # Подзапрос вместо JOIN: без дублей строк при нескольких совпадениях
+            return qs.filter(pk__in=model.objects.filter(**{f"{field}__slug__in": values}).values("pk"))
+        if name == "price":
+            q = Q()
+            for key in values:
+                bucket = _price_q(key)
+                if bucket is not None:
+                    q |= bucket
+            return qs.filter(q) if q else qs
+        return qs.filter(**{f"{name}__in": values})
+
+    def filtered(self, exclude=None):
+        qs = self.base
+        for name, values in self.selected.items():
+            if values and name != exclude:
+                qs = self._apply(qs, name, values)
+        return qs
+
+    @property
+    def queryset(self):
+        return self.filtered()
+
+    @property
+    def is_active(self):
+        return any(self.selected.values())
+
+    # ---------- счётчики ----------
+    def _counts(self, name):
+        # Без сортировки и prefetch: только GROUP BY по выборке
+        qs = self.filtered(exclude=name).order_by().prefetch_related(None)
+        if name == "price":
+            totals = qs.aggregate(**{
+                key: Count("pk", filter=_price_q(key)) for key, _, _, _ in PRICE_BUCKETS
+            })
+            return [(key, label, totals[key]) for key, label, _, _ in PRICE_BUCKETS]
+        if name in ("category", "tag"):
+            field = "categories" if name == "category" else "tags"
+            rows = (
+                qs.filter(**{f"{field}__isnull": False})
+                .values(f"{field}__slug", f"{field}__name")
+                .annotate(n=Count("pk", distinct=True))
+                .order_by(f"{field}__name")
+            )
+            return [(r[f"{field}__slug"], r[f"{field}__name"], r["n"]) for r in rows]
+        rows = (
+            qs.exclude(**{name: ""})
+            .values(name)
+            .annotate(n=Count("pk"))
+            .order_by(name)
+        )
+        return [(r[name], r[name], r["n"]) for r in rows]
+
+    def _toggle_url(self, name, value):
+        params = self.params.copy()
+        params.pop("page", None)
+        values = params.getlist(name)
+        if value in values:
+            values.remove(value)
+        else:
+            values.append(value)
+        params.setlist(name, values)
+        return "?" + params.urlencode()
+
+    def facets(self):
+        """Список фасетов: [{name, title, values: [{value, label, count, selected, url}]}]."""
+        result = []
+        for name in self.names:
+            selected = self.selected[name]
+            values = [
+                {
+                    "value": value,
+                    "label": label,
+                    "count": count,
+                    "selected": value in selected,
+                    "url": self._toggle_url(name, value),
+                }
+                for value, label, count in self._counts(name)
+                if count or value in selected
+            ]
+            if values:
+                result.append({"name": name, "title": FACET_TITLES[name], "values": values})
+        return result
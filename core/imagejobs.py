@@ -0,0 +1,212 @@
+"""
+Очередь обработки изображений: копии для ``srcset`` создаются вне запроса.
+
+Сохранение объекта в админке только ставит файл в таблицу ``core.ImageJob``
+(сигналы core.signals) и сразу возвращает ответ. Воркер ``process_images``
+забирает задания пачками и раздаёт декодирование/масштабирование/кодирование
+(``images.render``) процессам ``ProcessPoolExecutor`` — по одному на ядро, так
+что массовая загрузка галереи занимает все CPU, а не один воркер gunicorn.
+
+* Идемпотентность: задание одно на файл (``name`` уникален), повторная
+  постановка ждущего или выполняемого файла только дописывает ключи страниц.
+  Имена файлов неизменяемы (storage добавляет суффикс к занятому имени), поэтому
+  готовое задание повторно не выполняется без ``force``.
+* Захват — условный UPDATE ``pending -> running``: два воркера не возьмут одно задание.
+* Повторы: ошибка возвращает задание в очередь с паузой ``RETRY_DELAY * 2**n``,
+  после ``MAX_ATTEMPTS`` попыток — статус ``failed`` и текст ошибки в админке.
+  Задания, зависшие в ``running`` (воркер убит), возвращаются в очередь через ``STALE_AFTER``.
+* Файл заменили или удалили, пока шло задание: задание удалено (``cancel``),
+  результат не записывается, а созданные файлы копий стираются.
+
+Готовое задание сбрасывает страницы со своими ключами (core.pagecache) и
+отправляет сигнал ``processed`` — по нему сбрасываются кэши карточек.
+"""
+from concurrent.futures import BrokenExecutor
+from datetime import timedelta
+
+from django.db.models import Count, F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import images, media, pagecache
+from .models import ImageJob
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(seconds=30)
+STALE_AFTER = timedelta(minutes=15)
+BATCH = 32
+
+# Поле-владелец для изображений галерей: страница тура показывает его галерею
+OWNERS = {"tourimage": "tour", "serviceimage": "service"}
+# Модели, чьи объекты страницы не помечают по отдельности — только коллекцией
+COLLECTIONS = {"review": "reviews"}
+
+# Отправляется после записи копий: name — файл, keys — ключи страниц
+processed = Signal()
+
+
+def page_keys(instance):
+    """Суррогатные ключи страниц, на которых видно изображение объекта ``instance``."""
+    model_name = instance._meta.model_name
+    if model_name in OWNERS:
+        field = instance._meta.get_field(OWNERS[model_name])
+        owner_key = f"{field.related_model._meta.model_name}:{getattr(instance, field.attname)}"
+    else:
+        owner_key = pagecache.key_for(instance)
+    keys = {owner_key}
+    if model_name in COLLECTIONS:
+        keys.add(COLLECTIONS[model_name])
+    return keys
+
+
+def _split(keys):
+    return set(keys.split())
+
+
+# =========================
+#  Постановка и отмена
+# =========================
+def enqueue(name, keys=(), force=False):
+    """
+    Ставит файл в очередь. Ждущее или выполняемое задание не дублируется (ключи
+    объединяются); готовое и упавшее запускаются заново, готовое — только с ``force``.
+    """
+    if not name:
+        return None
+    now = timezone.now()
+    job, created = ImageJob.objects.get_or_create(
+        name=name, defaults={"keys": " ".join(sorted(keys)), "available_at": now},
+    )
+    if created:
+        return job
+    merged = " ".join(sorted(_split(job.keys) | set(keys)))
+    if job.status in (ImageJob.PENDING, ImageJob.RUNNING) or (job.status == ImageJob.DONE and not force):
+        if merged != job.keys:
+            ImageJob.objects.filter(pk=job.pk).update(keys=merged)
+        return job
+    ImageJob.objects.filter(pk=job.pk).update(
+        status=ImageJob.PENDING, keys=merged, attempts=0, error="",
+        available_at=now, started_at=None, finished_at=None,
+    )
+    return job
+
+
+def retry(queryset):
+    """Возвращает упавшие задания в очередь (действие админки)."""
+    return queryset.filter(status=ImageJob.FAILED).update(
+        status=ImageJob.PENDING, attempts=0, error="", available_at=timezone.now(),
+    )
+
+
+def cancel(name):
+    ImageJob.objects.filter(name=name).delete()
+
+
+def replace(name, old_name="", keys=()):
+    """Файл поля сменился: копии старого удаляются (если он больше нигде не используется), новый — в очередь."""
+    if old_name and old_name != name:
+        drop(old_name)
+    return enqueue(name, keys)
+
+
+def drop(name):
+    """Поле больше не ссылается на файл: без других ссылок (core.media) задание отменяется, копии удаляются."""
+    if media.is_referenced(name):
+        return
+    cancel(name)
+    images.discard(name)
+
+
+# =========================
+#  Выполнение
+# =========================
+def recover(now=None):
+    """Возвращает в очередь задания, зависшие в ``running`` дольше ``STALE_AFTER``."""
+    now = now or timezone.now()
+    return ImageJob.objects.filter(status=ImageJob.RUNNING, started_at__lt=now - STALE_AFTER).update(
+        status=ImageJob.PENDING, available_at=now,
+    )
+
+
+def claim(limit=BATCH):
+    """Захватывает до ``limit`` готовых к запуску заданий этого воркера."""
+    now = timezone.now()
+    candidates = (
+        ImageJob.objects.filter(status=ImageJob.PENDING, available_at__lte=now)
+        .order_by("available_at", "pk").values_list("pk", flat=True)[:limit]
+    )
+    claimed = []
+    for pk in list(candidates):
+        taken = ImageJob.objects.filter(pk=pk, status=ImageJob.PENDING).update(
+            status=ImageJob.RUNNING, started_at=now, attempts=F("attempts") + 1,
+        )
+        if taken:
+            claimed.append(ImageJob.objects.get(pk=pk))
+    return claimed
+
+
+def complete(job, meta):
+    """Записывает результат ``images.render``; False — задание отменили, пока оно выполнялось."""
+    finished = ImageJob.objects.filter(pk=job.pk, status=ImageJob.RUNNING).update(
+        status=ImageJob.DONE, error="", finished_at=timezone.now(),
+    )
+    if not finished:
+        images.remove_files(job.name, meta["widths"])
+        return False
+    images.record(job.name, meta)
+    keys = _split(ImageJob.objects.filter(pk=job.pk).values_list("keys", flat=True).first() or "")
+    if keys:
+        pagecache.purge(*keys)
+    processed.send(sender=ImageJob, name=job.name, keys=keys)
+    return True
+
+
+def fail(job, error):
+    """Ошибка выполнения: повтор с паузой или окончательный ``failed``."""
+    attempts = ImageJob.objects.filter(pk=job.pk).values_list("attempts", flat=True).first()
+    if attempts is None:
+        return
+    now = timezone.now()
+    if attempts >= MAX_ATTEMPTS:
+        changes = {"status": ImageJob.FAILED, "finished_at": now}
+    else:
+        changes = {"status": ImageJob.PENDING, "available_at": now + RETRY_DELAY * 2 ** (attempts - 1)}
+    ImageJob.objects.filter(pk=job.pk, status=ImageJob.RUNNING).update(
+        error=f"{type(error).__name__}: {error}", **changes,
+    )
+
+
+def work(executor, limit=BATCH):
+    """
+    Один проход: захватывает задания и выполняет ``images.render`` в ``executor``.
+    Базу трогает только текущий процесс. Возвращает {"done", "failed"}; если пул
+    процессов сломан (процесс убит), задания учитываются как попытки и
+    поднимается ``BrokenExecutor`` — пул нужно пересоздать.
+    """
+    recover()
+    jobs = claim(limit)
+    futures = [(job, executor.submit(images.render, job.name)) for job in jobs]
+    result = {"done": 0, "failed": 0}
+    broken = None
+    for job, future in futures:
+        try:
+            meta = future.result()
+        except Exception as exc:
+            if isinstance(exc, BrokenExecutor):
+                broken = exc
+            fail(job, exc)
+            result["failed"] += 1
+        else:
+            complete(job, meta)
+            result["done"] += 1
+    if broken is not None:
+        raise broken
+    return result
+
+
+def progress():
+    """{статус: число заданий} для админки и команды."""
+    counts = dict.fromkeys((status for status, _ in ImageJob.STATUS_CHOICES), 0)
+    rows = ImageJob.objects.order_by().values_list("status").annotate(n=Count("pk"))
+    counts.update(rows)
+    return counts
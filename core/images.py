@@ -0,0 +1,270 @@
+"""
+Производные изображения: уменьшенные копии обложек и галерей для ``srcset``.
+
+Для каждого загруженного файла генерируется набор копий по ширинам ``WIDTHS``
+(не шире оригинала) в форматах ``FORMATS`` и кладётся рядом с оригиналом:
+``tours/covers/sea.jpg`` -> ``tours/covers/sea.640w.webp``,
+``tours/covers/sea.640w.jpg`` ... Набор ширин и форматов записывается в
+``core.ImageAsset`` вместе с метаданными оригинала — размерами, весом файла,
+преобладающим цветом и крошечной заглушкой в base64. Шаблоны строят ``srcset``,
+``width``/``height`` и фон-заглушку по этой записи, не открывая файлы и не
+проверяя их существование.
+
+Поля с изображениями перечислены в ``IMAGE_FIELDS``. Сигналы core.signals
+ставят новый файл в очередь core.imagejobs (копии создаёт воркер
+``process_images``) и удаляют копии заменённого файла.
+``generate_image_derivatives`` ставит в очередь существующие файлы.
+Теги шаблонов — core.templatetags.images (``{% picture %}``, ``|image_url``).
+"""
+import base64
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from blog.models import BlogPost
+from news.models import NewsPost
+from reviews.models import Review
+from services.models import Service, ServiceImage
+from tours.models import Tour, TourImage
+
+from .cache import DEFAULT_TIMEOUT, versioned_key
+from .models import ImageAsset
+
+# Пространство имён core.cache для записей ImageAsset
+IMAGES = "images"
+
+# Ширины под сетку карточек (1–3 колонки) и экраны с плотностью 2x
+WIDTHS = (320, 640, 960, 1280, 1920)
+# Формат -> (формат Pillow, расширение, MIME, параметры сохранения); порядок — от
+# предпочтительного: браузер берёт первый поддерживаемый <source>
+FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 78, "method": 4}),
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Запасной формат для <img src> и фоновых картинок
+FALLBACK = "jpeg"
+# Заглушка: сторона не больше 16px, WebP в data: URI (~100–300 байт в HTML)
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_OPTIONS = {"quality": 40}
+# Преобладающий цвет ищется по палитре из нескольких цветов уменьшенной копии
+PALETTE_SIZE = 5
+
+# Срок кэша для файла, который воркер ещё не обработал: копии появятся, даже
+# если сброс из воркера (``forget``) не дошёл до кэша веб-процесса
+PENDING_TIMEOUT = 60
+# Поля ImageAsset, которые читают шаблоны
+ASSET_FIELDS = ("widths", "formats", "width", "height", "size", "color", "placeholder")
+
+IMAGE_FIELDS = (
+    (Tour, "cover"),
+    (TourImage, "image"),
+    (Service, "cover"),
+    (ServiceImage, "image"),
+    (BlogPost, "cover"),
+    (NewsPost, "cover"),
+    (Review, "image"),
+)
+
+
+def image_fields_for(model):
+    return [field for item, field in IMAGE_FIELDS if item is model]
+
+
+def derivative_name(name, width, fmt):
+    """Имя копии рядом с оригиналом: ``dir/photo.jpg`` -> ``dir/photo.640w.webp``."""
+    root, _ = posixpath.splitext(name)
+    return f"{root}.{width}w.{FORMATS[fmt][1]}"
+
+
+def widths_for(original_width):
+    """Ширины копий: шаги ``WIDTHS``, ограниченные шириной оригинала."""
+    return sorted({min(width, original_width) for width in WIDTHS})
+
+
+# =========================
+#  Генерация
+# =========================
+def _open(name, storage):
+    with storage.open(name, "rb") as fh:
+        image = Image.open(fh)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    return image
+
+
+def _flatten(image):
+    # Прозрачность JPEG не поддерживает — кладём на белый фон
+    if image.mode == "RGB":
+        return image
+    rgba = image.convert("RGBA")
+    flat = Image.new("RGB", rgba.size, (255, 255, 255))
+    flat.paste(rgba, mask=rgba.getchannel("A"))
+    return flat
+
+
+def _encode(image, fmt):
+    pil_format, _, _, options = FORMATS[fmt]
+    if pil_format == "JPEG":
+        image = _flatten(image)
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _save(storage, name, data):
+    # Имя копии должно быть ровно таким — без суффикса коллизии от storage.save
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(data))
+
+
+def dominant_color(image):
+    """Самый частый цвет палитры уменьшенной копии: ``#rrggbb``."""
+    small = _flatten(image)
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=PALETTE_SIZE)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def placeholder(image):
+    """Крошечная копия для фона до загрузки изображения: ``data:image/webp;base64,...``."""
+    tiny = _flatten(image)
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = BytesIO()
+    tiny.save(buffer, "WEBP", **PLACEHOLDER_OPTIONS)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def render(name, storage=None):
+    """
+    Создаёт файлы копий ``name`` и считает метаданные оригинала:
+    {widths, width, height, size, color, placeholder}. Только работа с файлами,
+    без БД — выполняется в процессах core.imagejobs.
+    """
+    storage = storage or default_storage
+    image = _open(name, storage)
+    widths = widths_for(image.width)
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+        for fmt in FORMATS:
+            _save(storage, derivative_name(name, width, fmt), _encode(resized, fmt))
+    return {
+        "widths": widths,
+        "width": image.width,
+        "height": image.height,
+        "size": storage.size(name),
+        "color": dominant_color(image),
+        "placeholder": placeholder(image),
+    }
+
+
+def record(name, meta):
+    """Записывает готовые копии и метаданные в ImageAsset — с этого момента их видят шаблоны."""
+    asset, _ = ImageAsset.objects.update_or_create(
+        name=name,
+        defaults={**meta, "formats": list(FORMATS), "generated_at": timezone.now()},
+    )
+    forget(name)
+    return asset
+
+
+def generate(name, storage=None):
+    """Создаёт (пересоздаёт) все копии файла ``name`` сразу, в текущем процессе."""
+    return record(name, render(name, storage))
+
+
+def remove_files(name, widths, formats=tuple(FORMATS), storage=None):
+    storage = storage or default_storage
+    for width in widths:
+        for fmt in formats:
+            storage.delete(derivative_name(name, width, fmt))
+
+
+def discard(name, storage=None):
+    """Удаляет копии файла ``name`` и его запись (оригинал не трогает)."""
+    asset = ImageAsset.objects.filter(name=name).first()
+    if asset is None:
+        return
+    remove_files(name, asset.widths, asset.formats, storage)
+    asset.delete()
+    forget(name)
+
+
+# =========================
+#  Чтение для шаблонов
+# =========================
+def _key(name):
+    return "meta:" + hashlib.blake2b(name.encode(), digest_size=16).hexdigest()
+
+
+def forget(name):
+    cache.delete(versioned_key(IMAGES, _key(name)))
+
+
+def asset_info(name):
+    """
+    Копии и метаданные файла из кэша: {widths, formats, width, height, size,
+    color, placeholder} или ``{}``, если файл ещё не обработан (такой ответ
+    кэшируется лишь на ``PENDING_TIMEOUT``).
+    """
+    key = versioned_key(IMAGES, _key(name))
+    info = cache.get(key)
+    if info is None:
+        info = ImageAsset.objects.filter(name=name).values(*ASSET_FIELDS).first() or {}
+        cache.set(key, info, DEFAULT_TIMEOUT if info else PENDING_TIMEOUT)
+    return info
+
+
+def prime(*files):
+    """
+    Заранее кладёт в кэш ``asset_info`` для списка файлов (имена или FieldFile)
+    одним запросом к базе. Вызывается вьюхами перед рендером карточек и галерей:
+    иначе каждая картинка на холодном кэше — отдельный запрос.
+    """
+    keys = {versioned_key(IMAGES, _key(name)): name for name in {getattr(f, "name", f) for f in files} if name}
+    if not keys:
+        return
+    hits = cache.get_many(list(keys))
+    missing = {name: key for key, name in keys.items() if key not in hits}
+    if not missing:
+        return
+    rows = ImageAsset.objects.filter(name__in=missing).values("name", *ASSET_FIELDS)
+    found = {row.pop("name"): row for row in rows}
+    cache.set_many({key: found[name] for name, key in missing.items() if name in found}, DEFAULT_TIMEOUT)
+    cache.set_many({key: {} for name, key in missing.items() if name not in found}, PENDING_TIMEOUT)
+
+
+def prime_fields(objects, *fields):
+    """``prime`` для полей-файлов ``fields`` каждого объекта из ``objects``."""
+    prime(*(getattr(obj, field) for obj in objects for field in fields))
+
+
+def srcset(name, fmt, storage=None):
+    """Строка ``srcset`` для формата ``fmt`` или пустая строка."""
+    info = asset_info(name)
+    if not info or fmt not in info["formats"]:
+        return ""
+    storage = storage or default_storage
+    return ", ".join(f"{storage.url(derivative_name(name, width, fmt))} {width}w" for width in info["widths"])
+
+
+def url_for_width(name, width, fmt=FALLBACK, storage=None):
+    """Адрес самой узкой копии не уже ``width`` (или оригинала, если копий нет)."""
+    storage = storage or default_storage
+    info = asset_info(name)
+    if not info or fmt not in info["formats"]:
+        return storage.url(name)
+    widths = info["widths"]
+    chosen = next((w for w in widths if w >= width), widths[-1])
+    return storage.url(derivative_name(name, chosen, fmt))
@@ -0,0 +1,228 @@
+"""
+Приём заявок через журнал с отложенной записью (write-behind).
+
+Форма заявки не пишет в основную SQLite: во время рекламных кампаний запись
+из нескольких воркеров gunicorn упирается в блокировку базы (``database is
+locked``), и воркер стоит, пока её ждёт. Вместо этого ``lead_create``
+добавляет заявку в журнал — отдельную маленькую SQLite в режиме WAL с
+``synchronous=FULL`` (``LEAD_JOURNAL_PATH``): ответ уходит после fsync записи,
+то есть заявка уже не потеряется. Блокировка журнала держится одну короткую
+вставку и не пересекается с записью админки в основную базу.
+
+``flush_leads`` забирает журнал пачками, вставляет заявки в основную базу
+одним ``bulk_create`` на пачку и удаляет перенесённые записи журнала.
+
+Повторы не создают дублей: у заявки есть ключ идемпотентности (заголовок
+``Idempotency-Key`` или поле ``idempotency_key`` — форма шлёт один ключ на
+все попытки отправки). Журнал и ``Lead.idempotency_key`` уникальны по ключу,
+поэтому ни повторная отправка, ни перенос после сбоя между вставкой и
+удалением из журнала заявку не удваивают.
+
+Заявка проверяется до ответа (``LeadForm``): негодная получает 400 и в журнал
+не попадает. Если запись журнала всё же не вставляется (журнал старой версии,
+ручная правка), пачка переносится по одной заявке, а негодные уходят в таблицу
+``dead`` журнала с текстом ошибки — одна испорченная запись не блокирует
+перенос остальных.
+
+Без ``LEAD_JOURNAL_PATH`` (разработка, тесты) заявка пишется в базу сразу.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Lead
+
+# Поля заявки, которые приходят из формы
+FIELDS = (
+    "name", "phone", "email", "message", "source_page", "cta",
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "related_type", "related_id",
+)
+KEY_RE = re.compile(r"^[A-Za-z0-9_\-:.]{8,64}$")
+BATCH = 1000
+# Ошибки данных самой заявки: такая запись не вставится и при повторе
+POISON = (ValueError, TypeError, ValidationError, DataError, IntegrityError)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+)
+"""
+DEAD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    error TEXT NOT NULL,
+    failed_at TEXT NOT NULL
+)
+"""
+
+_local = threading.local()
+
+
+def journal_path():
+    return getattr(settings, "LEAD_JOURNAL_PATH", "") or None
+
+
+def idempotency_key(request):
+    """Ключ из заголовка или формы; без ключа (или с негодным) — новый."""
+    key = request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key", "")
+    return key if KEY_RE.match(key) else uuid.uuid4().hex
+
+
+class LeadForm(forms.Form):
+    # source_page — не только URL: формы передают и имя блока ("how-it-works")
+    name = forms.CharField(max_length=120)
+    phone = forms.CharField(max_length=32)
+    email = forms.EmailField(required=False)
+    message = forms.CharField(required=False, max_length=5000)
+    source_page = forms.CharField(required=False, max_length=600)
+    cta = forms.CharField(required=False, max_length=160)
+    utm_source = forms.CharField(required=False, max_length=100)
+    utm_medium = forms.CharField(required=False, max_length=100)
+    utm_campaign = forms.CharField(required=False, max_length=100)
+    utm_term = forms.CharField(required=False, max_length=100)
+    utm_content = forms.CharField(required=False, max_length=100)
+    related_type = forms.ChoiceField(required=False, choices=[("", "")] + Lead._meta.get_field("related_type").choices)
+    related_id = forms.IntegerField(required=False, min_value=0)
+
+
+class InvalidLead(Exception):
+    def __init__(self, errors):
+        super().__init__(errors.as_text())
+        self.errors = {field: list(messages) for field, messages in errors.items()}
+
+
+def lead_data(request):
+    """Проверенные поля заявки из формы; ``InvalidLead`` — заявка негодна."""
+    form = LeadForm(request.POST)
+    if not form.is_valid():
+        raise InvalidLead(form.errors)
+    data = {field: form.cleaned_data[field] for field in FIELDS}
+    data["source_page"] = data["source_page"] or request.META.get("HTTP_REFERER", "")[:600]
+    return data
+
+
+# =========================
+#  Журнал
+# =========================
+def _connection():
+    """Соединение с журналом на поток; после fork процесса открывается заново."""
+    path = journal_path()
+    state = getattr(_local, "state", None)
+    if state is None or state[0] != (os.getpid(), path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: fsync WAL на каждый коммит — ответ клиенту только после надёжной записи
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(SCHEMA)
+        conn.execute(DEAD_SCHEMA)
+        state = _local.state = ((os.getpid(), path), conn)
+    return state[1]
+
+
+def append(key, data, created_at=None):
+    """Добавляет заявку в журнал. False — заявка с таким ключом уже ждёт переноса."""
+    created_at = created_at or timezone.now()
+    cursor = _connection().execute(
+        "INSERT OR IGNORE INTO journal (key, created_at, data) VALUES (?, ?, ?)",
+        (key, created_at.isoformat(), json.dumps(data, ensure_ascii=False)),
+    )
+    return cursor.rowcount == 1
+
+
+def pending():
+    return _connection().execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+
+def dead():
+    """Записи журнала, которые не удалось перенести: [(ключ, данные, ошибка), ...]."""
+    return _connection().execute("SELECT key, data, error FROM dead ORDER BY id").fetchall()
+
+
+def submit(request):
+    """
+    Принимает заявку из запроса: в журнал или, без журнала, сразу в базу.
+    Возвращает ключ; ``InvalidLead`` — заявка негодна.
+    """
+    data = lead_data(request)
+    key = idempotency_key(request)
+    if journal_path():
+        append(key, data)
+    else:
+        Lead.objects.get_or_create(idempotency_key=key, defaults=data)
+    return key
+
+
+# =========================
+#  Перенос в основную базу
+# =========================
+def flush(batch=BATCH):
+    """Переносит до ``batch`` заявок из журнала в базу. Возвращает их число."""
+    conn = _connection()
+    rows = conn.execute("SELECT id, key, created_at, data FROM journal ORDER BY id LIMIT ?", (batch,)).fetchall()
+    if not rows:
+        return 0
+    try:
+        # Одна транзакция на пачку; уже перенесённые (сбой до удаления из журнала,
+        # повторная отправка) пропускаются
+        _insert(rows)
+    except POISON:
+        failed = []
+        for row in rows:
+            try:
+                _insert([row])
+            except POISON as exc:
+                failed.append((*row, f"{type(exc).__name__}: {exc}"))
+        _bury(conn, failed)
+    conn.execute("DELETE FROM journal WHERE id <= ?", (rows[-1][0],))
+    return len(rows)
+
+
+def _insert(rows):
+    # Точка сохранения: ошибка вставки не ломает внешнюю транзакцию
+    with transaction.atomic():
+        Lead.objects.bulk_create([
+            Lead(idempotency_key=key, created_at=datetime.fromisoformat(created_at), **json.loads(data))
+            for _, key, created_at, data in rows
+        ], ignore_conflicts=True)
+
+
+def _bury(conn, rows):
+    """Негодные записи — в таблицу ``dead`` вместо бесконечных повторов."""
+    now = timezone.now().isoformat()
+    conn.executemany(
+        "INSERT OR REPLACE INTO dead (id, key, created_at, data, error, failed_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(*row, now) for row in rows],
+    )
+    for _, key, _, _, error in rows:
+        logger.error("Заявка %s не перенесена из журнала: %s", key, error)
+
+
+def drain(batch=BATCH):
+    """Переносит весь журнал. Возвращает число заявок."""
+    total = 0
+    while True:
+        moved = flush(batch)
+        total += moved
+        if moved < batch:
+            return total
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from core import backup
+
+
+class Command(BaseCommand):
+    help = 'Инкрементальная резервная копия баз SQLite и медиафайлов (core.backup)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.BACKUP_ROOT, help='Каталог хранилища копий')
+        parser.add_argument('--keep', type=int, default=backup.KEEP,
+                            help='Сколько последних копий хранить (0 — все)')
+        parser.add_argument('--no-media', action='store_true', help='Только базы')
+
+    def handle(self, *args, **options):
+        try:
+            stats = backup.backup(options['output'], media_root='' if options['no_media'] else None)
+        except (backup.BackupError, OSError) as exc:
+            raise CommandError(str(exc))
+        removed = backup.prune(options['output'], options['keep'])
+        self.stdout.write(
+            f"Баз: {stats['databases']}, медиафайлов: {stats['files']} "
+            f"(изменилось {stats['changed']}, без изменений {stats['reused']}), удалено старых объектов: {removed}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Копия {stats['manifest']} в {options['output']}, записано {filesizeformat(stats['written'])}"
+        ))
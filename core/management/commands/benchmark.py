@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный замер страниц в процессе: RPS и p50/p95/p99 по адресам, сравнение с базовым прогоном'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=benchmark.REQUESTS, help='Запросов на адрес')
+        parser.add_argument('--concurrency', type=int, default=benchmark.CONCURRENCY, help='Параллельных потоков')
+        parser.add_argument('--warmup', type=int, default=benchmark.WARMUP, help='Запросов прогрева на адрес')
+        parser.add_argument('--endpoint', action='append',
+                            help='Имя адреса из списка по умолчанию (можно несколько; по умолчанию — все)')
+        parser.add_argument('--no-page-cache', action='store_true',
+                            help='Обходить полностраничный кэш: замер самих вьюх')
+        parser.add_argument('--host', default='localhost', help='Заголовок Host (должен быть в ALLOWED_HOSTS)')
+        parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+        parser.add_argument('--baseline', help='JSON прежнего прогона: регрессии завершают команду с ошибкой')
+        parser.add_argument('--tolerance', type=float, default=benchmark.TOLERANCE,
+                            help='Допустимое ухудшение p95 и RPS относительно базового, доля')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests и --concurrency должны быть положительными')
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Не удалось прочитать базовый прогон: {exc}')
+
+        urls = benchmark.endpoints()
+        if options['endpoint']:
+            unknown = set(options['endpoint']) - {name for name, _ in urls}
+            if unknown:
+                raise CommandError(f"Неизвестные адреса: {', '.join(sorted(unknown))}")
+            urls = [(name, url) for name, url in urls if name in options['endpoint']]
+
+        self.stdout.write(f"{'адрес':<22}{'RPS':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ошибок':>8}")
+        result = benchmark.run(
+            urls, options['requests'], options['concurrency'], options['warmup'],
+            page_cache=not options['no_page_cache'], host=options['host'], progress=self.row,
+        )
+
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+            self.stdout.write(f'Результат сохранён в {path}')
+
+        if baseline is None:
+            return
+        if baseline.get('catalog') != result['catalog']:
+            self.stdout.write(self.style.WARNING(
+                'Каталог отличается от базового прогона — сравнение неточно (generate_catalog с тем же --scale и --seed)'
+            ))
+        if baseline.get('options') != result['options']:
+            self.stdout.write(self.style.WARNING(f"Параметры прогона отличаются от базовых: {baseline.get('options')}"))
+        regressions = benchmark.compare(result, baseline, options['tolerance'])
+        for item in regressions:
+            change = f"{item['change']:+.0%}" if item['change'] is not None else ''
+            self.stdout.write(self.style.ERROR(
+                f"{item['endpoint']}: {item['metric']} {item['baseline']} -> {item['current']} {change}"
+            ))
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий относительно базового прогона нет'))
+
+    def row(self, name, stats):
+        self.stdout.write(
+            f"{name:<22}{stats['rps']:>9}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['errors']:>8}"
+        )
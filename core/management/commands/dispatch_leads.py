@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import notify
+
+
+class Command(BaseCommand):
+    help = 'Отправляет уведомления о новых заявках на email и webhook из настроек сайта (core.notify)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help='Фоновый режим: отправлять по мере поступления')
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза при пустой очереди, секунд')
+        parser.add_argument('--batch', type=int, default=notify.BATCH, help='Заявок за один проход')
+
+    def handle(self, *args, **options):
+        dispatcher = notify.Dispatcher()
+        total = {'sent': 0, 'retry': 0, 'failed': 0}
+        try:
+            while True:
+                close_old_connections()
+                result = dispatcher.dispatch(options['batch'])
+                for name in total:
+                    total[name] += result[name]
+                if any(result.values()):
+                    self.stdout.write(f"Отправлено {result['sent']}, повтор {result['retry']}, ошибок {result['failed']}")
+                    continue
+                # Очередь пуста: соединения не держим, сервер всё равно закроет их по таймауту
+                dispatcher.close()
+                if not options['watch']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            dispatcher.close()
+        rate = notify.stats()['per_second']
+        self.stdout.write(self.style.SUCCESS(
+            f"Отправлено {total['sent']}, отложено {total['retry']}, ошибок {total['failed']}; {rate} заявок/с"
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+
+from core import leads
+
+
+class Command(BaseCommand):
+    help = 'Переносит заявки из журнала (LEAD_JOURNAL_PATH) в базу пачками (core.leads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help='Фоновый режим: переносить по мере поступления')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза при пустом журнале, секунд')
+        parser.add_argument('--batch', type=int, default=leads.BATCH, help='Заявок в одной вставке')
+
+    def handle(self, *args, **options):
+        if leads.journal_path() is None:
+            raise CommandError('LEAD_JOURNAL_PATH не задан')
+        if not options['watch']:
+            moved = leads.drain(options['batch'])
+            self.stdout.write(self.style.SUCCESS(f'Перенесено заявок: {moved}'))
+            return
+
+        self.stdout.write(f'Переношу заявки из {leads.journal_path()}')
+        while True:
+            close_old_connections()
+            try:
+                moved = leads.drain(options['batch'])
+            except DatabaseError as exc:
+                # База недоступна или занята: записи остаются в журнале до следующего прохода
+                self.stderr.write(f'Перенос отложен: {exc}')
+                moved = 0
+            if moved:
+                self.stdout.write(f'Перенесено заявок: {moved}')
+            time.sleep(options['interval'])
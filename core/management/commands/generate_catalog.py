@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Наполняет базу синтетическим каталогом для нагрузочных замеров (benchmark)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Размер: 1 — 1000 туров, 50 категорий туров, 5000 отзывов; 10 — вдесятеро больше')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно генератора: тот же seed — тот же каталог')
+        parser.add_argument('--replace', action='store_true', help='Сначала удалить ранее сгенерированный каталог')
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0:
+            raise CommandError('--scale должен быть больше нуля')
+        if synthetic.existing():
+            if not options['replace']:
+                raise CommandError('Сгенерированный каталог уже есть; --replace удалит его перед генерацией')
+            synthetic.remove()
+            self.stdout.write('Прежний сгенерированный каталог удалён')
+
+        started = time.monotonic()
+        counts = synthetic.insert(options['scale'], options['seed'])
+        for model, count in counts.items():
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+        synthetic.rebuild(self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.monotonic() - started:.1f} с'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core import imagejobs, images
+from core.models import ImageAsset
+
+
+class Command(BaseCommand):
+    help = ('Ставит в очередь на уменьшенные копии (srcset) и метаданные загруженные обложки, галереи и '
+            'фото отзывов, включая обработанные до появления метаданных; копии создаёт воркер process_images')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии и для уже обработанных файлов')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        assets = list(ImageAsset.objects.values_list('name', 'width'))
+        done = set() if force else {name for name, width in assets if width is not None}
+        # Копии есть, а размеров, цвета и заглушки ещё нет — задание нужно выполнить повторно
+        outdated = {name for name, width in assets if width is None}
+        queued = 0
+        for model, field in images.IMAGE_FIELDS:
+            objects = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for instance in objects.iterator():
+                name = getattr(instance, field).name
+                if name in done:
+                    continue
+                imagejobs.enqueue(name, imagejobs.page_keys(instance), force=force or name in outdated)
+                queued += 1
+        self.stdout.write(self.style.SUCCESS(f'В очереди {queued}, обработайте: manage.py process_images'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import pagecache
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики полностраничного кэша (попадания, промахи, сбросы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики после вывода')
+        parser.add_argument('--purge-all', action='store_true', help='Сбросить все закэшированные страницы')
+
+    def handle(self, *args, **options):
+        for name, value in pagecache.stats().items():
+            self.stdout.write(f'{name}: {value}')
+        if options['reset']:
+            pagecache.reset_stats()
+            self.stdout.write('Счётчики обнулены')
+        if options['purge_all']:
+            pagecache.purge(pagecache.ALL)
+            self.stdout.write(self.style.SUCCESS('Все страницы сброшены'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core import prerender
+
+
+class Command(BaseCommand):
+    help = 'Выгружает страницы каталога в статические HTML-файлы для раздачи Caddy (PRERENDER_ROOT)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true',
+                            help='Фоновый режим: перерисовывать только устаревшие, новые и удалённые страницы')
+        parser.add_argument('--interval', type=float, default=5.0, help='Пауза между проходами в --watch, секунд')
+
+    def handle(self, *args, **options):
+        if prerender.root() is None:
+            raise CommandError('PRERENDER_ROOT не задан')
+        if not options['watch']:
+            result = prerender.rebuild(full=True)
+            self.stdout.write(self.style.SUCCESS(
+                f"Готово: страниц {result['rendered']}, удалено {result['removed']}"
+            ))
+            return
+
+        self.stdout.write(f'Слежу за изменениями, каталог {prerender.root()}')
+        prerender.rebuild()
+        while True:
+            time.sleep(options['interval'])
+            close_old_connections()
+            result = prerender.rebuild()
+            if result['rendered'] or result['removed']:
+                self.stdout.write(f"Перерисовано {result['rendered']}, удалено {result['removed']}")
@@ -0,0 +1,58 @@
+import os
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core import imagejobs
+
+
+def _init_process():
+    # При запуске процессов через spawn/forkserver Django в них ещё не настроен
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди изображений: создаёт уменьшенные копии в пуле процессов (core.imagejobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов обработки, по умолчанию — по числу ядер')
+        parser.add_argument('--batch', type=int, default=imagejobs.BATCH, help='Заданий за один проход')
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза при пустой очереди, секунд')
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и выйти')
+
+    def _pool(self, workers):
+        # Соединения с БД не должны достаться дочерним процессам
+        connections.close_all()
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_process)
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch = max(options['batch'], workers)
+        executor = self._pool(workers)
+        self.stdout.write(f'Обработка изображений: процессов {workers}')
+        total = {'done': 0, 'failed': 0}
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    result = imagejobs.work(executor, batch)
+                except BrokenExecutor:
+                    self.stderr.write('Пул процессов сломан, пересоздаю')
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self._pool(workers)
+                    continue
+                for name in total:
+                    total[name] += result[name]
+                if result['done'] or result['failed']:
+                    self.stdout.write(f"Готово {result['done']}, ошибок {result['failed']}")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Обработано {total['done']}, ошибок {total['failed']}"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import counters, pagecache
+from core.cache import CATALOG, bump_generation
+from core.tree import rebuild_paths
+from services.models import ServiceCategory
+from tours import cards
+from tours.models import TourCategory
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает материализованные пути деревьев категорий (после правок в обход save())'
+
+    def handle(self, *args, **options):
+        for model in (TourCategory, ServiceCategory):
+            with transaction.atomic():
+                count = rebuild_paths(model)
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: исправлено путей {count}'))
+        # Счётчики категорий считаются по поддеревьям — после правки путей пересчитываем
+        counters.recount_all()
+        # Пулы карточек туров не версионированы — сбрасываем их вместе с каталогом
+        cards.invalidate_pools(cards.ALL, *TourCategory.objects.values_list('pk', flat=True))
+        bump_generation(CATALOG)
+        pagecache.purge(pagecache.ALL)
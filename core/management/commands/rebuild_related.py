@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core import related
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересобирает списки похожих туров и услуг'
+
+    def handle(self, *args, **options):
+        for model in related.LINK_MODELS:
+            count = related.rebuild(model)
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: пересобрано {count}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает поисковый индекс туров и услуг'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', choices=sorted(search.SEARCH_MODELS), action='append',
+            help='Тип объектов для перестройки (по умолчанию — все)',
+        )
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or sorted(search.SEARCH_MODELS):
+            with transaction.atomic():
+                count = search.rebuild(kind)
+            self.stdout.write(self.style.SUCCESS(f'{kind}: проиндексировано {count}'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import counters, pagecache
+from core.cache import CATALOG, bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики активных туров и услуг у категорий и тегов (исправляет расхождения)'
+
+    def handle(self, *args, **options):
+        drift = 0
+        with transaction.atomic():
+            for item, m2m, target, field in counters.COUNTERS:
+                before = dict(target.objects.values_list('pk', field))
+                rows = counters.recount(item, m2m)
+                after = dict(target.objects.values_list('pk', field))
+                changed = sum(1 for pk, value in after.items() if before.get(pk) != value)
+                drift += changed
+                self.stdout.write(f'{target.__name__}.{field}: строк {rows}, исправлено {changed}')
+        if drift:
+            bump_generation(CATALOG)
+            pagecache.purge(pagecache.ALL)
+        self.stdout.write(self.style.SUCCESS(f'Готово, исправлено значений: {drift}'))
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import backup
+
+
+class Command(BaseCommand):
+    help = 'Восстанавливает базы и медиафайлы из копии команды backup с проверкой хэшей (core.backup)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', nargs='?', help='Имя или путь манифеста; по умолчанию последний')
+        parser.add_argument('--input', default=settings.BACKUP_ROOT, help='Каталог хранилища копий')
+        parser.add_argument('--verify-only', action='store_true', help='Только проверить целостность копии')
+        parser.add_argument('--list', action='store_true', help='Показать доступные копии')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name in backup.manifests(options['input']):
+                self.stdout.write(name)
+            return
+        try:
+            stats = backup.restore(options['input'], options['manifest'], verify_only=options['verify_only'])
+        except (backup.BackupError, OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        if options['verify_only']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Копия {stats['manifest']} цела: баз {stats['databases']}, медиафайлов {stats['files']}"
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Восстановлено из {stats['manifest']}: баз {stats['databases']}, "
+            f"медиафайлов {stats['files']}, уже совпадали {stats['skipped']}"
+        ))
@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core import media, pagecache
+from core.storage import is_content_addressed
+from tours import cards
+from tours.models import Tour
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает ссылки на медиафайлы и удаляет файлы, на которые никто не ссылается (core.media)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true',
+                            help='Сначала перевести файлы со старыми именами на адресацию по содержимому')
+        parser.add_argument('--grace-hours', type=float, default=media.GRACE.total_seconds() / 3600,
+                            help='Не удалять файлы моложе стольких часов')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько будет удалено')
+
+    def adopt(self):
+        """Старые имена (``tours/gallery/x_Ab12.jpg``) -> ``cas/...``; одинаковые файлы сливаются."""
+        adopted = missing = 0
+        for model, fields in media.file_fields():
+            for field in fields:
+                rows = model._default_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                for pk, name in rows.values_list('pk', field).iterator():
+                    if is_content_addressed(name):
+                        continue
+                    if not default_storage.exists(name):
+                        missing += 1
+                        continue
+                    with default_storage.open(name) as fh:
+                        new_name = default_storage.save(name, fh)
+                    # Мимо сигналов: файл тот же, счётчики пересчитает sweep
+                    model._default_manager.filter(pk=pk).update(**{field: new_name})
+                    adopted += 1
+        if adopted:
+            # Адреса файлов изменились: страницы и карточки со старыми ссылками сбрасываются,
+            # копии для новых имён ставятся в очередь
+            pagecache.purge(pagecache.ALL)
+            cards.invalidate_cards(*Tour.objects.values_list('pk', flat=True))
+            call_command('generate_image_derivatives', stdout=self.stdout)
+        self.stdout.write(f'Переведено на адресацию по содержимому: {adopted}, файлов не найдено: {missing}')
+
+    def handle(self, *args, **options):
+        if options['adopt'] and not options['dry_run']:
+            self.adopt()
+        removed = media.sweep(timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} файлов: {removed['files']}, {filesizeformat(removed['bytes'])}"
+        ))
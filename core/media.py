@@ -0,0 +1,142 @@
+"""
+Счётчики ссылок на медиафайлы и удаление осиротевших файлов.
+
+С адресацией по содержимому (core.storage) один файл может стоять в нескольких
+полях: обложка тура, услуги и фото галереи. ``core.MediaFile`` хранит, сколько
+полей ссылается на файл. Сигналы core.signals увеличивают и уменьшают счётчик
+при сохранении с новым файлом, замене и удалении объекта. Копии изображений
+удаляются только когда на оригинал больше никто не ссылается.
+
+``sweep_media`` сначала пересчитывает ссылки по базе (массовые ``update()`` и
+правки мимо ORM сигналы не видят), затем удаляет из ``MEDIA_ROOT`` файлы без
+ссылок вместе с их копиями. Файлы моложе ``GRACE`` не трогаются: загрузка
+пишет файл раньше, чем сохраняется объект, который на него ссылается.
+"""
+import os
+from collections import Counter
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from .images import derivative_name, forget
+from .models import ImageAsset, ImageJob, MediaFile
+
+GRACE = timedelta(hours=24)
+
+
+@lru_cache(maxsize=None)
+def file_fields():
+    """((модель, (поля-файлы, ...)), ...) всех установленных моделей."""
+    found = []
+    for model in apps.get_models():
+        names = tuple(
+            field.name for field in model._meta.concrete_fields if isinstance(field, models.FileField)
+        )
+        if names:
+            found.append((model, names))
+    return tuple(found)
+
+
+def fields_of(model):
+    return dict(file_fields()).get(model, ())
+
+
+# =========================
+#  Счётчики
+# =========================
+def acquire(*names):
+    for name in filter(None, names):
+        MediaFile.objects.get_or_create(name=name)
+        MediaFile.objects.filter(name=name).update(refs=F("refs") + 1)
+
+
+def release(*names):
+    for name in filter(None, names):
+        MediaFile.objects.filter(name=name, refs__gt=0).update(refs=F("refs") - 1)
+
+
+def is_referenced(name):
+    return MediaFile.objects.filter(name=name, refs__gt=0).exists()
+
+
+def references():
+    """Counter {файл: число полей} по текущим данным всех моделей."""
+    counts = Counter()
+    for model, names in file_fields():
+        for name in names:
+            values = model._default_manager.exclude(**{name: ""}).exclude(**{f"{name}__isnull": True})
+            counts.update(values.values_list(name, flat=True))
+    return counts
+
+
+def recount():
+    """Приводит счётчики MediaFile к данным в базе. Возвращает число исправленных."""
+    counts = references()
+    stored = dict(MediaFile.objects.values_list("name", "refs"))
+    fixed = 0
+    for name, refs in stored.items():
+        if counts.get(name, 0) != refs:
+            MediaFile.objects.filter(name=name).update(refs=counts.get(name, 0))
+            fixed += 1
+    missing = [MediaFile(name=name, refs=refs) for name, refs in counts.items() if name not in stored]
+    MediaFile.objects.bulk_create(missing, ignore_conflicts=True)
+    return fixed + len(missing)
+
+
+# =========================
+#  Удаление осиротевших
+# =========================
+def _kept(referenced):
+    """Имена, которые нужно сохранить: используемые файлы и их копии."""
+    kept = set(referenced)
+    for name, widths, formats in ImageAsset.objects.values_list("name", "widths", "formats").iterator():
+        if name in referenced:
+            kept.update(derivative_name(name, width, fmt) for width in widths for fmt in formats)
+    return kept
+
+
+def _walk(root):
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = Path(directory) / filename
+            yield path, path.relative_to(root).as_posix()
+
+
+def sweep(grace=GRACE, dry_run=False, storage=None):
+    """
+    Удаляет файлы без ссылок старше ``grace``. Возвращает {"files", "bytes"} —
+    сколько удалено (или было бы удалено при ``dry_run``).
+    """
+    storage = storage or default_storage
+    recount()
+    referenced = set(MediaFile.objects.filter(refs__gt=0).values_list("name", flat=True))
+    kept = _kept(referenced)
+    cutoff = (timezone.now() - grace).timestamp()
+
+    removed = {"files": 0, "bytes": 0}
+    orphans = []
+    for path, name in _walk(storage.location):
+        if name in kept or name.split("/")[-1].startswith("."):
+            continue
+        stat = path.stat()
+        if stat.st_mtime > cutoff:
+            continue
+        removed["files"] += 1
+        removed["bytes"] += stat.st_size
+        orphans.append(name)
+        if not dry_run:
+            path.unlink(missing_ok=True)
+
+    if not dry_run and orphans:
+        for name in ImageAsset.objects.filter(name__in=orphans).values_list("name", flat=True):
+            forget(name)
+        ImageAsset.objects.filter(name__in=orphans).delete()
+        ImageJob.objects.filter(name__in=orphans).delete()
+        MediaFile.objects.filter(name__in=orphans, refs=0).delete()
+    return removed
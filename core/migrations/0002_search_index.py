@@ -0,0 +1,56 @@
+# Поисковый индекс core.search: схема зависит от СУБД, поэтому через RunPython.
+
+from django.db import migrations
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS core_search_index USING fts5(
+    kind UNINDEXED, obj_id UNINDEXED, title, location, terms, body,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS core_search_index (
+        kind varchar(16) NOT NULL,
+        obj_id bigint NOT NULL,
+        title text NOT NULL DEFAULT '',
+        location text NOT NULL DEFAULT '',
+        terms text NOT NULL DEFAULT '',
+        body text NOT NULL DEFAULT '',
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', title), 'A')
+            || setweight(to_tsvector('russian', location), 'B')
+            || setweight(to_tsvector('russian', terms), 'B')
+            || setweight(to_tsvector('russian', body), 'D')
+        ) STORED,
+        PRIMARY KEY (kind, obj_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS core_search_index_document_gin ON core_search_index USING GIN (document)",
+]
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_CREATE:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS core_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
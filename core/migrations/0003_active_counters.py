@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    from core.counters import update_counter
+
+    Tag = apps.get_model('core', 'Tag')
+    Tour = apps.get_model('tours', 'Tour')
+    Service = apps.get_model('services', 'Service')
+    update_counter(Tour, 'categories', apps.get_model('tours', 'TourCategory'), 'tours_count')
+    update_counter(Tour, 'tags', Tag, 'tours_count')
+    update_counter(Service, 'categories', apps.get_model('services', 'ServiceCategory'), 'services_count')
+    update_counter(Service, 'tags', Tag, 'services_count')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_search_index'),
+        ('tours', '0010_active_counters'),
+        ('services', '0008_active_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='services_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Активных услуг'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='tours_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Активных туров'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_active_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrerenderedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True, verbose_name='Адрес')),
+                ('keys', models.TextField(blank=True, verbose_name='Суррогатные ключи')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('rendered_version', models.PositiveIntegerField(default=0)),
+                ('rendered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Пререндеренная страница',
+                'verbose_name_plural': 'Пререндеренные страницы',
+            },
+        ),
+    ]
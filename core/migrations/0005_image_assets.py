@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_prerendered_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('widths', models.JSONField(default=list, verbose_name='Ширины копий')),
+                ('formats', models.JSONField(default=list, verbose_name='Форматы копий')),
+                ('generated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Копии изображения',
+                'verbose_name_plural': 'Копии изображений',
+            },
+        ),
+    ]
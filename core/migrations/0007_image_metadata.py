@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageasset',
+            name='color',
+            field=models.CharField(blank=True, max_length=7, verbose_name='Преобладающий цвет'),
+        ),
+        migrations.AddField(
+            model_name='imageasset',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='imageasset',
+            name='placeholder',
+            field=models.TextField(blank=True, verbose_name='Заглушка (data: URI)'),
+        ),
+        migrations.AddField(
+            model_name='imageasset',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер файла, байт'),
+        ),
+        migrations.AddField(
+            model_name='imageasset',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_media_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='lead',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
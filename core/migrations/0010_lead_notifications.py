@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_lead_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='delivered',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='last_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='sitesettings',
+            name='notify_email',
+            field=models.EmailField(blank=True, help_text='Пусто — на email сайта', max_length=254, verbose_name='Email для заявок'),
+        ),
+        migrations.AddField(
+            model_name='sitesettings',
+            name='notify_webhook',
+            field=models.URLField(blank=True, help_text='POST с JSON {text, lead}, например https://api.telegram.org/bot<токен>/sendMessage?chat_id=<id>', max_length=500, verbose_name='Webhook для заявок'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='core_lead_status_121fc2_idx'),
+        ),
+    ]
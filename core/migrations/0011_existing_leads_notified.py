@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def mark_existing(apps, schema_editor):
+    # Заявки до появления уведомлений уже обработаны вручную: без этой отметки
+    # первый запуск dispatch_leads разослал бы всю историю заявок
+    Lead = apps.get_model('core', 'Lead')
+    Lead.objects.filter(status='new').update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_lead_notifications'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_keys(apps, schema_editor):
+    # Ключи из строки " tour:1 tours " переезжают в индексируемую таблицу
+    PrerenderedPage = apps.get_model('core', 'PrerenderedPage')
+    PrerenderedKey = apps.get_model('core', 'PrerenderedKey')
+    PrerenderedKey.objects.bulk_create(
+        PrerenderedKey(page_id=pk, key=key)
+        for pk, keys in PrerenderedPage.objects.values_list('pk', 'keys').iterator()
+        for key in set(keys.split())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_existing_leads_notified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrerenderedKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, verbose_name='Ключ')),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='key_set', to='core.prerenderedpage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'page'), name='prerendered_key_page_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_keys, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='prerenderedpage',
+            name='keys',
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class SiteSettings(models.Model):
     site_name   = models.CharField(max_length=160, default="TravelWorld")
@@ -10,6 +11,12 @@ class SiteSettings(models.Model):
     telegram    = models.URLField(blank=True)
     instagram   = models.URLField(blank=True)
     about_short = models.TextField(blank=True)
+    # Куда отправлять новые заявки (core.notify); пустые — канал выключен
+    notify_email   = models.EmailField("Email для заявок", blank=True,
+                                       help_text="Пусто — на email сайта")
+    notify_webhook = models.URLField("Webhook для заявок", max_length=500, blank=True,
+                                     help_text="POST с JSON {text, lead}, например "
+                                               "https://api.telegram.org/bot<токен>/sendMessage?chat_id=<id>")
 
     class Meta:
         verbose_name = "Настройки сайта"
@@ -32,6 +39,9 @@ class Category(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=64, unique=True)
     slug = models.SlugField(unique=True)
+    # Активные туры и услуги с тегом; поддерживаются core.counters
+    tours_count = models.PositiveIntegerField("Активных туров", default=0, editable=False, db_index=True)
+    services_count = models.PositiveIntegerField("Активных услуг", default=0, editable=False, db_index=True)
 
     class Meta:
         verbose_name = "Тег"
@@ -40,7 +50,10 @@ class Tag(models.Model):
     def __str__(self): return self.name
 
 class Lead(models.Model):
-    created_at   = models.DateTimeField(auto_now_add=True)
+    # Время отправки формы, а не переноса из журнала (core.leads)
+    created_at   = models.DateTimeField(default=timezone.now, editable=False)
+    # Ключ идемпотентности: повторная отправка той же формы не создаёт вторую заявку
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     name         = models.CharField(max_length=120)
     phone        = models.CharField(max_length=32)
     email        = models.EmailField(blank=True)
@@ -58,9 +71,120 @@ class Lead(models.Model):
     related_id   = models.PositiveIntegerField(null=True, blank=True)
     status       = models.CharField(max_length=20, default="new",
                                     choices=[("new","new"),("sent","sent"),("error","error"),("done","done")])
+    # Уведомления (core.notify): доставленные каналы, попытки и следующая попытка
+    delivered    = models.JSONField(default=list, blank=True, editable=False)
+    attempts     = models.PositiveSmallIntegerField(default=0, editable=False)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, editable=False)
+    last_error   = models.TextField(blank=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
 
     def __str__(self):
         return f"{self.created_at:%Y-%m-%d} {self.name} / {self.phone}"
+
+
+class PrerenderedPage(models.Model):
+    """Страница, выгруженная на диск для раздачи Caddy напрямую (core.prerender)."""
+    path         = models.CharField("Адрес", max_length=255, unique=True)
+    # version растёт при каждом сбросе ключей страницы; страница актуальна,
+    # пока rendered_version == version
+    version      = models.PositiveIntegerField(default=1)
+    rendered_version = models.PositiveIntegerField(default=0)
+    rendered_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Пререндеренная страница"
+        verbose_name_plural = "Пререндеренные страницы"
+
+    def __str__(self):
+        return self.path
+
+    @property
+    def is_stale(self):
+        return self.rendered_version != self.version
+
+
+class PrerenderedKey(models.Model):
+    """Суррогатный ключ пререндеренной страницы: сброс ключа находит страницы по индексу."""
+    page         = models.ForeignKey(PrerenderedPage, related_name='key_set', on_delete=models.CASCADE)
+    key          = models.CharField("Ключ", max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'page'], name='prerendered_key_page_uniq'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class ImageAsset(models.Model):
+    """Уменьшенные копии и метаданные загруженного изображения (core.images)."""
+    name         = models.CharField("Файл", max_length=255, unique=True)
+    widths       = models.JSONField("Ширины копий", default=list)
+    formats      = models.JSONField("Форматы копий", default=list)
+    # Метаданные оригинала: шаблоны берут их отсюда, не открывая файл
+    width        = models.PositiveIntegerField("Ширина", null=True, blank=True)
+    height       = models.PositiveIntegerField("Высота", null=True, blank=True)
+    size         = models.PositiveBigIntegerField("Размер файла, байт", null=True, blank=True)
+    color        = models.CharField("Преобладающий цвет", max_length=7, blank=True)
+    placeholder  = models.TextField("Заглушка (data: URI)", blank=True)
+    generated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Копии изображения"
+        verbose_name_plural = "Копии изображений"
+
+    def __str__(self):
+        return self.name
+
+
+class ImageJob(models.Model):
+    """Задание на создание копий изображения для воркера process_images (core.imagejobs)."""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (RUNNING, "Обрабатывается"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    ]
+
+    # Одно задание на файл: повторная постановка того же файла задание не дублирует
+    name         = models.CharField("Файл", max_length=255, unique=True)
+    status       = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Суррогатные ключи страниц с изображением (core.pagecache), через пробел
+    keys         = models.TextField("Ключи страниц", blank=True)
+    attempts     = models.PositiveSmallIntegerField("Попыток", default=0)
+    error        = models.TextField("Последняя ошибка", blank=True)
+    available_at = models.DateTimeField("Не раньше")
+    created_at   = models.DateTimeField("Создано", auto_now_add=True)
+    started_at   = models.DateTimeField("Начато", null=True, blank=True)
+    finished_at  = models.DateTimeField("Завершено", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Обработка изображения"
+        verbose_name_plural = "Обработка изображений"
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return self.name
+
+
+class MediaFile(models.Model):
+    """Файл хранилища и число ссылающихся на него полей (core.media)."""
+    name         = models.CharField("Файл", max_length=255, unique=True)
+    refs         = models.PositiveIntegerField("Ссылок", default=0)
+    updated_at   = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Медиафайл"
+        verbose_name_plural = "Медиафайлы"
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,257 @@
+"""
+Уведомления о новых заявках: email и HTTP-webhook (например, бот Telegram).
+
+Форма заявки ничего не отправляет (core.leads), иначе к каждому ответу
+добавлялся бы SMTP-обмен. Фоновый ``dispatch_leads`` забирает заявки со
+статусом ``new`` пачками и отправляет их по каналам из настроек сайта
+(``SiteSettings.notify_email`` / ``notify_webhook``):
+
+* вся пачка идёт через одно SMTP-соединение, которое держится открытым, пока
+  есть работа; webhook — через одно keep-alive HTTP-соединение на хост;
+* каналы, уже доставленные для заявки, запоминаются в ``Lead.delivered`` и при
+  повторе не дублируются;
+* ошибка откладывает заявку на ``RETRY_DELAY * 2**n`` (не больше
+  ``MAX_RETRY_DELAY``), после ``MAX_ATTEMPTS`` попыток — статус ``error`` и
+  текст ошибки в ``last_error``; доставка по всем каналам — статус ``sent``.
+
+Счётчики отправленных, повторов и ошибок и пропускная способность (заявок в
+секунду чистого времени отправки) — ``stats()``.
+"""
+import http.client
+import json
+import logging
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Lead, SiteSettings
+
+logger = logging.getLogger(__name__)
+
+EMAIL = "email"
+WEBHOOK = "webhook"
+BATCH = 50
+MAX_ATTEMPTS = 6
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+HTTP_TIMEOUT = 10
+
+STATS_KEY = "notify:stats:{}"
+STATS = ("sent", "retry", "failed", "seconds")
+
+
+# =========================
+#  Статистика
+# =========================
+def _count(name, delta):
+    key = STATS_KEY.format(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def stats():
+    """{sent, retry, failed, seconds, per_second} с последнего сброса."""
+    found = cache.get_many([STATS_KEY.format(name) for name in STATS])
+    result = {name: found.get(STATS_KEY.format(name), 0) for name in STATS}
+    # Время хранится в миллисекундах: incr работает только с целыми
+    result["seconds"] = result["seconds"] / 1000
+    result["per_second"] = round(result["sent"] / result["seconds"], 1) if result["seconds"] else 0.0
+    return result
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format(name) for name in STATS])
+
+
+# =========================
+#  Сообщение
+# =========================
+LABELS = (
+    ("phone", "Телефон"), ("email", "Email"), ("message", "Сообщение"), ("cta", "Кнопка"),
+    ("source_page", "Страница"), ("utm_source", "utm_source"), ("utm_medium", "utm_medium"),
+    ("utm_campaign", "utm_campaign"),
+)
+
+
+def subject(lead):
+    return f"Новая заявка: {lead.name}, {lead.phone}"
+
+
+def text(lead):
+    lines = [f"Заявка от {lead.name} ({lead.created_at:%d.%m.%Y %H:%M})"]
+    lines += [f"{label}: {getattr(lead, field)}" for field, label in LABELS if getattr(lead, field)]
+    if lead.related_type and lead.related_id:
+        lines.append(f"Объект: {lead.related_type} #{lead.related_id}")
+    return "\n".join(lines)
+
+
+def payload(lead):
+    return {
+        "text": text(lead),
+        "lead": {
+            "id": lead.pk, "name": lead.name, "phone": lead.phone, "email": lead.email,
+            "message": lead.message, "cta": lead.cta, "source_page": lead.source_page,
+            "created_at": lead.created_at.isoformat(),
+        },
+    }
+
+
+# =========================
+#  Каналы
+# =========================
+class DeliveryError(Exception):
+    pass
+
+
+class WebhookClient:
+    """POST JSON по одному keep-alive соединению на хост."""
+
+    def __init__(self, timeout=HTTP_TIMEOUT):
+        self.timeout = timeout
+        self.connections = {}
+
+    def _connection(self, parts):
+        key = (parts.scheme, parts.netloc)
+        if key not in self.connections:
+            cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            self.connections[key] = cls(parts.netloc, timeout=self.timeout)
+        return key, self.connections[key]
+
+    def post(self, url, data):
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        body = json.dumps(data, ensure_ascii=False).encode()
+        headers = {"Content-Type": "application/json; charset=utf-8", "Connection": "keep-alive"}
+        key, conn = self._connection(parts)
+        try:
+            conn.request("POST", path, body, headers)
+            response = conn.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            # Соединение могли закрыть на той стороне — в следующий раз откроем новое
+            conn.close()
+            self.connections.pop(key, None)
+            raise DeliveryError(f"{type(exc).__name__}: {exc}") from exc
+        if response.will_close:
+            conn.close()
+            self.connections.pop(key, None)
+        if response.status >= 300:
+            raise DeliveryError(f"HTTP {response.status}: {content[:200].decode(errors='replace')}")
+
+    def close(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+
+class Dispatcher:
+    """
+    Отправка заявок пачками. Соединения (SMTP и HTTP) живут между пачками и
+    закрываются ``close()`` — когда очередь опустела.
+    """
+
+    def __init__(self):
+        self.smtp = None
+        self.webhook = WebhookClient()
+
+    def targets(self):
+        """
+        {канал: адрес} из настроек сайта; пустые каналы не отправляются.
+        Настройки читаются из базы, а не из кэша: правка адреса в админке
+        должна доходить до воркера сразу.
+        """
+        site = SiteSettings.objects.first()
+        if site is None:
+            return {}
+        targets = {EMAIL: site.notify_email or site.email, WEBHOOK: site.notify_webhook}
+        return {channel: target for channel, target in targets.items() if target}
+
+    def _send_email(self, lead, recipient):
+        if self.smtp is None:
+            self.smtp = get_connection(fail_silently=False)
+            self.smtp.open()
+        message = EmailMessage(
+            subject(lead), text(lead), settings.DEFAULT_FROM_EMAIL, [recipient], connection=self.smtp,
+        )
+        try:
+            message.send()
+        except Exception as exc:
+            # После сбоя состояние SMTP-сессии неизвестно — открываем заново
+            self._close_smtp()
+            raise DeliveryError(f"{type(exc).__name__}: {exc}") from exc
+
+    def _close_smtp(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.close()
+            except Exception:
+                logger.warning("Не удалось закрыть SMTP-соединение", exc_info=True)
+            self.smtp = None
+
+    def close(self):
+        self._close_smtp()
+        self.webhook.close()
+
+    def deliver(self, lead, targets):
+        """Отправляет заявку по ещё не доставленным каналам. Возвращает текст ошибки или ''."""
+        errors = []
+        for channel, target in targets.items():
+            if channel in lead.delivered:
+                continue
+            try:
+                if channel == EMAIL:
+                    self._send_email(lead, target)
+                else:
+                    self.webhook.post(target, payload(lead))
+            except DeliveryError as exc:
+                errors.append(f"{channel}: {exc}")
+            else:
+                lead.delivered.append(channel)
+        return "; ".join(errors)
+
+    def dispatch(self, batch=BATCH):
+        """Одна пачка заявок. Возвращает {"sent", "retry", "failed"}."""
+        result = {"sent": 0, "retry": 0, "failed": 0}
+        targets = self.targets()
+        if not targets:
+            return result
+        now = timezone.now()
+        due = (
+            Lead.objects.filter(status="new")
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by("created_at")[:batch]
+        )
+        started = time.perf_counter()
+        for lead in due:
+            error = self.deliver(lead, targets)
+            lead.attempts += 1
+            if not error:
+                lead.status, lead.last_error, lead.next_attempt_at = "sent", "", None
+                result["sent"] += 1
+            elif lead.attempts >= MAX_ATTEMPTS:
+                lead.status, lead.last_error = "error", error
+                result["failed"] += 1
+            else:
+                delay = min(RETRY_DELAY * 2 ** (lead.attempts - 1), MAX_RETRY_DELAY)
+                lead.last_error, lead.next_attempt_at = error, timezone.now() + delay
+                result["retry"] += 1
+            # Статус меняем, только если заявку не успели обработать вручную
+            Lead.objects.filter(pk=lead.pk, status="new").update(
+                status=lead.status, delivered=lead.delivered, attempts=lead.attempts,
+                next_attempt_at=lead.next_attempt_at, last_error=lead.last_error,
+            )
+        for name, value in result.items():
+            if value:
+                _count(name, value)
+        if any(result.values()):
+            _count("seconds", int((time.perf_counter() - started) * 1000))
+        return result
@@ -0,0 +1,316 @@
+"""
+Полностраничный кэш для анонимных GET-запросов.
+
+Главная, туры, услуги, прайс, блог, новости и отзывы не зависят от
+посетителя: готовый HTML хранится в общем кэше под ключом «адрес +
+нормализованная строка запроса» (параметры отсортированы, метки
+``utm_*``/``gclid``/... отброшены) и отдаётся без вызова вьюхи и без запросов к БД.
+
+Инвалидация — по суррогатным ключам. Во время рендера вьюха помечает запрос
+ключами всего, что попало на страницу (``tag(request, tour, "tours", ...)``):
+``tour:42``, ``tourcategory:7``, ``sitesettings``, коллекции ``tours``/``blog``…
+У каждого ключа есть поколение в core.cache; запись хранит поколения своих
+ключей на момент рендера и считается устаревшей, если хоть одно изменилось.
+Сигналы core.signals вызывают ``purge(...)`` ровно для затронутых ключей —
+один инкремент на ключ, без перебора записей.
+
+Запросы с cookie сессии или сообщений (админы, flash-сообщения) кэш обходят,
+ответы с Set-Cookie, ``private``/``no-store`` и не-200 не сохраняются.
+Страницы под кэшем не содержат CSRF-токена: AJAX-формы берут его из cookie или
+у ``core:csrf`` (static/js/csrf.js). Страница с обычной формой (``{% csrf_token %}``)
+в кэш не попадает: вьюха, вызвавшая ``get_token()``, помечает запрос, а Set-Cookie
+с токеном CsrfViewMiddleware добавит уже после сохранения — без этой проверки
+следующие посетители получили бы чужой токен без cookie и 403 на отправке.
+
+Закэшированные ответы помечаются ``Cache-Control: public, max-age=0,
+s-maxage=PAGE_CACHE_EDGE_TTL`` и ``Surrogate-Key`` — Caddy (cache-handler)
+может держать их у себя; браузер перепроверяет страницу по ETag (core.conditional).
+Счётчики попаданий, промахов и сбросов — ``stats()``, команда ``pagecache_stats``.
+Они копятся в памяти процесса и переносятся в общий кэш не чаще раза в
+``STATS_INTERVAL`` секунд: запись в файловый кэш на каждый запрос съела бы
+выигрыш от попадания.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe
+
+from .cache import GENERATION_KEY, bump_generation, generation_cache, get_generation, increment
+from .conditional import release
+
+# Ключи, которые есть у каждой страницы: настройки сайта и меню категорий в шапке
+SITE_KEY = "sitesettings"
+NAV_KEY = "nav"
+# Сброс всех страниц разом (массовые пересчёты из management-команд)
+ALL = "all"
+
+# Страницы под кэшем: {пространство имён URL: имена маршрутов или None — все}
+CACHED_VIEWS = {
+    "core": {"home"},
+    "tours": None,
+    "services": None,
+    "prices": None,
+    "blog": None,
+    "news": None,
+    # Форма отзыва содержит CSRF-токен посетителя
+    "reviews": {"list"},
+}
+# Параметры, не влияющие на содержимое страницы
+IGNORED_PARAMS = ("utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+                  "gclid", "fbclid", "yclid", "_openstat")
+BYPASS_COOKIES = (settings.SESSION_COOKIE_NAME, "messages")
+# Заголовки, которые не переносятся из сохранённого ответа
+SKIPPED_HEADERS = ("set-cookie", "x-page-cache")
+
+ENTRY_KEY = "page:{}"
+# Поколение, которое растёт при любом сбросе: страница, во время рендера которой
+# что-то сбросили, могла собраться из старых данных и не сохраняется
+PURGES = "pagecache"
+STATS_KEY = "pagecache:stats:{}"
+STATS = ("hit", "miss", "stale", "bypass", "store", "purge")
+# Секунд между переносами счётчиков процесса в общий кэш
+STATS_INTERVAL = 10
+
+# Отправляется из purge(): keys — сброшенные суррогатные ключи (core.prerender)
+purged = Signal()
+
+
+def timeout():
+    return getattr(settings, "PAGE_CACHE_TIMEOUT", 60 * 60)
+
+
+def edge_ttl():
+    return getattr(settings, "PAGE_CACHE_EDGE_TTL", 60)
+
+
+# =========================
+#  Суррогатные ключи
+# =========================
+def key_for(obj):
+    """Суррогатный ключ объекта модели: ``tour:42``; строки возвращаются как есть."""
+    if isinstance(obj, str):
+        return obj
+    return f"{obj._meta.model_name}:{obj.pk}"
+
+
+def tag(request, *objs):
+    """Помечает страницу текущего запроса ключами ``objs`` (объекты моделей или строки)."""
+    tags = getattr(request, "_page_cache_tags", None)
+    if tags is None:
+        tags = request._page_cache_tags = set()
+    tags.update(key_for(obj) for obj in objs)
+
+
+def page_keys(request):
+    """Все ключи страницы текущего запроса, включая общие для всех страниц."""
+    return getattr(request, "_page_cache_tags", set()) | {SITE_KEY, NAV_KEY, ALL}
+
+
+def _generation_name(key):
+    return f"page:{key}"
+
+
+def purge(*keys):
+    """
+    Делает недействительными все страницы с любым из ``keys``. Внутри транзакции
+    сброс повторяется после коммита: страницы, отрендеренные из ещё старых
+    данных, пока транзакция не закоммичена, тоже не доживут.
+    """
+    keys = {key_for(key) for key in keys}
+    if not keys:
+        return
+    names = [_generation_name(key) for key in keys]
+    bump_generation(*names, PURGES)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_generation(*names, PURGES))
+    _count("purge", len(keys))
+    purged.send(sender=None, keys=keys)
+
+
+def _versions(keys):
+    """Текущие поколения ключей: {ключ: поколение}, недостающие создаются."""
+    names = {key: GENERATION_KEY.format(_generation_name(key)) for key in keys}
+    found = generation_cache().get_many(names.values())
+    return {
+        key: found[name] if name in found else get_generation(_generation_name(key))
+        for key, name in names.items()
+    }
+
+
+def _is_fresh(versions):
+    names = {GENERATION_KEY.format(_generation_name(key)): value for key, value in versions.items()}
+    current = generation_cache().get_many(names.keys())
+    return all(current.get(name) == value for name, value in names.items())
+
+
+# =========================
+#  Статистика
+# =========================
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _count(name, delta=1):
+    global _flushed_at
+    with _pending_lock:
+        _pending[name] += delta
+        if time.monotonic() - _flushed_at < STATS_INTERVAL:
+            return
+        _flushed_at = time.monotonic()
+    flush_stats()
+
+
+def flush_stats():
+    """Переносит счётчики, накопленные процессом, в общий кэш."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    for name, delta in pending.items():
+        increment(STATS_KEY.format(name), delta)
+
+
+def stats():
+    """{hit, miss, stale, bypass, store, purge, hit_ratio} с последнего сброса."""
+    flush_stats()
+    found = cache.get_many([STATS_KEY.format(name) for name in STATS])
+    result = {name: found.get(STATS_KEY.format(name), 0) for name in STATS}
+    lookups = result["hit"] + result["miss"] + result["stale"]
+    result["hit_ratio"] = round(result["hit"] / lookups, 4) if lookups else 0.0
+    return result
+
+
+def reset_stats():
+    with _pending_lock:
+        _pending.clear()
+    cache.delete_many([STATS_KEY.format(name) for name in STATS])
+
+
+# =========================
+#  Запросы и ответы
+# =========================
+def normalized_query(request):
+    """Строка запроса без меток и с отсортированными параметрами."""
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists() if name not in IGNORED_PARAMS
+        for value in values
+    )
+    return urlencode(params)
+
+
+def entry_key(request):
+    raw = "\x1f".join((release(), request.get_host(), request.path, normalized_query(request)))
+    return ENTRY_KEY.format(hashlib.blake2b(raw.encode(), digest_size=16).hexdigest())
+
+
+def _is_cached_view(request):
+    match = request.resolver_match
+    if match is None or match.namespace not in CACHED_VIEWS:
+        return False
+    names = CACHED_VIEWS[match.namespace]
+    return names is None or match.url_name in names
+
+
+def bypass(request):
+    """Запрос рендерится заново и не сохраняется в кэш (core.prerender)."""
+    request._page_cache_bypass = True
+
+
+def _can_use(request):
+    return (
+        request.method in ("GET", "HEAD")
+        and not getattr(request, "_page_cache_bypass", False)
+        and not any(name in request.COOKIES for name in BYPASS_COOKIES)
+        and _is_cached_view(request)
+    )
+
+
+def _can_store(request, response):
+    cache_control = response.get("Cache-Control", "")
+    return (
+        request.method == "GET"
+        and response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # Вьюха выдала CSRF-токен: страница принадлежит одному посетителю
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        and "private" not in cache_control
+        and "no-store" not in cache_control
+        and "Cookie" not in response.get("Vary", "")
+    )
+
+
+def _mark_public(response, tags):
+    patch_cache_control(response, public=True, max_age=0, s_maxage=edge_ttl())
+    response["Surrogate-Key"] = " ".join(sorted(tags))
+
+
+def _from_entry(request, entry):
+    response = HttpResponse(entry["content"], status=entry["status"])
+    for name, value in entry["headers"]:
+        response[name] = value
+    response["X-Page-Cache"] = "HIT"
+    # Валидаторы сохранённого ответа общие для всех анонимных посетителей
+    last_modified = response.get("Last-Modified")
+    return get_conditional_response(
+        request,
+        etag=response.get("ETag"),
+        last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+        response=response,
+    )
+
+
+class PageCacheMiddleware:
+    """
+    Должен стоять последним в MIDDLEWARE: решение принимается в ``process_view``,
+    когда уже известен маршрут, а ответ из кэша проходит через внешние middleware
+    (заголовки безопасности, X-Frame-Options) как обычный.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        key = getattr(request, "_page_cache_key", None)
+        if key is None:
+            return response
+        if not _can_store(request, response) or get_generation(PURGES) != request._page_cache_purges:
+            _count("bypass")
+            return response
+
+        tags = page_keys(request)
+        _mark_public(response, tags)
+        headers = [(name, value) for name, value in response.items() if name.lower() not in SKIPPED_HEADERS]
+        cache.set(key, {
+            "content": response.content,
+            "status": response.status_code,
+            "headers": headers,
+            "versions": _versions(tags),
+        }, timeout())
+        _count("store")
+        response["X-Page-Cache"] = "MISS"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not _can_use(request):
+            return None
+        key = entry_key(request)
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry["versions"]):
+            _count("hit")
+            return _from_entry(request, entry)
+        _count("stale" if entry is not None else "miss")
+        request._page_cache_key = key
+        request._page_cache_purges = get_generation(PURGES)
+        return None
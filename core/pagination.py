@@ -0,0 +1,110 @@
+"""
+Keyset-пагинация (по курсору) для листингов каталога.
+
+Вместо ``COUNT(*)`` и ``OFFSET`` следующая страница выбирается условием
+«строго после последней показанной строки» по кортежу сортировки, например
+``("-is_popular", "-created_at", "-id")``. Страница N стоит столько же,
+сколько первая. Кортеж обязан заканчиваться уникальным полем (id).
+
+Курсор — base64 от JSON со значениями полей сортировки последней строки.
+Если сортировка не выражается полями (релевантность поиска), курсор хранит
+смещение: такие выборки ограничены core.search.SEARCH_LIMIT.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(data) -> str:
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    ``KeysetPaginator(qs, ("price_adult", "id"), 12).page(cursor)``.
+    ``ordering=None`` — сохранить порядок ``qs`` и листать по смещению.
+    """
+
+    def __init__(self, queryset, ordering, per_page=12):
+        self.queryset = queryset
+        self.ordering = tuple(ordering) if ordering else None
+        self.per_page = per_page
+
+    def _fields(self):
+        return [(name.lstrip("-"), name.startswith("-")) for name in self.ordering]
+
+    def _after(self, values):
+        """Условие «строка идёт после values» для смешанных направлений сортировки."""
+        model = self.queryset.model
+        fields = self._fields()
+        if len(values) != len(fields):
+            raise InvalidCursor(values)
+        parsed = []
+        for (name, _), value in zip(fields, values):
+            try:
+                parsed.append(model._meta.get_field(name).to_python(value))
+            except Exception as exc:
+                raise InvalidCursor(values) from exc
+
+        condition = Q()
+        for i, (name, descending) in enumerate(fields):
+            lookup = "lt" if descending else "gt"
+            step = Q(**{f"{name}__{lookup}": parsed[i]})
+            for j in range(i):
+                step &= Q(**{fields[j][0]: parsed[j]})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        state = decode_cursor(cursor) if cursor else None
+
+        if self.ordering is None:
+            try:
+                offset = max(int(state.get("o", 0)), 0) if state is not None else 0
+            except (AttributeError, TypeError, ValueError) as exc:
+                raise InvalidCursor(cursor) from exc
+            rows = list(self.queryset[offset:offset + self.per_page + 1])
+            next_cursor = encode_cursor({"o": offset + self.per_page}) if len(rows) > self.per_page else None
+            return KeysetPage(rows[: self.per_page], next_cursor)
+
+        qs = self.queryset.order_by(*self.ordering)
+        if state is not None:
+            if not isinstance(state, list):
+                raise InvalidCursor(cursor)
+            qs = qs.filter(self._after(state))
+        rows = list(qs[: self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            last = rows[self.per_page - 1]
+            next_cursor = encode_cursor([getattr(last, name) for name, _ in self._fields()])
+        return KeysetPage(rows[: self.per_page], next_cursor)
@@ -0,0 +1,221 @@
+"""
+Пререндер страниц каталога в статические файлы для раздачи Caddy напрямую.
+
+``prerender_site`` выгружает в ``PRERENDER_ROOT`` главную, списки, страницы
+категорий и тегов, туры, услуги, посты блога и новости: адрес ``/tours/foo/``
+становится файлом ``<root>/tours/foo/index.html`` (рядом ``index.html.gz`` для
+``file_server { precompressed gzip }``). Caddy отдаёт файл на GET без строки
+запроса и без cookie сессии/сообщений, а если файла нет — проксирует в Django
+(``try_files``, см. README).
+
+Страница рендерится анонимным запросом через весь стек middleware и вьюх в
+обход полностраничного кэша, поэтому совпадает со свежим ответом Django и
+приносит свои суррогатные ключи (core.pagecache). Фрагменты (меню, сайдбары,
+пулы карточек) берутся из кэша, поэтому он должен быть общим с web
+(``DJANGO_CACHE_DIR`` на общем томе): иначе сбросы из админки сюда не доходят. Ключи хранятся в ``core.PrerenderedKey``; сброс ключей
+(сигнал ``pagecache.purged``) помечает затронутые страницы устаревшими и после
+коммита удаляет их файлы — до перерисовки страница идёт через Django, и
+устаревший HTML с диска не раздаётся. Фоновый ``prerender_site --watch``
+перерисовывает только устаревшие страницы, досоздаёт страницы новых объектов и
+удаляет страницы исчезнувших.
+
+Файлы пишутся во временный файл в том же каталоге и переименовываются
+(``os.replace``): Caddy никогда не видит недописанную страницу.
+"""
+import gzip
+import os
+import sys
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import BlogPost
+from news.models import NewsPost
+from services.models import Service, ServiceCategory
+from tours.models import Tour, TourCategory
+
+from . import pagecache
+from .models import PrerenderedKey, PrerenderedPage, Tag
+
+INDEX = "index.html"
+# Списки и разделы без объекта в адресе
+SECTION_URLS = (
+    "core:home", "tours:list", "services:list", "prices:list",
+    "blog:list", "news:list", "reviews:list",
+)
+
+
+def root():
+    return Path(settings.PRERENDER_ROOT) if getattr(settings, "PRERENDER_ROOT", "") else None
+
+
+def site_paths():
+    """Все адреса для пререндера, по одному запросу на тип объекта."""
+    paths = [reverse(name) for name in SECTION_URLS]
+    sources = (
+        ("tours:detail", Tour.objects.filter(is_active=True)),
+        ("tours:by_category", TourCategory.objects.all()),
+        ("tours:by_tag", Tag.objects.filter(tours_count__gt=0)),
+        ("services:detail", Service.objects.filter(is_active=True)),
+        ("services:by_category", ServiceCategory.objects.all()),
+        ("services:by_tag", Tag.objects.filter(services_count__gt=0)),
+        ("blog:detail", BlogPost.objects.filter(is_published=True)),
+        ("news:detail", NewsPost.objects.filter(is_published=True)),
+    )
+    for name, qs in sources:
+        paths += [reverse(name, kwargs={"slug": slug}) for slug in qs.values_list("slug", flat=True)]
+    return paths
+
+
+def output_file(path):
+    """Файл страницы внутри ``PRERENDER_ROOT``; адреса вне корня отвергаются."""
+    base = root().resolve()
+    target = (base / path.strip("/") / INDEX).resolve()
+    if base not in target.parents:
+        raise ValueError(f"Адрес вне каталога пререндера: {path}")
+    return target
+
+
+# =========================
+#  Рендер
+# =========================
+_handler = None
+
+
+def _get_handler():
+    global _handler
+    if _handler is None:
+        _handler = BaseHandler()
+        _handler.load_middleware()
+    return _handler
+
+
+def _host():
+    host = getattr(settings, "PRERENDER_HOST", "")
+    if host:
+        return host
+    allowed = [h for h in settings.ALLOWED_HOSTS if h != "*" and not h.startswith(".")]
+    return allowed[0] if allowed else "localhost"
+
+
+def render(path):
+    """Анонимный GET ``path`` через middleware и вьюхи: (статус, HTML, суррогатные ключи)."""
+    host = _host()
+    request = WSGIRequest({
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "SCRIPT_NAME": "",
+        "QUERY_STRING": "",
+        "SERVER_NAME": host,
+        "SERVER_PORT": "443",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": host,
+        "HTTP_X_FORWARDED_PROTO": "https",
+        "wsgi.url_scheme": "https",
+        "wsgi.input": BytesIO(),
+        "wsgi.errors": sys.stderr,
+    })
+    # Только свежий рендер: запись полностраничного кэша могла собраться до
+    # сброса, ради которого страница перерисовывается
+    pagecache.bypass(request)
+    response = _get_handler().get_response(request)
+    keys = pagecache.page_keys(request)
+    content = b"" if response.streaming else response.content
+    response.close()
+    return response.status_code, content, keys
+
+
+def _write_atomic(target, data):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write_page(path, content):
+    target = output_file(path)
+    _write_atomic(target, content)
+    _write_atomic(target.with_name(INDEX + ".gz"), gzip.compress(content, mtime=0))
+
+
+def remove_files(paths):
+    for path in paths:
+        target = output_file(path)
+        for name in (INDEX, INDEX + ".gz"):
+            target.with_name(name).unlink(missing_ok=True)
+
+
+def publish(path):
+    """Перерисовывает страницу и кладёт её на диск. False — страницы больше нет (удалена)."""
+    page, _ = PrerenderedPage.objects.get_or_create(path=path)
+    version = page.version
+    status, content, keys = render(path)
+    if status != 200:
+        remove_files([path])
+        page.delete()
+        return False
+
+    _write_page(path, content)
+    with transaction.atomic():
+        PrerenderedPage.objects.filter(pk=page.pk).update(rendered_version=version, rendered_at=timezone.now())
+        page.key_set.exclude(key__in=keys).delete()
+        known = set(page.key_set.values_list("key", flat=True))
+        PrerenderedKey.objects.bulk_create(PrerenderedKey(page=page, key=key) for key in set(keys) - known)
+    # Сброс пришёл во время рендера: файл мог собраться из старых данных
+    if not PrerenderedPage.objects.filter(pk=page.pk, version=version).exists():
+        remove_files([path])
+    return True
+
+
+# =========================
+#  Инвалидация и пересборка
+# =========================
+def mark_stale(keys):
+    """Помечает устаревшими страницы с любым из ``keys``; их файлы удаляются после коммита."""
+    if root() is None or not keys:
+        return 0
+    # Поиск по индексу (key, page) таблицы ключей, без просмотра всех страниц
+    pages = PrerenderedPage.objects.filter(key_set__key__in=set(keys))
+    paths = list(pages.values_list("path", flat=True).distinct())
+    if paths:
+        PrerenderedPage.objects.filter(path__in=paths).update(version=F("version") + 1)
+        transaction.on_commit(lambda: remove_files(paths))
+    return len(paths)
+
+
+def rebuild(full=False):
+    """
+    Синхронизирует каталог пререндера с сайтом: удаляет страницы исчезнувших
+    объектов, рисует новые и устаревшие (``full`` — все). {"rendered", "removed"}.
+    """
+    if root() is None:
+        raise RuntimeError("PRERENDER_ROOT не задан")
+    expected = set(site_paths())
+    known = set(PrerenderedPage.objects.values_list("path", flat=True))
+
+    gone = known - expected
+    remove_files(gone)
+    PrerenderedPage.objects.filter(path__in=gone).delete()
+
+    if full:
+        todo = expected
+    else:
+        stale = PrerenderedPage.objects.filter(rendered_version__lt=F("version")).values_list("path", flat=True)
+        todo = (expected - known) | (set(stale) & expected)
+
+    rendered = sum(1 for path in sorted(todo) if publish(path))
+    return {"rendered": rendered, "removed": len(gone)}
@@ -0,0 +1,150 @@
+"""
+Учёт SQL-запросов на каждый запрос: число, время в базе и повторяющиеся формы.
+
+``QueryTraceMiddleware`` ставит ``connection.execute_wrapper`` на все алиасы
+баз на время запроса. Обёртка считает запросы, их суммарное время и «отпечаток»
+SQL: параметры Django передаёт отдельно, поэтому отпечаток — сам текст запроса
+с нормализованными списками ``IN (%s, %s, …)`` и числовыми литералами
+(нормализация кэшируется по тексту). Отпечаток, повторённый за запрос
+``SQL_TRACE_N_PLUS_ONE`` раз и больше, — признак N+1: запрос в цикле по строкам.
+
+* Ответ получает заголовок ``Server-Timing: db;dur=…;desc="N queries", app;dur=…`` —
+  видно во вкладке Network браузера и в логах Caddy.
+* В лог ``core.querytrace`` пишется JSON-сводка для доли запросов
+  ``SQL_TRACE_SAMPLE``; найденный N+1 — предупреждением, не чаще раза в
+  ``FLAG_INTERVAL`` на пару (вьюха, отпечаток) в процессе.
+
+Накладные расходы — вызов обёртки, ``perf_counter`` и поиск в кэше на запрос к
+базе, поэтому учёт включён и в продакшене (``SQL_TRACE``).
+"""
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE = 5
+SAMPLE = 0.01
+FLAG_INTERVAL = 600
+TOP_SHAPES = 3
+
+IN_LIST_RE = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+NUMBER_RE = re.compile(r"(?<![\w\"'.])\d+(?:\.\d+)?\b")
+SPACE_RE = re.compile(r"\s+")
+
+# (вьюха, отпечаток) -> время последнего предупреждения
+_flagged = {}
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Форма запроса: одинакова для запросов, отличающихся только значениями."""
+    sql = IN_LIST_RE.sub("(...)", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    return SPACE_RE.sub(" ", sql).strip()
+
+
+class Trace:
+    """Обёртка ``execute_wrapper``: копит статистику запросов одного HTTP-запроса."""
+
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, threshold=N_PLUS_ONE):
+        """[(отпечаток, повторов), ...] форм, повторённых не меньше ``threshold`` раз."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def server_timing(trace, total):
+    return (
+        f'db;dur={trace.seconds * 1000:.1f};desc="{trace.count} queries", '
+        f"app;dur={max(total - trace.seconds, 0) * 1000:.1f}"
+    )
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return (match.view_name or match.route) if match else ""
+
+
+def summary(request, response, trace, total, repeated):
+    return {
+        "method": request.method,
+        "path": request.path,
+        "view": _view_name(request),
+        "status": response.status_code,
+        "queries": trace.count,
+        "db_ms": round(trace.seconds * 1000, 1),
+        "total_ms": round(total * 1000, 1),
+        "repeated": [{"sql": shape[:300], "count": count} for shape, count in repeated[:TOP_SHAPES]],
+    }
+
+
+def _should_flag(view, shape, now):
+    key = (view, shape)
+    if now - _flagged.get(key, 0) < FLAG_INTERVAL:
+        return False
+    _flagged[key] = now
+    return True
+
+
+def report(request, response, trace, total):
+    threshold = getattr(settings, "SQL_TRACE_N_PLUS_ONE", N_PLUS_ONE)
+    repeated = trace.repeated(threshold)
+    now = time.monotonic()
+    flagged = [item for item in repeated if _should_flag(_view_name(request), item[0], now)]
+    if flagged:
+        logger.warning("n+1 %s", json.dumps(summary(request, response, trace, total, flagged), ensure_ascii=False))
+    elif random.random() < getattr(settings, "SQL_TRACE_SAMPLE", SAMPLE):
+        logger.info("sql %s", json.dumps(summary(request, response, trace, total, repeated), ensure_ascii=False))
+
+
+class QueryTraceMiddleware:
+    """
+    Должен стоять первым в ``MIDDLEWARE``: тогда в учёт попадают и остальные
+    middleware (сессия, пользователь, кэш страниц), а сохранённая в кэше
+    страница не получает чужой ``Server-Timing``.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SQL_TRACE", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trace = Trace()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(trace))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        request.sql_trace = trace
+        timing = server_timing(trace, total)
+        if response.has_header("Server-Timing"):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response["Server-Timing"] = timing
+        report(request, response, trace, total)
+        return response
@@ -0,0 +1,241 @@
+"""
+Предрасчитанные «похожие» туры и услуги.
+
+Для каждого активного элемента хранится top-K (``TOP_K``) самых похожих в
+``tours.RelatedTour`` / ``services.RelatedService``; детальная страница
+достаёт их одним запросом по индексу ``(source, rank)``.
+
+Сходство двух элементов:
+
+  * ``WEIGHTS["category"]`` за каждую общую категорию;
+  * ``WEIGHTS["tag"]`` за каждый общий тег;
+  * ``WEIGHTS["location"]``, если совпадает локация;
+  * до ``WEIGHTS["price"]`` за близость цен (1 − |a − b| / max(a, b)).
+
+Кандидаты — только элементы с общей категорией, тегом или локацией (через
+обратные индексы, без перебора всех пар); цена лишь упорядочивает их.
+
+Пересчёт инкрементальный: сигналы core.signals копят id элементов, у которых
+изменились признаки (``FIELDS``, категории, теги), и после коммита транзакции
+(``schedule``) пересобирают списки только для них и их прежних соседей. Новым
+кандидатам достаточно сравнить изменённый элемент с их текущим top-K — без
+перебора всей группы. Признаки при этом читаются только для окрестности
+изменённых элементов (``_scope``), а не для всего каталога. ``rebuild_related`` пересобирает всё (нужен и после
+деплоя: инкрементальный пересчёт опирается на уже собранные списки).
+"""
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+from services.models import RelatedService, Service
+from tours.models import RelatedTour, Tour
+
+from . import pagecache
+from .cache import CATALOG, bump_generation
+
+TOP_K = 6
+# Поля элемента, от которых зависит сходство (кроме категорий и тегов)
+FIELDS = ("is_active", "location", "price_adult")
+WEIGHTS = {"category": 3.0, "tag": 1.5, "location": 2.0, "price": 1.5}
+
+LINK_MODELS = {Tour: RelatedTour, Service: RelatedService}
+
+
+def _normalize(location):
+    return " ".join((location or "").lower().replace("ё", "е").split())
+
+
+class Features:
+    """Признаки активных элементов модели (только из ``scope``, если задан): три запроса."""
+
+    def __init__(self, model, scope=None):
+        self.model = model
+        self.location = {}
+        self.price = {}
+        items = model.objects.filter(is_active=True)
+        if scope is not None:
+            items = items.filter(pk__in=scope)
+        for pk, location, price in items.values_list("pk", "location", "price_adult"):
+            self.location[pk] = _normalize(location)
+            self.price[pk] = float(price or 0)
+        self.categories = self._relation("categories", scope)
+        self.tags = self._relation("tags", scope)
+
+        self.by_category = self._invert(self.categories)
+        self.by_tag = self._invert(self.tags)
+        self.by_location = defaultdict(set)
+        for pk, location in self.location.items():
+            if location:
+                self.by_location[location].add(pk)
+
+    def _relation(self, name, scope=None):
+        field = self.model._meta.get_field(name)
+        through = field.remote_field.through
+        own, other = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+        result = defaultdict(set)
+        rows = through.objects.filter(**{f"{field.m2m_field_name()}__is_active": True})
+        if scope is not None:
+            rows = rows.filter(**{f"{own}__in": scope})
+        rows = rows.values_list(own, other)
+        for pk, value in rows:
+            result[pk].add(value)
+        return result
+
+    @staticmethod
+    def _invert(mapping):
+        inverted = defaultdict(set)
+        for pk, values in mapping.items():
+            for value in values:
+                inverted[value].add(pk)
+        return inverted
+
+    def __contains__(self, pk):
+        return pk in self.price
+
+    def candidates(self, pk):
+        found = set()
+        for category in self.categories.get(pk, ()):
+            found |= self.by_category[category]
+        for tag in self.tags.get(pk, ()):
+            found |= self.by_tag[tag]
+        if self.location.get(pk):
+            found |= self.by_location[self.location[pk]]
+        found.discard(pk)
+        return found
+
+    def score(self, a, b):
+        base = (
+            WEIGHTS["category"] * len(self.categories.get(a, set()) & self.categories.get(b, set()))
+            + WEIGHTS["tag"] * len(self.tags.get(a, set()) & self.tags.get(b, set()))
+            + (WEIGHTS["location"] if self.location[a] and self.location[a] == self.location[b] else 0)
+        )
+        if not base:
+            return 0.0
+        high = max(self.price[a], self.price[b])
+        proximity = 1 - abs(self.price[a] - self.price[b]) / high if high else 1.0
+        return base + WEIGHTS["price"] * proximity
+
+    def top(self, pk, k=TOP_K):
+        """[(target, score)] по убыванию сходства; при равенстве — более новые (больший id)."""
+        return self.rank(pk, self.candidates(pk), k)
+
+    def rank(self, pk, others, k=TOP_K):
+        """Лучшие ``k`` из ``others`` в порядке ``top()``."""
+        scored = ((self.score(pk, other), other) for other in others if other != pk and other in self)
+        ranked = sorted((item for item in scored if item[0] > 0), key=lambda item: (-item[0], -item[1]))
+        return [(other, score) for score, other in ranked[:k]]
+
+
+def rebuild(model, pks=None):
+    """
+    Пересобирает списки похожих для ``pks`` и всех, на кого влияет их изменение
+    (или для всей модели, если ``pks`` не задан). Возвращает число пересобранных источников.
+    """
+    link = LINK_MODELS[model]
+
+    if pks is None:
+        features = Features(model)
+        sources = set(features.price)
+        lists = {source: features.top(source) for source in sources}
+        stale = link.objects.all()
+    else:
+        pks = set(pks)
+        # Прежние соседи: элемент мог выпасть из их списка или сменить позицию
+        sources = pks | set(link.objects.filter(target_id__in=pks).values_list("source_id", flat=True))
+        features = Features(model, _scope(model, link, sources))
+        lists = {source: features.top(source) for source in sources if source in features}
+        # Новые кандидаты: элемент мог попасть в их top-K
+        candidates = set()
+        for pk in pks:
+            if pk in features:
+                candidates |= features.candidates(pk)
+        lists.update(_merged(link, features, candidates - sources, pks))
+        sources |= set(lists)
+        stale = link.objects.filter(source_id__in=sources)
+
+    rows = [
+        link(source_id=source, target_id=target, score=round(score, 4), rank=rank)
+        for source, top in lists.items()
+        for rank, (target, score) in enumerate(top)
+    ]
+    with transaction.atomic():
+        stale.delete()
+        link.objects.bulk_create(rows, batch_size=500)
+    # Блоки «похожих» на детальных страницах пересобранных источников
+    if pks is None:
+        pagecache.purge(pagecache.ALL)
+    else:
+        name = model._meta.model_name
+        pagecache.purge(*(f"related:{name}:{source}" for source in sources))
+    return len(sources)
+
+
+def _scope(model, link, seeds):
+    """
+    Элементы, признаки которых нужны для пересчёта ``seeds``: всё с общей
+    категорией, тегом или локацией (полные группы кандидатов ``seeds``) и
+    текущие списки этих кандидатов (для ``_merged``).
+    """
+    active = model.objects.filter(is_active=True)
+    scope = set(seeds)
+    for name in ("categories", "tags"):
+        shared = model.objects.filter(pk__in=seeds).values(name)
+        scope |= set(active.filter(**{f"{name}__in": shared}).values_list("pk", flat=True))
+    # Локации сравниваются после _normalize (кириллица в другом регистре, «ё»), а
+    # LOWER в SQLite не понимает кириллицу: читаем только пары (pk, локация)
+    rows = [(pk, _normalize(location)) for pk, location in active.exclude(location="").values_list("pk", "location")]
+    locations = {location for pk, location in rows if pk in seeds and location}
+    scope |= {pk for pk, location in rows if location in locations}
+    scope |= set(link.objects.filter(source_id__in=scope - set(seeds)).values_list("target_id", flat=True))
+    return scope
+
+
+def _merged(link, features, sources, pks):
+    """
+    Списки ``sources``, в которые попал кто-то из ``pks``. Остальных целей
+    изменение не касается, поэтому достаточно сравнить ``pks`` с текущим top-K.
+    """
+    current = defaultdict(list)
+    rows = link.objects.filter(source_id__in=sources).order_by("rank").values_list("source_id", "target_id")
+    for source, target in rows:
+        current[source].append(target)
+    changed = {}
+    for source in sources:
+        top = features.rank(source, set(current[source]) | pks)
+        if [target for target, _ in top] != current[source]:
+            changed[source] = top
+    return changed
+
+
+# =========================
+#  Отложенный пересчёт
+# =========================
+# Транзакции привязаны к соединению потока — накопленные id тоже по потокам
+_local = threading.local()
+
+
+def _pending():
+    if not hasattr(_local, "pending"):
+        _local.pending = defaultdict(set)
+    return _local.pending
+
+
+def schedule(model, *pks):
+    """Пересчитать списки для ``pks`` после коммита текущей транзакции (сразу — вне её)."""
+    if not pks:
+        return
+    _pending()[model].update(pks)
+    transaction.on_commit(flush)
+
+
+def flush():
+    # Несколько on_commit подряд: первый обрабатывает всё накопленное, остальные — пустые
+    pending = _pending()
+    if not pending:
+        return
+    while pending:
+        model, pks = pending.popitem()
+        rebuild(model, pks)
+    # Блоки «похожих» уже в новых данных — сбрасываем закэшированные страницы и ETag
+    bump_generation(CATALOG)
@@ -0,0 +1,85 @@
+"""
+Выборка N случайных записей без загрузки всей таблицы.
+
+Для каждого пространства имён в кэше лежит сводка (count, min_pk, max_pk).
+Если первичные ключи идут достаточно плотно, случайные ключи разыгрываются
+в диапазоне [min_pk, max_pk] и проверяются одним запросом ``pk__in``.
+Для разреженных таблиц (много удалённых/скрытых строк) используется
+закэшированный пул ID. Оба варианта пересобираются при смене поколения
+(см. core.signals), поэтому стоимость выборки не зависит от размера каталога.
+"""
+import math
+import random
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Min
+
+from .cache import versioned_key
+
+POOL_TIMEOUT = 60 * 60
+# Минимальная доля «живых» ключей в диапазоне, при которой выгоден розыгрыш по PK
+MIN_DENSITY = 0.25
+MAX_PROBE_ROUNDS = 3
+
+
+def pool_stats(namespace, queryset):
+    """Сводка по выборке: количество строк и границы первичных ключей."""
+    key = versioned_key(namespace, "stats")
+    stats = cache.get(key)
+    if stats is None:
+        stats = queryset.aggregate(count=Count("pk"), min_pk=Min("pk"), max_pk=Max("pk"))
+        cache.set(key, stats, POOL_TIMEOUT)
+    return stats
+
+
+def id_pool(namespace, queryset):
+    """Список первичных ключей выборки (кэшируется до смены поколения)."""
+    key = versioned_key(namespace, "ids")
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(queryset.order_by().values_list("pk", flat=True))
+        cache.set(key, ids, POOL_TIMEOUT)
+    return ids
+
+
+def _probe(queryset, stats, n):
+    """Розыгрыш ключей в диапазоне PK; возвращает найденные объекты в случайном порядке."""
+    lo, hi = stats["min_pk"], stats["max_pk"]
+    span = hi - lo + 1
+    density = stats["count"] / span
+    found, tried = {}, set()
+    for _ in range(MAX_PROBE_ROUNDS):
+        need = n - len(found)
+        if need <= 0 or len(tried) >= span:
+            break
+        size = min(span - len(tried), math.ceil(need / density * 1.5) + 2)
+        candidates = [pk for pk in random.sample(range(lo, hi + 1), size) if pk not in tried]
+        tried.update(candidates)
+        batch = queryset.in_bulk(candidates)
+        for pk in candidates:
+            if pk in batch and len(found) < n:
+                found[pk] = batch[pk]
+    return list(found.values())
+
+
+def random_sample(namespace, queryset, n):
+    """
+    До ``n`` случайных объектов из ``queryset``.
+    ``namespace`` должен инвалидироваться при изменении данных выборки.
+    """
+    stats = pool_stats(namespace, queryset)
+    total = stats["count"]
+    if not total or n <= 0:
+        return []
+    n = min(n, total)
+
+    span = stats["max_pk"] - stats["min_pk"] + 1
+    if total / span >= MIN_DENSITY:
+        objs = _probe(queryset, stats, n)
+        if len(objs) >= n:
+            return objs
+
+    ids = id_pool(namespace, queryset)
+    picked = random.sample(ids, min(n, len(ids)))
+    batch = queryset.in_bulk(picked)
+    return [batch[pk] for pk in picked if pk in batch]
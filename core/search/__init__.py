@@ -0,0 +1,85 @@
+"""
+Полнотекстовый поиск по турам и услугам.
+
+    from core.search import filter_queryset
+    qs = filter_queryset(Tour.objects.active(), request.GET.get("q"))
+
+Индекс обновляется сигналами (core.signals) и полностью перестраивается
+командой ``manage.py rebuild_search_index``.
+"""
+from django.db.models import Case, IntegerField, Q, When
+
+from .backends import backend_for
+from .documents import SEARCH_MODELS, build_document, iter_documents, kind_for_model
+
+# Сколько лучших совпадений забираем из индекса за один поиск
+SEARCH_LIMIT = 500
+
+
+def _icontains(qs, q):
+    return qs.filter(
+        Q(title__icontains=q)
+        | Q(short_desc__icontains=q)
+        | Q(description__icontains=q)
+        | Q(location__icontains=q)
+    )
+
+
+def filter_queryset(qs, q, ranked=True):
+    """
+    Оставляет в ``qs`` только найденные по ``q`` объекты.
+    При ``ranked=True`` результат упорядочен по релевантности
+    (последующий ``order_by`` эту сортировку заменяет).
+    """
+    q = (q or "").strip()
+    if not q:
+        return qs
+    kind = kind_for_model(qs.model)
+    backend = backend_for(qs.db)
+    if kind is None or not backend.uses_index:
+        return _icontains(qs, q)
+
+    ids = backend.search(kind, q, SEARCH_LIMIT)
+    qs = qs.filter(pk__in=ids)
+    if ranked and ids:
+        qs = qs.order_by(
+            Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)], output_field=IntegerField())
+        )
+    return qs
+
+
+def index_instance(instance):
+    kind = kind_for_model(type(instance))
+    if kind is not None:
+        backend_for(instance._state.db or "default").index(kind, instance.pk, build_document(instance))
+
+
+def remove_instance(instance):
+    kind = kind_for_model(type(instance))
+    if kind is not None:
+        backend_for(instance._state.db or "default").remove(kind, instance.pk)
+
+
+def reindex(model, pks):
+    """Переиндексирует объекты модели по списку id (например, после смены тега)."""
+    if not pks:
+        return
+    for instance in model.objects.filter(pk__in=pks).prefetch_related("categories", "tags"):
+        index_instance(instance)
+
+
+def rebuild(kind, alias="default"):
+    """Полная перестройка индекса одного типа; возвращает число документов."""
+    backend = backend_for(alias)
+    backend.clear(kind)
+    count = 0
+    for obj_id, document in iter_documents(kind):
+        backend.index(kind, obj_id, document)
+        count += 1
+    return count
+
+
+__all__ = [
+    "SEARCH_MODELS", "SEARCH_LIMIT", "filter_queryset",
+    "index_instance", "remove_instance", "reindex", "rebuild",
+]
@@ -0,0 +1,142 @@
+"""
+Бэкенды полнотекстового поиска.
+
+* SqliteFTSBackend   — виртуальная таблица FTS5, ранжирование BM25,
+  русская морфология через core.search.stemmer, префиксный поиск.
+* PostgresBackend    — таблица с сгенерированным tsvector (конфигурация
+  'russian') и GIN-индексом, ранжирование ts_rank_cd.
+* SimpleBackend      — без индекса, OR из icontains (для прочих СУБД).
+
+Таблица ``core_search_index`` создаётся миграцией core.0002_search_index.
+"""
+from django.db import connections
+
+from .documents import KIND_CODES
+from .stemmer import stem, stem_text, tokenize
+
+TABLE = "core_search_index"
+# Веса полей для BM25: kind, obj_id (не индексируются), title, location, terms, body
+BM25_WEIGHTS = "0, 0, 10.0, 4.0, 3.0, 1.0"
+
+
+class BaseSearchBackend:
+    uses_index = True
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    @property
+    def connection(self):
+        return connections[self.alias]
+
+    def index(self, kind, obj_id, document):
+        raise NotImplementedError
+
+    def remove(self, kind, obj_id):
+        raise NotImplementedError
+
+    def clear(self, kind):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s", [kind])
+
+    def search(self, kind, query, limit):
+        """Список id объектов ``kind`` по убыванию релевантности."""
+        raise NotImplementedError
+
+
+class SqliteFTSBackend(BaseSearchBackend):
+    @staticmethod
+    def _rowid(kind, obj_id):
+        # Детерминированный rowid: удаление по нему не сканирует всю таблицу
+        return obj_id * 16 + KIND_CODES[kind]
+
+    def index(self, kind, obj_id, document):
+        rowid = self._rowid(kind, obj_id)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, kind, obj_id, title, location, terms, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [
+                    rowid, kind, obj_id,
+                    stem_text(document["title"]),
+                    stem_text(document["location"]),
+                    stem_text(document["terms"]),
+                    stem_text(document["body"]),
+                ],
+            )
+
+    def remove(self, kind, obj_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [self._rowid(kind, obj_id)])
+
+    def search(self, kind, query, limit):
+        stems = [stem(token) for token in tokenize(query)]
+        if not stems:
+            return []
+        # Все слова обязательны, каждое — как префикс основы
+        match = " ".join(f'"{s}"*' for s in stems)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT obj_id FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s "
+                f"ORDER BY bm25({TABLE}, {BM25_WEIGHTS}) LIMIT %s",
+                [match, kind, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend(BaseSearchBackend):
+    def index(self, kind, obj_id, document):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {TABLE} (kind, obj_id, title, location, terms, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s) "
+                "ON CONFLICT (kind, obj_id) DO UPDATE SET "
+                "title = EXCLUDED.title, location = EXCLUDED.location, "
+                "terms = EXCLUDED.terms, body = EXCLUDED.body",
+                [kind, obj_id, document["title"], document["location"], document["terms"], document["body"]],
+            )
+
+    def remove(self, kind, obj_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s AND obj_id = %s", [kind, obj_id])
+
+    def search(self, kind, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        tsquery = " & ".join(f"{token}:*" for token in tokens)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT obj_id FROM {TABLE}, to_tsquery('russian', %s) query "
+                "WHERE kind = %s AND document @@ query "
+                "ORDER BY ts_rank_cd(document, query) DESC LIMIT %s",
+                [tsquery, kind, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SimpleBackend(BaseSearchBackend):
+    uses_index = False
+
+    def index(self, kind, obj_id, document):
+        pass
+
+    def remove(self, kind, obj_id):
+        pass
+
+    def clear(self, kind):
+        pass
+
+    def search(self, kind, query, limit):
+        return None
+
+
+BACKENDS = {
+    "sqlite": SqliteFTSBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def backend_for(alias="default"):
+    return BACKENDS.get(connections[alias].vendor, SimpleBackend)(alias)
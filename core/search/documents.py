@@ -0,0 +1,40 @@
+"""
+Что попадает в поисковый индекс: по одному документу на тур и услугу.
+
+Поля документа (по убыванию веса): title, location, terms (названия
+категорий и тегов), body (короткое и полное описание).
+"""
+from services.models import Service
+from tours.models import Tour
+
+# kind -> модель; номер kind входит в rowid индекса SQLite (см. backends)
+SEARCH_MODELS = {
+    "tour": Tour,
+    "service": Service,
+}
+KIND_CODES = {"tour": 1, "service": 2}
+
+
+def kind_for_model(model):
+    for kind, search_model in SEARCH_MODELS.items():
+        if model is search_model:
+            return kind
+    return None
+
+
+def build_document(instance) -> dict:
+    terms = [c.name for c in instance.categories.all()] + [t.name for t in instance.tags.all()]
+    return {
+        "title": instance.title,
+        "location": instance.location or "",
+        "terms": " ".join(terms),
+        "body": f"{instance.short_desc or ''}\n{instance.description or ''}",
+    }
+
+
+def iter_documents(kind, chunk_size=500):
+    """Все документы данного типа пачками — для полной перестройки индекса."""
+    model = SEARCH_MODELS[kind]
+    qs = model.objects.order_by("pk").prefetch_related("categories", "tags")
+    for instance in qs.iterator(chunk_size=chunk_size):
+        yield instance.pk, build_document(instance)
@@ -0,0 +1,127 @@
+"""
+Стеммер русского языка (алгоритм Snowball) и токенизация для поиска.
+
+Используется бэкендом SQLite FTS5, у которого нет встроенной морфологии:
+в индекс и в запрос попадают одинаково обрезанные основы слов,
+поэтому «пляж», «пляжи» и «пляжей» находят друг друга.
+"""
+import re
+
+VOWELS = "аеиоуыэюя"
+WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")           # после а/я
+PERFECTIVE_GERUND_2 = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+REFLEXIVE = ("ся", "сь")
+ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому",
+    "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")            # после а/я
+PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+VERB_1 = (                                              # после а/я
+    "ете", "йте", "ешь", "нно",
+    "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н",
+)
+VERB_2 = (
+    "ейте", "уйте",
+    "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют",
+    "ены", "ить", "ыть", "ишь",
+    "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю",
+)
+NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях",
+    "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья",
+    "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я",
+)
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+
+def _regions(word):
+    """Позиции начала RV и R2 (см. описание алгоритма Snowball)."""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    r2 = next_region(r1)
+    return rv, r2
+
+
+def _strip(word, rv, endings, preceded=False):
+    """
+    Отрезает самое длинное подходящее окончание внутри RV.
+    ``preceded`` — окончание должно идти после «а» или «я».
+    """
+    for ending in sorted(endings, key=len, reverse=True):
+        if not word.endswith(ending) or len(word) - len(ending) < rv:
+            continue
+        if preceded:
+            pos = len(word) - len(ending) - 1
+            if pos < rv or word[pos] not in "ая":
+                continue
+        return word[: len(word) - len(ending)], True
+    return word, False
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    if not any("а" <= ch <= "я" for ch in word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Шаг 1
+    word, done = _strip(word, rv, PERFECTIVE_GERUND_1, preceded=True)
+    if not done:
+        word, done = _strip(word, rv, PERFECTIVE_GERUND_2)
+    if not done:
+        word, _ = _strip(word, rv, REFLEXIVE)
+        word, done = _strip(word, rv, ADJECTIVE)
+        if done:
+            word, found = _strip(word, rv, PARTICIPLE_1, preceded=True)
+            if not found:
+                word, _ = _strip(word, rv, PARTICIPLE_2)
+        else:
+            word, done = _strip(word, rv, VERB_1, preceded=True)
+            if not done:
+                word, done = _strip(word, rv, VERB_2)
+            if not done:
+                word, _ = _strip(word, rv, NOUN)
+
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word, _ = _strip(word, max(rv, r2), DERIVATIONAL)
+
+    # Шаг 4
+    if word.endswith("нн") and len(word) - 1 >= rv:
+        word = word[:-1]
+    else:
+        word, done = _strip(word, rv, SUPERLATIVE)
+        if done and word.endswith("нн"):
+            word = word[:-1]
+        elif not done and word.endswith("ь") and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def tokenize(text: str):
+    """Слова текста в нижнем регистре (без стемминга)."""
+    return WORD_RE.findall((text or "").lower())
+
+
+def stem_text(text: str) -> str:
+    """Текст, в котором каждое слово заменено основой — для записи в индекс."""
+    return " ".join(stem(token) for token in tokenize(text))
@@ -0,0 +1,478 @@
+"""
+Инвалидация кэшей каталога и синхронизация поискового индекса.
+
+Каждая модель привязана к своим пространствам имён в core.cache; любое
+сохранение или удаление поднимает их поколение во всех воркерах сразу.
+Туры и услуги переиндексируются в core.search при сохранении, удалении,
+изменении их категорий/тегов и переименовании самих категорий и тегов.
+Счётчики активных элементов (core.counters) пересчитываются для затронутых
+категорий и тегов в той же транзакции, списки похожих (core.related) — после коммита.
+Закэшированные страницы (core.pagecache) сбрасываются по суррогатным ключам
+ровно тех объектов и коллекций, которые изменились; те же ключи помечают
+устаревшими страницы, выгруженные на диск (core.prerender).
+Счётчики ссылок на медиафайлы (core.media) следят за полями-файлами всех
+моделей; новые изображения ставятся в очередь на уменьшенные копии (core.imagejobs).
+"""
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from blog.models import BlogPost
+from news.models import NewsPost
+from prices.models import PricePDF
+from reviews.models import Review
+from services.models import Service, ServiceCategory
+from tours.models import Tour, TourCategory
+
+from . import counters, imagejobs, images, media, pagecache, prerender, related, search
+from .cache import CATALOG, bump_generation
+from .tree import moved, path_ids
+from .context_processors import SITE
+from .models import SiteSettings, Tag
+
+# «catalog» — общее поколение туров, услуг и их таксономий
+MODEL_NAMESPACES = {
+    Tour: ("tours", CATALOG),
+    Service: ("services", CATALOG),
+    TourCategory: (CATALOG,),
+    ServiceCategory: (CATALOG,),
+    Tag: (CATALOG,),
+    Review: ("reviews",),
+    BlogPost: ("blog",),
+    NewsPost: ("news",),
+    SiteSettings: (SITE,),
+}
+
+
+def _bump_for_instance(sender, **kwargs):
+    bump_generation(*MODEL_NAMESPACES[sender])
+
+
+def _bump_for_relations(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_generation(CATALOG)
+
+
+for _model in MODEL_NAMESPACES:
+    post_save.connect(_bump_for_instance, sender=_model, dispatch_uid=f"core_bump_{_model.__name__}_save")
+    post_delete.connect(_bump_for_instance, sender=_model, dispatch_uid=f"core_bump_{_model.__name__}_delete")
+
+for _model in (Tour, Service):
+    for _field in ("categories", "tags"):
+        m2m_changed.connect(
+            _bump_for_relations, sender=getattr(_model, _field).through,
+            dispatch_uid=f"core_bump_{_model.__name__}_{_field}",
+        )
+
+
+# =========================
+#  Поисковый индекс
+# =========================
+def _index_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_instance(instance)
+
+
+def _index_deleted(sender, instance, **kwargs):
+    search.remove_instance(instance)
+
+
+def _index_relations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            search.index_instance(instance)
+        return
+    # Изменение со стороны категории/тега: instance — категория, model — Tour/Service
+    if action == "pre_clear":
+        instance._search_cleared = list(getattr(instance, _related_name(model)).values_list("pk", flat=True))
+    elif action == "post_clear":
+        search.reindex(model, getattr(instance, "_search_cleared", []))
+    elif action in ("post_add", "post_remove"):
+        search.reindex(model, list(pk_set or ()))
+
+
+def _related_name(model):
+    return "tours" if model is Tour else "services"
+
+
+# Таксономии, чьи названия попадают в поле terms документа
+TAXONOMIES = {
+    TourCategory: (Tour,),
+    ServiceCategory: (Service,),
+    Tag: (Tour, Service),
+}
+
+
+def _taxonomy_related(instance):
+    return {
+        model: list(getattr(instance, _related_name(model)).values_list("pk", flat=True))
+        for model in TAXONOMIES[type(instance)]
+    }
+
+
+def _taxonomy_saved(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    for model, pks in _taxonomy_related(instance).items():
+        search.reindex(model, pks)
+
+
+def _taxonomy_deleting(sender, instance, **kwargs):
+    instance._search_related = _taxonomy_related(instance)
+
+
+def _taxonomy_deleted(sender, instance, **kwargs):
+    for model, pks in getattr(instance, "_search_related", {}).items():
+        search.reindex(model, pks)
+
+
+for _model in search.SEARCH_MODELS.values():
+    post_save.connect(_index_saved, sender=_model, dispatch_uid=f"core_search_{_model.__name__}_save")
+    post_delete.connect(_index_deleted, sender=_model, dispatch_uid=f"core_search_{_model.__name__}_delete")
+    for _field in ("categories", "tags"):
+        m2m_changed.connect(
+            _index_relations_changed, sender=getattr(_model, _field).through,
+            dispatch_uid=f"core_search_{_model.__name__}_{_field}",
+        )
+
+for _taxonomy in TAXONOMIES:
+    post_save.connect(_taxonomy_saved, sender=_taxonomy, dispatch_uid=f"core_search_{_taxonomy.__name__}_save")
+    pre_delete.connect(_taxonomy_deleting, sender=_taxonomy, dispatch_uid=f"core_search_{_taxonomy.__name__}_deleting")
+    post_delete.connect(_taxonomy_deleted, sender=_taxonomy, dispatch_uid=f"core_search_{_taxonomy.__name__}_deleted")
+
+
+# =========================
+#  Счётчики активных элементов
+# =========================
+def _counters_item_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._counters_was_active = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and "is_active" not in update_fields:
+        return
+    instance._counters_was_active = (
+        sender.objects.filter(pk=instance.pk).values_list("is_active", flat=True).first()
+    )
+
+
+def _counters_item_saved(sender, instance, created, raw=False, **kwargs):
+    # Новый элемент ещё без связей: счётчики изменятся при добавлении категорий/тегов
+    was_active = getattr(instance, "_counters_was_active", None)
+    if raw or created or was_active is None or was_active == instance.is_active:
+        return
+    for m2m, target in counters.counters_for(sender):
+        counters.recount(sender, m2m, counters.covered_ids(instance, m2m, target))
+
+
+def _counters_item_deleting(sender, instance, **kwargs):
+    # После удаления связи M2M уже стёрты — запоминаем затронутые строки заранее
+    instance._counters_covered = {
+        m2m: counters.covered_ids(instance, m2m, target) if instance.is_active else set()
+        for m2m, target in counters.counters_for(sender)
+    }
+
+
+def _counters_item_deleted(sender, instance, **kwargs):
+    for m2m, ids in getattr(instance, "_counters_covered", {}).items():
+        counters.recount(sender, m2m, ids)
+
+
+def _counters_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    item_model, m2m, target = COUNTER_RELATIONS[sender]
+    if action == "pre_clear":
+        instance._counters_cleared = (
+            counters.own_ids(instance) if reverse else counters.covered_ids(instance, m2m, target)
+        )
+    elif action == "post_clear":
+        counters.recount(item_model, m2m, getattr(instance, "_counters_cleared", ()))
+    elif action in ("post_add", "post_remove"):
+        if reverse:
+            counters.recount(item_model, m2m, counters.own_ids(instance))
+        elif instance.is_active:
+            counters.recount(item_model, m2m, counters.affected_ids(target, pk_set or ()))
+
+
+def _counters_node_moved(sender, instance, old_path, **kwargs):
+    # Перенос категории меняет поддеревья старых и новых предков; пути потомков
+    # к этому моменту уже переписаны
+    ids = set(path_ids(old_path)) | set(path_ids(instance.path))
+    for item_model, m2m in counters.counters_on(sender):
+        counters.recount(item_model, m2m, ids)
+
+
+def _counters_node_deleted(sender, instance, **kwargs):
+    ancestors = path_ids(instance.path)[:-1]
+    for item_model, m2m in counters.counters_on(sender):
+        counters.recount(item_model, m2m, ancestors)
+
+
+COUNTER_RELATIONS = {
+    getattr(item, m2m).through: (item, m2m, target)
+    for item, m2m, target, _ in counters.COUNTERS
+}
+
+for _model in (Tour, Service):
+    pre_save.connect(_counters_item_saving, sender=_model, dispatch_uid=f"core_counters_{_model.__name__}_saving")
+    post_save.connect(_counters_item_saved, sender=_model, dispatch_uid=f"core_counters_{_model.__name__}_save")
+    pre_delete.connect(_counters_item_deleting, sender=_model, dispatch_uid=f"core_counters_{_model.__name__}_deleting")
+    post_delete.connect(_counters_item_deleted, sender=_model, dispatch_uid=f"core_counters_{_model.__name__}_delete")
+
+for _through, (_item, _field, _target) in COUNTER_RELATIONS.items():
+    m2m_changed.connect(
+        _counters_relations_changed, sender=_through,
+        dispatch_uid=f"core_counters_{_item.__name__}_{_field}",
+    )
+
+for _node in (TourCategory, ServiceCategory):
+    moved.connect(_counters_node_moved, sender=_node, dispatch_uid=f"core_counters_{_node.__name__}_moved")
+    post_delete.connect(_counters_node_deleted, sender=_node, dispatch_uid=f"core_counters_{_node.__name__}_delete")
+
+
+# =========================
+#  Похожие туры и услуги
+# =========================
+def _related_item_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Правка текста или картинок сходство не меняет — пересчёт только по related.FIELDS
+    instance._related_old = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(related.FIELDS):
+        instance._related_old = {}
+        return
+    instance._related_old = sender.objects.filter(pk=instance.pk).values(*related.FIELDS).first()
+
+
+def _related_item_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_related_old", None)
+    if created or old is None or any(old[field] != getattr(instance, field) for field in old):
+        related.schedule(sender, instance.pk)
+
+
+def _related_item_deleting(sender, instance, **kwargs):
+    # Ссылки на элемент удалятся каскадно — соседей нужно запомнить до удаления
+    link = related.LINK_MODELS[sender]
+    neighbours = link.objects.filter(target=instance).values_list("source_id", flat=True)
+    related.schedule(sender, *neighbours)
+
+
+def _related_relations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            related.schedule(type(instance), instance.pk)
+        return
+    # Со стороны категории/тега: instance — категория или тег, model — Tour/Service
+    if action == "pre_clear":
+        related.schedule(model, *getattr(instance, _related_name(model)).values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        related.schedule(model, *(pk_set or ()))
+
+
+def _related_taxonomy_deleting(sender, instance, **kwargs):
+    # Связи M2M удаляются каскадом без m2m_changed
+    for model in TAXONOMIES[sender]:
+        related.schedule(model, *getattr(instance, _related_name(model)).values_list("pk", flat=True))
+
+
+for _model in related.LINK_MODELS:
+    pre_save.connect(_related_item_saving, sender=_model, dispatch_uid=f"core_related_{_model.__name__}_saving")
+    post_save.connect(_related_item_saved, sender=_model, dispatch_uid=f"core_related_{_model.__name__}_save")
+    pre_delete.connect(_related_item_deleting, sender=_model, dispatch_uid=f"core_related_{_model.__name__}_deleting")
+    for _field in ("categories", "tags"):
+        m2m_changed.connect(
+            _related_relations_changed, sender=getattr(_model, _field).through,
+            dispatch_uid=f"core_related_{_model.__name__}_{_field}",
+        )
+
+for _taxonomy in TAXONOMIES:
+    pre_delete.connect(
+        _related_taxonomy_deleting, sender=_taxonomy, dispatch_uid=f"core_related_{_taxonomy.__name__}_deleting",
+    )
+
+
+# =========================
+#  Полностраничный кэш
+# =========================
+# Коллекции страниц, которые перечисляют элементы модели (core.pagecache)
+PAGE_COLLECTIONS = {
+    Tour: ("tours", "prices"),
+    Service: ("services", "prices"),
+    Review: ("reviews",),
+    BlogPost: ("blog",),
+    NewsPost: ("news",),
+}
+PAGE_SIDEBARS = {Tour: "sidebar:tours", Service: "sidebar:services"}
+# Поля элемента, от которых зависят сайдбар (популярные) и меню (счётчики категорий)
+SIDEBAR_FIELDS = ("is_active", "is_popular", "rating")
+# Меню в шапке — корневые категории с ненулевым счётчиком (core.context_processors)
+NAV_ROOTS = {Tour: (TourCategory, "tours_count"), Service: (ServiceCategory, "services_count")}
+NAV_STATE_KEY = "pagecache:nav:{}"
+
+
+def _nav_keys(model):
+    """
+    ``NAV_KEY``, если изменился набор непустых корневых категорий — счётчик
+    корня перешёл через ноль. Ключ меню есть у каждой страницы, поэтому
+    обычная правка элемента его не сбрасывает. Прежний набор хранится в кэше;
+    если его там нет, меню сбрасывается на всякий случай.
+    """
+    category, field = NAV_ROOTS[model]
+    roots = sorted(category.objects.roots().filter(**{f"{field}__gt": 0}).values_list("pk", flat=True))
+    key = NAV_STATE_KEY.format(model._meta.model_name)
+    if cache.get(key) == roots:
+        return ()
+    cache.set(key, roots, None)
+    return (pagecache.NAV_KEY,)
+
+
+def _catalog_keys(model):
+    """Листинги, сайдбар и (если изменилось) меню категорий: всё, что меняется вместе с составом каталога."""
+    return (*PAGE_COLLECTIONS[model], PAGE_SIDEBARS[model], *_nav_keys(model))
+
+
+def _page_item_saving(sender, instance, raw=False, **kwargs):
+    instance._page_sidebar = None
+    if not raw and instance.pk is not None:
+        instance._page_sidebar = sender.objects.filter(pk=instance.pk).values_list(*SIDEBAR_FIELDS).first()
+
+
+def _page_item_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Листинги зависят почти от всех полей (поиск, фасеты, сортировки) — сбрасываются всегда
+    keys = [instance, *PAGE_COLLECTIONS[sender]]
+    current = tuple(getattr(instance, name) for name in SIDEBAR_FIELDS)
+    if created or getattr(instance, "_page_sidebar", None) != current:
+        keys += _catalog_keys(sender)
+    pagecache.purge(*keys)
+
+
+def _page_item_deleted(sender, instance, **kwargs):
+    pagecache.purge(instance, *_catalog_keys(sender))
+
+
+def _page_content_changed(sender, instance, **kwargs):
+    pagecache.purge(instance, *PAGE_COLLECTIONS[sender])
+
+
+def _page_relations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        pagecache.purge(instance, *_catalog_keys(type(instance)))
+        return
+    # Со стороны категории/тега: детальные страницы прежних элементов помечены
+    # ключом категории, новых — своими ключами из pk_set
+    items = [f"{model._meta.model_name}:{pk}" for pk in pk_set or ()]
+    pagecache.purge(instance, *items, *_catalog_keys(model))
+
+
+def _page_taxonomy_changed(sender, instance, **kwargs):
+    # Названия, слаги и порядок категорий видны в меню; теги в нём не показываются
+    keys = [instance] if sender is Tag else [instance, pagecache.NAV_KEY]
+    for model in TAXONOMIES[sender]:
+        keys += _catalog_keys(model)
+    pagecache.purge(*keys)
+
+
+def _page_site_changed(sender, instance, **kwargs):
+    pagecache.purge(pagecache.SITE_KEY)
+
+
+def _page_prices_changed(sender, instance, **kwargs):
+    pagecache.purge("prices")
+
+
+for _model in (Tour, Service):
+    pre_save.connect(_page_item_saving, sender=_model, dispatch_uid=f"core_page_{_model.__name__}_saving")
+    post_save.connect(_page_item_saved, sender=_model, dispatch_uid=f"core_page_{_model.__name__}_save")
+    post_delete.connect(_page_item_deleted, sender=_model, dispatch_uid=f"core_page_{_model.__name__}_delete")
+    for _field in ("categories", "tags"):
+        m2m_changed.connect(
+            _page_relations_changed, sender=getattr(_model, _field).through,
+            dispatch_uid=f"core_page_{_model.__name__}_{_field}",
+        )
+
+for _model in (Review, BlogPost, NewsPost):
+    post_save.connect(_page_content_changed, sender=_model, dispatch_uid=f"core_page_{_model.__name__}_save")
+    post_delete.connect(_page_content_changed, sender=_model, dispatch_uid=f"core_page_{_model.__name__}_delete")
+
+for _taxonomy in TAXONOMIES:
+    post_save.connect(_page_taxonomy_changed, sender=_taxonomy, dispatch_uid=f"core_page_{_taxonomy.__name__}_save")
+    post_delete.connect(
+        _page_taxonomy_changed, sender=_taxonomy, dispatch_uid=f"core_page_{_taxonomy.__name__}_delete",
+    )
+
+for _signal, _action in ((post_save, "save"), (post_delete, "delete")):
+    _signal.connect(_page_site_changed, sender=SiteSettings, dispatch_uid=f"core_page_SiteSettings_{_action}")
+    _signal.connect(_page_prices_changed, sender=PricePDF, dispatch_uid=f"core_page_PricePDF_{_action}")
+
+
+def _prerender_purged(sender, keys, **kwargs):
+    prerender.mark_stale(keys)
+
+
+pagecache.purged.connect(_prerender_purged, dispatch_uid="core_prerender_purged")
+
+
+
+# =========================
+#  Ссылки на медиафайлы
+# =========================
+def _media_saving(sender, instance, raw=False, **kwargs):
+    # Прежние имена файлов: счётчики и копии заменённых файлов (ниже)
+    instance._media_old = {}
+    if not raw and instance.pk is not None:
+        fields = media.fields_of(sender)
+        instance._media_old = sender._default_manager.filter(pk=instance.pk).values(*fields).first() or {}
+
+
+def _media_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_media_old", {})
+    for field in media.fields_of(sender):
+        name = getattr(instance, field).name or ""
+        previous = old.get(field) or ""
+        if name != previous:
+            media.acquire(name)
+            media.release(previous)
+
+
+def _media_deleted(sender, instance, **kwargs):
+    media.release(*(getattr(instance, field).name for field in media.fields_of(sender)))
+
+
+for _model, _fields in media.file_fields():
+    pre_save.connect(_media_saving, sender=_model, dispatch_uid=f"core_media_{_model.__name__}_saving")
+    post_save.connect(_media_saved, sender=_model, dispatch_uid=f"core_media_{_model.__name__}_save")
+    post_delete.connect(_media_deleted, sender=_model, dispatch_uid=f"core_media_{_model.__name__}_delete")
+
+
+# =========================
+#  Копии изображений
+# =========================
+def _images_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Прежние имена собраны в _media_saving: копии старого файла удаляются,
+    # когда на него больше никто не ссылается
+    old = getattr(instance, "_media_old", {})
+    for field in images.image_fields_for(sender):
+        name = getattr(instance, field).name or ""
+        previous = old.get(field) or ""
+        if name != previous or (name and not images.asset_info(name)):
+            # Копии создаёт воркер process_images — сохранение не ждёт обработки
+            imagejobs.replace(name, previous, imagejobs.page_keys(instance))
+
+
+def _images_deleted(sender, instance, **kwargs):
+    for field in images.image_fields_for(sender):
+        name = getattr(instance, field).name
+        if name:
+            imagejobs.drop(name)
+
+
+for _model in dict(images.IMAGE_FIELDS):
+    post_save.connect(_images_saved, sender=_model, dispatch_uid=f"core_images_{_model.__name__}_save")
+    post_delete.connect(_images_deleted, sender=_model, dispatch_uid=f"core_images_{_model.__name__}_delete")
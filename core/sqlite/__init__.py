@@ -0,0 +1,19 @@
+"""
+Бэкенд SQLite для продакшена: ``ENGINE = 'core.sqlite'``.
+
+Стандартный бэкенд открывает базу с настройками SQLite по умолчанию (журнал
+``DELETE``: запись блокирует чтение), а без ``CONN_MAX_AGE`` — заново на каждый
+запрос. Этот бэкенд при открытии соединения выставляет профиль PRAGMA
+(``PRAGMAS``, дополняется ``OPTIONS["pragmas"]``):
+
+* ``journal_mode=WAL`` — чтение не ждёт запись и наоборот;
+* ``busy_timeout`` — конкурирующая запись ждёт, а не падает с ``database is locked``;
+* ``synchronous=NORMAL`` — в WAL безопасно при сбое процесса, fsync только на checkpoint;
+* ``mmap_size``, ``cache_size``, ``temp_store=MEMORY`` — меньше системных вызовов
+  и временных файлов на сортировках.
+
+``OPTIONS["read_only"]`` открывает базу только на чтение (``mode=ro``,
+``query_only``). Такое соединение — отдельный алиас ``replica`` с тем же файлом,
+на него чтения отправляет ``routers.ReadReplicaRouter``. Вместе с
+``CONN_MAX_AGE`` соединения живут в воркере между запросами.
+"""
@@ -0,0 +1,35 @@
+from urllib.parse import quote
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "busy_timeout": 5000,
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20000,  # в КиБ: ~20 МБ на соединение
+    "temp_store": "MEMORY",
+}
+# journal_mode хранится в файле базы; менять его может только пишущее соединение
+WRITE_ONLY_PRAGMAS = ("journal_mode",)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Свои ключи OPTIONS не должны дойти до sqlite3.connect()
+        self.pragmas = {**PRAGMAS, **params.pop("pragmas", {})}
+        self.read_only = bool(params.pop("read_only", False))
+        if self.read_only and not self.is_in_memory_db():
+            params["database"] = f"file:{quote(str(params['database']))}?mode=ro"
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if self.read_only and name in WRITE_ONLY_PRAGMAS:
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
@@ -0,0 +1,66 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connections
+
+READ = "replica"
+WRITE = "default"
+
+SAFE_METHODS = ("GET", "HEAD")
+
+_local = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    """Разрешает чтения из ``replica`` в текущем потоке на время блока."""
+    previous = getattr(_local, "enabled", False)
+    _local.enabled = True
+    try:
+        yield
+    finally:
+        _local.enabled = previous
+
+
+class ReadReplicaRouter:
+    """
+    Чтения — в соединение только для чтения ``replica`` (тот же файл SQLite),
+    запись и миграции — в ``default``.
+
+    ``replica`` читают только GET/HEAD-запросы (``ReplicaReadsMiddleware``).
+    Воркеры, команды управления и POST пишут и тут же перечитывают записанное;
+    чтение через второе соединение со своим снимком WAL (например, пока
+    открыт ``.iterator()``) могло бы этих изменений не увидеть, поэтому вне
+    ``replica_reads()`` всё идёт в ``default``.
+
+    Внутри транзакции ``default`` (сохранение в админке, ``select_for_update``)
+    чтение остаётся в ней: иначе оно не увидит ещё не зафиксированные изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_local, "enabled", False) or connections[WRITE].in_atomic_block:
+            return WRITE
+        return READ
+
+    def db_for_write(self, model, **hints):
+        return WRITE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Обе базы — один файл
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == WRITE
+
+
+class ReplicaReadsMiddleware:
+    """Отправляет чтения безопасных запросов в ``replica`` (см. ``ReadReplicaRouter``)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            return self.get_response(request)
+        with replica_reads():
+            return self.get_response(request)
@@ -0,0 +1,64 @@
+"""
+Хранилище медиафайлов с адресацией по содержимому.
+
+Загруженный файл сохраняется под именем из хэша своих байтов:
+``cas/3f/3fa9…c1.jpg`` вместо ``tours/gallery/photo_Ab12Cd.jpg``. Повторная
+загрузка тех же байтов (одно фото в туре, услуге и галерее) не пишет новый
+файл — поле получает имя уже существующего. Содержимое по имени никогда не
+меняется, поэтому Caddy отдаёт ``/media/cas/`` с ``Cache-Control: immutable``.
+
+Имена внутри ``cas/`` пишутся как есть: это производные файлы, имя которых уже
+выведено из адресованного (копии core.images ``cas/3f/3fa9…c1.640w.webp``).
+Счётчики ссылок и удаление осиротевших файлов — core.media.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+PREFIX = "cas"
+DIGEST_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+# Расширение сохраняется для Content-Type при раздаче; подозрительные отбрасываются
+EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+
+def is_content_addressed(name):
+    return name.replace("\\", "/").startswith(PREFIX + "/")
+
+
+def content_name(digest, original_name):
+    ext = posixpath.splitext(original_name)[1].lower()
+    if not EXTENSION_RE.match(ext):
+        ext = ""
+    return f"{PREFIX}/{digest[:2]}/{digest}{ext}"
+
+
+def file_digest(content):
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for chunk in content.chunks(CHUNK_SIZE):
+        hasher.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Имя загрузки всё равно заменяется хэшем — проверять занятость незачем
+        if not is_content_addressed(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if is_content_addressed(name):
+            return super()._save(name, content)
+        target = content_name(file_digest(content), name)
+        if self.exists(target):
+            # Тот же файл уже есть. Свежий mtime защищает его от sweep_media,
+            # пока объект с новой ссылкой ещё не сохранён
+            os.utime(self.path(target))
+            return target
+        return super()._save(target, content)
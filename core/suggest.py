@@ -0,0 +1,126 @@
+"""
+Подсказки при наборе (``/api/suggest/``) из префиксного индекса в памяти процесса.
+
+Индекс — отсортированный список ключей и параллельный массив номеров записей;
+поиск по префиксу — это ``bisect`` и короткий проход вперёд. Каждая запись
+индексируется целиком и с начала каждого своего слова, поэтому «пхи» находит
+«Острова Пхи-Пхи». Индекс строится при старте воркера (config.wsgi) или при
+первом запросе и пересобирается, когда меняется поколение каталога
+(core.cache.CATALOG). Обработка запроса не обращается к базе данных.
+"""
+import bisect
+import re
+import threading
+import time
+from array import array
+from urllib.parse import urlencode
+
+from django.urls import reverse
+
+from services.models import Service, ServiceCategory
+from tours.models import Tour, TourCategory
+
+from .cache import CATALOG, get_generation
+from .models import Tag
+
+WORD_START_RE = re.compile(r"[^\W_]+", re.UNICODE)
+# Чем меньше, тем выше в выдаче
+TYPE_RANK = {
+    "tour": 0, "service": 1, "tour_category": 2,
+    "service_category": 3, "location": 4, "tag": 5,
+}
+MAX_CANDIDATES = 200
+# Как часто (сек.) сверять поколение каталога с общим кэшем
+CHECK_INTERVAL = 1.0
+
+
+def normalize(text: str) -> str:
+    return " ".join((text or "").lower().replace("ё", "е").split())
+
+
+class PrefixIndex:
+    def __init__(self, entries):
+        # entries: список (type, label, url)
+        self.entries = entries
+        self.labels = [normalize(label) for _, label, _ in entries]
+        pairs = []
+        for pos, text in enumerate(self.labels):
+            starts = {0} | {m.start() for m in WORD_START_RE.finditer(text)}
+            for start in starts:
+                pairs.append((text[start:], pos))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.positions = array("I", (pos for _, pos in pairs))
+
+    def lookup(self, query, limit=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = {}
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(found) < MAX_CANDIDATES and self.keys[i].startswith(prefix):
+            pos = self.positions[i]
+            if pos not in found:
+                kind, label, _ = self.entries[pos]
+                # Совпадение с начала всей строки важнее совпадения с начала слова
+                found[pos] = (not self.labels[pos].startswith(prefix), TYPE_RANK[kind], len(label), label)
+            i += 1
+        ranked = sorted(found, key=found.get)[:limit]
+        return [
+            {"type": self.entries[pos][0], "label": self.entries[pos][1], "url": self.entries[pos][2]}
+            for pos in ranked
+        ]
+
+
+def collect_entries():
+    """Все подсказки каталога: по одному запросу на источник."""
+    entries = []
+    locations = {}
+
+    for title, slug, location in Tour.objects.filter(is_active=True).values_list("title", "slug", "location"):
+        entries.append(("tour", title, reverse("tours:detail", kwargs={"slug": slug})))
+        if location:
+            locations.setdefault(normalize(location), (location, reverse("tours:list")))
+    for title, slug, location in Service.objects.filter(is_active=True).values_list("title", "slug", "location"):
+        entries.append(("service", title, reverse("services:detail", kwargs={"slug": slug})))
+        if location:
+            locations.setdefault(normalize(location), (location, reverse("services:list")))
+    for name, slug in TourCategory.objects.values_list("name", "slug"):
+        entries.append(("tour_category", name, reverse("tours:by_category", kwargs={"slug": slug})))
+    for name, slug in ServiceCategory.objects.values_list("name", "slug"):
+        entries.append(("service_category", name, reverse("services:by_category", kwargs={"slug": slug})))
+    for name, slug in Tag.objects.values_list("name", "slug"):
+        entries.append(("tag", name, reverse("tours:by_tag", kwargs={"slug": slug})))
+
+    for location, list_url in locations.values():
+        entries.append(("location", location, f"{list_url}?{urlencode({'q': location})}"))
+    return entries
+
+
+_lock = threading.Lock()
+_state = {"index": None, "generation": None, "checked_at": 0.0}
+
+
+def get_index():
+    """Актуальный индекс процесса; пересобирается при смене поколения каталога."""
+    now = time.monotonic()
+    if _state["index"] is not None and now - _state["checked_at"] < CHECK_INTERVAL:
+        return _state["index"]
+
+    generation = get_generation(CATALOG)
+    _state["checked_at"] = now
+    if _state["index"] is None or generation != _state["generation"]:
+        with _lock:
+            if _state["index"] is None or generation != _state["generation"]:
+                _state["index"] = PrefixIndex(collect_entries())
+                _state["generation"] = generation
+    return _state["index"]
+
+
+def suggest(query, limit=10):
+    return get_index().lookup(query, limit)
+
+
+def reset():
+    """Сбрасывает индекс процесса (для тестов)."""
+    _state.update(index=None, generation=None, checked_at=0.0)
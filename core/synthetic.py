@@ -0,0 +1,224 @@
+"""
+Синтетический каталог для нагрузочных замеров (``generate_catalog``).
+
+``insert(scale, seed)`` наполняет базу турами, услугами, деревьями категорий,
+тегами, галереями, отзывами, статьями, новостями и заявками. Размер растёт
+линейно со ``scale``: при ``scale=10`` — 10 000 туров, 500 категорий туров и
+50 000 отзывов. Данные детерминированы: один и тот же ``seed`` даёт тот же
+каталог, поэтому замеры разных версий кода сравнимы между собой.
+
+Строки вставляются ``bulk_create`` пачками, в обход ``save()`` и сигналов: по
+одному INSERT на объект 10 000 туров создавались бы десятки минут. Поэтому
+после вставки производное состояние пересчитывается целиком теми же
+командами, что и после ручных правок в базе: пути категорий и счётчики
+(``rebuild_category_paths``), поисковый индекс и похожие туры.
+
+Сгенерированные объекты помечены: слаг начинается с ``gen-``, email отзывов и
+заявок — на домене ``load.test``. ``remove()`` удаляет только их.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from blog.models import BlogPost
+from news.models import NewsPost
+from reviews.models import Review
+from services.models import Service, ServiceCategory, ServiceImage
+from tours.models import Tour, TourCategory, TourImage
+
+from .models import Lead, Tag
+
+PREFIX = "gen-"
+EMAIL_DOMAIN = "load.test"
+BATCH = 1000
+
+# Количество объектов на единицу ``scale``
+TOURS = 1000
+TOUR_ROOTS = 10
+SERVICES = 200
+SERVICE_ROOTS = 4
+CHILDREN = 4
+TAGS = 20
+GALLERY = 4
+REVIEWS = 5000
+POSTS = 100
+NEWS = 50
+LEADS = 500
+
+PLACES = (
+    "Пхукет", "Краби", "Пхи-Пхи", "Симиланы", "Пханг Нга", "Ко Яо", "Джеймс Бонд",
+    "Као Лак", "Ко Самуи", "Чалонг", "Патонг", "Ката", "Раваи", "Най Харн",
+)
+KINDS = ("Экскурсия", "Морская прогулка", "Сафари", "Дайвинг", "Рыбалка", "Трекинг", "Каякинг", "Тур")
+TOPICS = ("Острова", "Природа", "Культура", "Активный отдых", "Семейный отдых", "Гастрономия", "Море", "Горы")
+SERVICE_KINDS = ("Трансфер", "Аренда байка", "Фотосессия", "Массаж", "Аренда яхты", "Гид")
+ADJECTIVES = ("Большая", "Вечерняя", "VIP", "Групповая", "Индивидуальная", "Утренняя", "Лучшая")
+WORDS = (
+    "пляж", "лагуна", "закат", "снорклинг", "обед", "трансфер", "гид", "остров", "пещера",
+    "храм", "водопад", "джунгли", "рынок", "смотровая", "каяк", "лодка", "залив", "риф",
+)
+NAMES = ("Анна", "Иван", "Мария", "Олег", "Елена", "Дмитрий", "Ольга", "Сергей", "Наталья", "Павел")
+
+
+def _count(base, scale):
+    return max(1, round(base * scale))
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _price(rng, low, high):
+    return Decimal(rng.randrange(low, high, 50))
+
+
+def _bulk(model, objs):
+    return model.objects.bulk_create(objs, batch_size=BATCH)
+
+
+def _link(field, pairs):
+    """Связи M2M пачкой: ``pairs`` — (id объекта, id связанного)."""
+    through = field.remote_field.through
+    source, target = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+    through.objects.bulk_create(
+        [through(**{source: a, target: b}) for a, b in pairs], batch_size=BATCH, ignore_conflicts=True,
+    )
+
+
+def _tree(model, prefix, topics, roots):
+    """Корни с ``CHILDREN`` подкатегориями; возвращает (корни, листья)."""
+    top = _bulk(model, [
+        model(name=f"{topics[i % len(topics)]} {i + 1}", slug=f"{PREFIX}{prefix}-{i}") for i in range(roots)
+    ])
+    leaves = _bulk(model, [
+        model(name=f"{root.name}.{j + 1}", slug=f"{root.slug}-{j}", parent_id=root.pk)
+        for root in top for j in range(CHILDREN)
+    ])
+    return top, leaves
+
+
+def _items(model, rng, count, prefix, title, **fields):
+    """Туры или услуги: общие поля, ``fields`` — функции (rng, i) для остальных."""
+    objs = []
+    for i in range(count):
+        place = rng.choice(PLACES)
+        price = _price(rng, 500, 15000)
+        obj = model(
+            title=f"{title(rng)} {place} {i + 1}", slug=f"{PREFIX}{prefix}-{i}",
+            short_desc=_text(rng, 12), description="\n\n".join(_text(rng, 40) for _ in range(4)),
+            location=place, price_adult=price, price_child=(price / 2).quantize(Decimal("1")),
+            price_old_adult=price + 500 if rng.random() < 0.2 else None,
+            rating=Decimal(rng.randrange(35, 51)) / 10, reviews_count=rng.randrange(0, 300),
+            is_popular=rng.random() < 0.05, is_active=rng.random() < 0.95,
+            cover=f"{prefix}s/covers/{PREFIX}{prefix}-{i}.jpg",
+        )
+        for name, build in fields.items():
+            setattr(obj, name, build(rng, i))
+        objs.append(obj)
+    return _bulk(model, objs)
+
+
+def _relations(rng, model, items, categories, tags):
+    _link(model._meta.get_field("categories"), [
+        (item.pk, category.pk) for item in items for category in rng.sample(categories, rng.randint(1, 2))
+    ])
+    _link(model._meta.get_field("tags"), [
+        (item.pk, tag.pk) for item in items for tag in rng.sample(tags, rng.randint(1, min(4, len(tags))))
+    ])
+
+
+def _gallery(model, fk, items, folder):
+    _bulk(model, [
+        model(**{fk: item.pk}, image=f"{folder}/{item.slug}-{j}.jpg", order=j)
+        for item in items for j in range(GALLERY)
+    ])
+
+
+def existing():
+    """Сколько сгенерированных туров уже есть в базе."""
+    return Tour.objects.filter(slug__startswith=PREFIX).count()
+
+
+def remove():
+    """Удаляет сгенерированные объекты (через ORM — сигналы поддерживают производные данные)."""
+    for model in (Tour, Service, BlogPost, NewsPost, TourCategory, ServiceCategory, Tag):
+        model.objects.filter(slug__startswith=PREFIX).delete()
+    for model in (Review, Lead):
+        model.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").delete()
+
+
+@transaction.atomic
+def insert(scale=1, seed=1):
+    """Вставляет строки каталога. Возвращает {модель: количество}."""
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    tags = _bulk(Tag, [Tag(name=f"{rng.choice(WORDS)} {i + 1}", slug=f"{PREFIX}tag-{i}") for i in range(_count(TAGS, scale))])
+    tour_roots, tour_leaves = _tree(TourCategory, "tours", TOPICS, _count(TOUR_ROOTS, scale))
+    service_roots, service_leaves = _tree(ServiceCategory, "services", SERVICE_KINDS, _count(SERVICE_ROOTS, scale))
+
+    tours = _items(
+        Tour, rng, _count(TOURS, scale), "tour",
+        title=lambda rng: f"{rng.choice(ADJECTIVES)} {rng.choice(KINDS).lower()}",
+        duration=lambda rng, i: rng.choice(("4 часа", "1 день", "2 дня / 1 ночь", "3 дня / 2 ночи")),
+    )
+    # Большинство туров — в подкатегориях, часть — прямо в корне
+    _relations(rng, Tour, tours, tour_leaves * 3 + tour_roots, tags)
+    _gallery(TourImage, "tour_id", tours, "tours/gallery")
+
+    services = _items(
+        Service, rng, _count(SERVICES, scale), "service",
+        title=lambda rng: rng.choice(SERVICE_KINDS),
+        price_extra=lambda rng, i: _price(rng, 100, 1000) if rng.random() < 0.3 else None,
+    )
+    _relations(rng, Service, services, service_leaves * 3 + service_roots, tags)
+    _gallery(ServiceImage, "service_id", services, "services/gallery")
+
+    reviews = _bulk(Review, [
+        Review(
+            name=rng.choice(NAMES), email=f"guest{i}@{EMAIL_DOMAIN}", message=_text(rng, rng.randint(10, 60)),
+            is_approved=rng.random() < 0.8,
+        )
+        for i in range(_count(REVIEWS, scale))
+    ])
+    posts = _bulk(BlogPost, [
+        BlogPost(
+            title=f"{rng.choice(PLACES)}: {_text(rng, 4)[:-1]}", slug=f"{PREFIX}post-{i}",
+            content="\n\n".join(_text(rng, 60) for _ in range(6)), is_published=rng.random() < 0.9,
+            cover=f"blog/covers/{PREFIX}post-{i}.jpg",
+        )
+        for i in range(_count(POSTS, scale))
+    ])
+    news = _bulk(NewsPost, [
+        NewsPost(
+            title=f"{rng.choice(PLACES)}: {_text(rng, 4)[:-1]}", slug=f"{PREFIX}news-{i}",
+            content="\n\n".join(_text(rng, 50) for _ in range(3)), is_published=True,
+            cover=f"news/covers/{PREFIX}news-{i}.jpg",
+        )
+        for i in range(_count(NEWS, scale))
+    ])
+    leads = _bulk(Lead, [
+        Lead(
+            created_at=now - timedelta(minutes=rng.randrange(60 * 24 * 90)),
+            name=rng.choice(NAMES), phone=f"+66 8{rng.randrange(10**8):08d}", email=f"lead{i}@{EMAIL_DOMAIN}",
+            message=_text(rng, 8), cta="Забронировать",
+            related_type="tour", related_id=rng.choice(tours).pk, status=rng.choice(("sent", "done")),
+        )
+        for i in range(_count(LEADS, scale))
+    ])
+    return {
+        Tag: len(tags), TourCategory: len(tour_roots) + len(tour_leaves),
+        ServiceCategory: len(service_roots) + len(service_leaves), Tour: len(tours),
+        TourImage: len(tours) * GALLERY, Service: len(services), ServiceImage: len(services) * GALLERY,
+        Review: len(reviews), BlogPost: len(posts), NewsPost: len(news), Lead: len(leads),
+    }
+
+
+def rebuild(stdout=None):
+    """Производные данные после вставки в обход сигналов."""
+    for command in ("rebuild_category_paths", "rebuild_search_index", "rebuild_related"):
+        call_command(command, stdout=stdout)
@@ -0,0 +1,95 @@
+"""
+Адаптивные изображения из копий core.images.
+
+    {% load images %}
+    {% picture tour.cover alt=tour.title sizes="(max-width: 576px) 100vw, 33vw" css_class="t-card__img" %}
+    <div style="background-image:url({{ tour.cover|image_url:1280 }})">
+    <div style="{{ tour.cover|image_background:1280 }}">
+
+``picture`` отдаёт ``<picture>`` с ``<source>`` на каждый формат копий и ``<img>``
+с запасным JPEG; пока копий нет — обычный ``<img>`` с оригиналом. У обработанных
+файлов ``<img>`` получает ``width``/``height`` оригинала (браузер резервирует
+место по пропорциям) и фон из преобладающего цвета и заглушки — до загрузки
+картинки блок уже закрашен. ``image_background`` даёт то же для CSS-фонов.
+Размеры и заглушка берутся из ImageAsset (core.images), файлы не открываются.
+"""
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from core import images
+
+register = template.Library()
+
+# Карточки: одна колонка на телефоне, две на планшете, три на десктопе
+CARD_SIZES = "(max-width: 576px) 100vw, (max-width: 1200px) 50vw, 33vw"
+# Ширина <img src> для браузеров без srcset
+FALLBACK_WIDTH = 640
+
+
+def _img(**attrs):
+    # alt выводится всегда (пустой — декоративная картинка), прочие — только заданные
+    alt = attrs.pop("alt")
+    attrs = {name.replace("css_class", "class"): value for name, value in attrs.items() if value}
+    return format_html('<img alt="{}"{} decoding="async">', alt, flatatt(attrs))
+
+
+def _placeholder_style(info):
+    """Фон до загрузки: цвет и растянутая заглушка."""
+    parts = []
+    if info.get("color"):
+        parts.append(f"background-color:{info['color']}")
+    if info.get("placeholder"):
+        parts.append(f"background-image:url({info['placeholder']});background-size:cover")
+    return ";".join(parts)
+
+
+@register.simple_tag
+def picture(image, alt="", sizes=CARD_SIZES, css_class="", style="", loading="lazy"):
+    if not image:
+        return ""
+    name = image.name
+    info = images.asset_info(name)
+    sets = {fmt: images.srcset(name, fmt) for fmt in images.FORMATS}
+    fallback = sets[images.FALLBACK]
+    if not fallback:
+        return _img(src=image.url, alt=alt, css_class=css_class, style=style, loading=loading)
+    sources = format_html_join(
+        "", '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (images.FORMATS[fmt][2], srcset, sizes)
+            for fmt, srcset in sets.items() if fmt != images.FALLBACK and srcset
+        ),
+    )
+    img = _img(
+        src=images.url_for_width(name, FALLBACK_WIDTH), srcset=fallback, sizes=sizes,
+        width=info.get("width"), height=info.get("height"),
+        alt=alt, css_class=css_class, style=";".join(filter(None, (_placeholder_style(info), style))),
+        loading=loading,
+    )
+    return format_html("<picture>{}{}</picture>", sources, img)
+
+
+@register.filter
+def image_url(image, width):
+    """Адрес копии не уже ``width`` пикселей — для фонов и мест без srcset."""
+    if not image:
+        return ""
+    return images.url_for_width(image.name, int(width))
+
+
+@register.filter
+def image_background(image, width):
+    """
+    Декларации CSS-фона: копия не уже ``width`` поверх заглушки и преобладающего
+    цвета. Слой заглушки виден, пока грузится картинка.
+    """
+    if not image:
+        return ""
+    info = images.asset_info(image.name)
+    url = images.url_for_width(image.name, int(width))
+    layers = format_html("url({})", url)
+    if info.get("placeholder"):
+        layers = format_html("{}, url({})", layers, info["placeholder"])
+    color = format_html("background-color:{};", info["color"]) if info.get("color") else ""
+    return format_html("background-image:{};{}", layers, color)
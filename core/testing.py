@@ -0,0 +1,144 @@
+"""
+Общие помощники тестов: каталог для проверок и бюджеты запросов страниц.
+
+``seed_catalog(scale)`` создаёт каталог через ORM (сигналы заполняют счётчики,
+поисковый индекс и кэши, как при работе в админке): категории с подкатегориями,
+теги, туры и услуги с галереями, отзывы, статьи блога, новости и прайс.
+Таксономия фиксирована, а число элементов растёт линейно со ``scale``.
+``make_tour(i)`` / ``make_service(i)`` создают один минимальный элемент с
+уникальным slug — для тестов, которым весь каталог не нужен.
+
+``QueryBudgetMixin.assertBudget`` открывает страницу с пустым кэшем (худший
+случай — первый запрос после сброса) и проверяет число SQL-запросов и размер
+ответа. Один и тот же бюджет проверяется на каталоге ``scale=1`` и ``scale=10``:
+если страница выполняет запрос на строку, при 10-кратном росте данных она
+выходит за бюджет.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from blog.models import BlogPost
+from news.models import NewsPost
+from prices.models import PricePDF
+from reviews.models import Review
+from services.models import Service, ServiceCategory, ServiceImage
+from tours.models import Tour, TourCategory, TourImage
+
+from . import related
+from .models import SiteSettings, Tag
+
+TOURS = 12
+SERVICES = 8
+GALLERY = 3
+REVIEWS = 15
+POSTS = 8
+
+
+def make_tour(i, **kwargs):
+    defaults = dict(title=f"Tour {i}", slug=f"tour-{i}", description="desc", price_adult=1000 + i)
+    defaults.update(kwargs)
+    return Tour.objects.create(**defaults)
+
+
+def make_service(i, **kwargs):
+    defaults = dict(title=f"Service {i}", slug=f"service-{i}", description="desc", price_adult=1000 + i)
+    defaults.update(kwargs)
+    return Service.objects.create(**defaults)
+
+
+def _categories(model, prefix, roots, children):
+    created = []
+    for i in range(roots):
+        root = model.objects.create(name=f"{prefix} {i}", slug=f"{prefix}-{i}")
+        for j in range(children):
+            created.append(model.objects.create(name=f"{prefix} {i}.{j}", slug=f"{prefix}-{i}-{j}", parent=root))
+    return created
+
+
+def seed_catalog(scale=1):
+    """Каталог размера ``scale``. Возвращает {"tours", "services", "tour_categories", ...}."""
+    SiteSettings.objects.create(site_name="TravelWorld", phone="+66 1", email="info@example.com")
+    tags = [Tag.objects.create(name=f"Тег {i}", slug=f"tag-{i}") for i in range(8)]
+    tour_categories = _categories(TourCategory, "tours", 3, 3)
+    service_categories = _categories(ServiceCategory, "services", 2, 2)
+
+    tours = []
+    for i in range(TOURS * scale):
+        tour = make_tour(
+            i, title=f"Тур {i}", short_desc="Короткое описание", description="Описание тура " * 20,
+            duration="1 день", location=f"Пхукет {i % 5}", price_adult=Decimal(1000 + i),
+            price_child=Decimal(500 + i), rating=Decimal("4.5"), is_popular=i % 4 == 0,
+            cover=f"tours/covers/tour-{i}.jpg",
+        )
+        tour.categories.add(tour_categories[i % len(tour_categories)])
+        tour.tags.add(tags[i % len(tags)], tags[(i + 3) % len(tags)])
+        for j in range(GALLERY):
+            TourImage.objects.create(tour=tour, image=f"tours/gallery/tour-{i}-{j}.jpg", order=j)
+        tours.append(tour)
+
+    services = []
+    for i in range(SERVICES * scale):
+        service = make_service(
+            i, title=f"Услуга {i}", short_desc="Коротко", description="Описание услуги " * 20,
+            location=f"Пхукет {i % 5}", price_adult=Decimal(800 + i), is_popular=i % 3 == 0,
+            cover=f"services/covers/service-{i}.jpg",
+        )
+        service.categories.add(service_categories[i % len(service_categories)])
+        service.tags.add(tags[i % len(tags)])
+        for j in range(GALLERY):
+            ServiceImage.objects.create(service=service, image=f"services/gallery/service-{i}-{j}.jpg", order=j)
+        services.append(service)
+
+    for i in range(REVIEWS * scale):
+        Review.objects.create(name=f"Гость {i}", message="Отличная поездка! " * 5, is_approved=i % 5 != 0)
+    blog = [
+        BlogPost.objects.create(title=f"Статья {i}", slug=f"post-{i}", content="Текст статьи " * 50, is_published=True)
+        for i in range(POSTS * scale)
+    ]
+    news = [
+        NewsPost.objects.create(title=f"Новость {i}", slug=f"news-{i}", content="Текст новости " * 50, is_published=True)
+        for i in range(POSTS * scale)
+    ]
+    PricePDF.objects.create(name="Прайс", file="prices/price.pdf")
+
+    related.rebuild(Tour)
+    related.rebuild(Service)
+    cache.clear()
+    return {
+        "tags": tags, "tour_categories": tour_categories, "service_categories": service_categories,
+        "tours": tours, "services": services, "blog": blog, "news": news,
+    }
+
+
+class QueryBudgetMixin:
+    """Каталог ``SCALE`` на класс тестов и проверка бюджета страницы."""
+
+    SCALE = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.catalog = seed_catalog(cls.SCALE)
+
+    def assertBudget(self, url, queries, max_bytes, status=200, data=None, **extra):
+        """GET ``url`` (POST, если передан ``data``) с пустым кэшем в пределах бюджета."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            if data is None:
+                response = self.client.get(url, **extra)
+            else:
+                response = self.client.post(url, data, **extra)
+        self.assertEqual(response.status_code, status, url)
+        executed = [query["sql"] for query in captured.captured_queries]
+        self.assertLessEqual(
+            len(executed), queries,
+            f"{url}: {len(executed)} запросов при бюджете {queries} (каталог x{self.SCALE}):\n" + "\n".join(executed),
+        )
+        self.assertLessEqual(
+            len(response.content), max_bytes,
+            f"{url}: {len(response.content)} байт при бюджете {max_bytes} (каталог x{self.SCALE})",
+        )
+        return response
@@ -1,3 +1,1404 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import pickle
+import shutil
+import socket
+import socketserver
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, connections
+from django.db.models import F
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import BlogPost
+from reviews.models import Review
+from tours.models import Tour, TourCategory
+from .cache import GENERATION_KEY, bump_generation, get_generation
+from . import backup, benchmark, context_processors, imagejobs, images, leads, media, notify, pagecache, prerender, querytrace, suggest, synthetic
+from .models import ImageAsset, ImageJob, Lead, MediaFile, PrerenderedPage, SiteSettings, Tag
+from .sampling import random_sample, pool_stats
+from .sqlite.routers import ReadReplicaRouter, ReplicaReadsMiddleware, replica_reads
+from .testing import QueryBudgetMixin, make_tour
+
+
+class RandomSampleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.active = [make_tour(i) for i in range(20)]
+        self.hidden = [make_tour(i, is_active=False) for i in range(20, 25)]
+        self.qs = Tour.objects.filter(is_active=True)
+
+    def test_sample_returns_distinct_active_rows(self):
+        picked = random_sample('tours', self.qs, 6)
+        self.assertEqual(len(picked), 6)
+        self.assertEqual(len({t.pk for t in picked}), 6)
+        self.assertTrue(all(t.is_active for t in picked))
+
+    def test_sample_larger_than_table(self):
+        self.assertEqual(len(random_sample('tours', self.qs, 100)), 20)
+
+    def test_sparse_table_falls_back_to_pool(self):
+        Tour.objects.filter(pk__in=[t.pk for t in self.active[1:-1]]).update(is_active=False)
+        Tour.objects.create(title='x', slug='x', description='d', price_adult=1)  # bump поколения
+        picked = random_sample('tours', self.qs, 3)
+        self.assertEqual(len(picked), 3)
+
+    def test_warm_sample_is_one_query(self):
+        random_sample('tours', self.qs, 6)
+        with self.assertNumQueries(1):
+            random_sample('tours', self.qs, 6)
+
+    def test_pool_refreshes_on_change(self):
+        self.assertEqual(pool_stats('tours', self.qs)['count'], 20)
+        make_tour(99)
+        self.assertEqual(pool_stats('tours', self.qs)['count'], 21)
+        self.active[0].delete()
+        self.assertEqual(pool_stats('tours', self.qs)['count'], 20)
+
+
+class HomeViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(10):
+            make_tour(i)
+
+    def test_home_shows_six_tours(self):
+        resp = self.client.get(reverse('core:home'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['tours']), 6)
+        self.assertEqual(resp.context['total_tours_count'], 10)
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.islands = make_tour(1, title='Острова Пхи-Пхи', location='Краби',
+                                 description='Морская прогулка к островам и пляжам')
+        self.elephants = make_tour(2, title='Слоновья ферма', location='Пхукет',
+                                   description='Кормление слонов и купание')
+        self.hidden = make_tour(3, title='Закрытые острова', is_active=False,
+                                description='Не показывается')
+
+    def ids(self, q):
+        return list(Tour.objects.active().search(q).values_list('pk', flat=True))
+
+    def test_stemmed_and_prefix_match(self):
+        self.assertEqual(self.ids('пляжи'), [self.islands.pk])
+        self.assertEqual(self.ids('слон'), [self.elephants.pk])
+        self.assertEqual(self.ids('прог'), [self.islands.pk])
+
+    def test_all_words_required(self):
+        self.assertEqual(self.ids('пхукет слонов'), [self.elephants.pk])
+        self.assertEqual(self.ids('пхукет пляж'), [])
+
+    def test_title_outranks_description(self):
+        make_tour(4, title='Пляжный отдых', description='Только пляж')
+        ids = self.ids('пляж')
+        self.assertEqual(ids[0], Tour.objects.get(slug='tour-4').pk)
+
+    def test_index_follows_saves_deletes_and_tags(self):
+        self.elephants.title = 'Рафтинг'
+        self.elephants.description = 'Сплав'
+        self.elephants.save()
+        self.assertEqual(self.ids('слон'), [])
+        tag = Tag.objects.create(name='Слоны', slug='slony')
+        self.elephants.tags.add(tag)
+        self.assertEqual(self.ids('слон'), [self.elephants.pk])
+        tag.name = 'Джунгли'
+        tag.save()
+        self.assertEqual(self.ids('джунгл'), [self.elephants.pk])
+        tag.delete()
+        self.assertEqual(self.ids('джунгл'), [])
+        self.islands.delete()
+        self.assertEqual(self.ids('остров'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_search_index')
+        self.assertEqual(self.ids('остров'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.ids('остров'), [self.islands.pk])
+
+    def test_list_view_search(self):
+        resp = self.client.get(reverse('tours:list'), {'q': 'слоны'})
+        self.assertEqual([t.pk for t in resp.context['tours']], [self.elephants.pk])
+
+
+@mock.patch.object(suggest, 'CHECK_INTERVAL', 0)
+class SuggestTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        suggest.reset()
+        make_tour(1, title='Острова Пхи-Пхи', location='Краби')
+        make_tour(2, title='Пхукет за один день', location='Пхукет')
+        make_tour(3, title='Скрытый тур', is_active=False)
+        TourCategory.objects.create(name='Острова', slug='ostrova')
+
+    def labels(self, q):
+        resp = self.client.get(reverse('core:suggest'), {'q': q})
+        self.assertEqual(resp.status_code, 200)
+        return [s['label'] for s in resp.json()['suggestions']]
+
+    def test_prefix_matches_word_starts(self):
+        self.assertEqual(self.labels('пхи'), ['Острова Пхи-Пхи'])
+        self.assertEqual(self.labels('ост'), ['Острова Пхи-Пхи', 'Острова'])
+        self.assertIn('Краби', self.labels('кра'))
+        self.assertEqual(self.labels('скрыт'), [])
+
+    def test_warm_lookup_runs_no_queries(self):
+        self.labels('пх')
+        with self.assertNumQueries(0):
+            self.labels('пху')
+
+    def test_index_refreshes_on_catalog_change(self):
+        self.assertEqual(self.labels('рыб'), [])
+        Tag.objects.create(name='Рыбалка', slug='rybalka')
+        self.assertEqual(self.labels('рыб'), ['Рыбалка'])
+
+
+class ContextProcessorsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.cat = TourCategory.objects.create(name='Острова', slug='islands')
+        make_tour(1).categories.add(self.cat)
+        SiteSettings.objects.create(site_name='Test', phone='+66 1')
+
+    def context(self):
+        ctx = {}
+        ctx.update(context_processors.site_settings(self.request))
+        ctx.update(context_processors.navigation_categories(self.request))
+        return ctx
+
+    def test_unused_values_are_not_evaluated(self):
+        with self.assertNumQueries(0):
+            self.context()
+
+    def test_warm_values_need_no_queries(self):
+        ctx = self.context()
+        self.assertEqual([c.slug for c in ctx['nav_tour_categories']], ['islands'])
+        self.assertEqual(ctx['site_settings'].phone, '+66 1')
+        list(ctx['nav_service_categories'])
+        with self.assertNumQueries(0):
+            ctx = self.context()
+            list(ctx['nav_tour_categories']), list(ctx['nav_service_categories'])
+            ctx['site_settings'].site_name
+
+    def test_rebuilt_on_change(self):
+        self.assertEqual(self.context()['site_settings'].phone, '+66 1')
+        SiteSettings.objects.update(phone='x')  # update() без сигналов — в кэше старое значение
+        self.assertEqual(self.context()['site_settings'].phone, '+66 1')
+        settings = SiteSettings.objects.get()
+        settings.phone = '+66 2'
+        settings.save()
+        self.assertEqual(self.context()['site_settings'].phone, '+66 2')
+
+        self.assertEqual(len(self.context()['nav_tour_categories']), 1)
+        self.cat.tours.clear()
+        self.assertEqual(len(self.context()['nav_tour_categories']), 0)
+
+
+class GenerationCacheTestCase(TestCase):
+    def file_caches(self):
+        """Общий кэш — файловый, как в продакшене; поколения — в отдельном каталоге."""
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        return override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(directory / 'cache'), 'TIMEOUT': 60,
+            },
+            'generations': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(directory / 'generations'), 'TIMEOUT': None,
+            },
+        })
+
+    def test_bump_keeps_counter_without_expiry(self):
+        with self.file_caches():
+            first = get_generation('things')
+            bump_generation('things')
+            bump_generation('things')
+            self.assertEqual(get_generation('things'), first + 2)
+            store = caches['generations']
+            with open(store._key_to_file(GENERATION_KEY.format('things')), 'rb') as fh:
+                self.assertIsNone(pickle.load(fh))  # срок жизни записи
+
+    def test_parallel_bumps_in_separate_cache(self):
+        with self.file_caches():
+            first = get_generation('things')
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(lambda _: bump_generation('things'), range(200)))
+            # Очистка общего кэша поколения не трогает
+            cache.clear()
+            self.assertEqual(get_generation('things'), first + 200)
+            self.assertIsNone(cache.get(GENERATION_KEY.format('things')))
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cat = TourCategory.objects.create(name='Острова', slug='islands')
+        self.tour = make_tour(1)
+        self.tour.categories.add(self.cat)
+
+    def fetch(self, url):
+        return self.client.get(url)
+
+    def revalidate(self, url, resp, **headers):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'], **headers)
+
+    def test_detail_page_304_until_catalog_changes(self):
+        url = self.tour.get_absolute_url()
+        first = self.fetch(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(0):  # ответ из полностраничного кэша (core.pagecache)
+            resp = self.revalidate(url, first)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+
+        self.tour.title = 'Новое'
+        self.tour.save()
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_list_and_json_endpoints(self):
+        for url in (reverse('tours:list') + '?sort=newest',
+                    reverse('core:get_tours_by_category', args=[self.cat.id]),
+                    reverse('core:suggest') + '?q=tour'):
+            first = self.fetch(url)
+            self.assertEqual(first.status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        other = self.fetch(reverse('tours:list') + '?sort=price_asc')
+        first = self.fetch(reverse('tours:list') + '?sort=newest')
+        self.assertNotEqual(other['ETag'], first['ETag'])
+
+    def test_content_pages_follow_header_categories(self):
+        post = BlogPost.objects.create(title='Пост', slug='post', content='Текст', is_published=True)
+        for i, url in enumerate((reverse('blog:list'), post.get_absolute_url(), reverse('news:list'))):
+            first = self.fetch(url)
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+            TourCategory.objects.create(name=f'Раздел {i}', slug=f'section-{i}')
+            self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_client_state_is_part_of_validator(self):
+        url = reverse('tours:list')
+        first = self.fetch(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        self.client.cookies['messages'] = 'flash'
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        pagecache.reset_stats()
+        self.cat = TourCategory.objects.create(name='Острова', slug='islands')
+        self.tour = make_tour(1)
+        self.tour.categories.add(self.cat)
+        # Популярный тур один — сайдбар других страниц не зависит от self.tour
+        self.other = make_tour(2, is_popular=True)
+
+    def test_second_request_served_without_queries(self):
+        url = self.tour.get_absolute_url()
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertIn('s-maxage=', first['Cache-Control'])
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn(f'tour:{self.tour.pk}', first['Surrogate-Key'].split())
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+    def test_query_string_is_normalized(self):
+        url = reverse('tours:list')
+        self.client.get(url + '?sort=newest&price_min=1000')
+        resp = self.client.get(url + '?utm_source=ads&price_min=1000&sort=newest')
+        self.assertEqual(resp['X-Page-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url + '?sort=price_asc')['X-Page-Cache'], 'MISS')
+
+    def test_purge_hits_only_affected_pages(self):
+        own, other = self.tour.get_absolute_url(), self.other.get_absolute_url()
+        listing = reverse('tours:list')
+        for url in (own, other, listing):
+            self.client.get(url)
+
+        self.tour.title = 'Новое название'
+        self.tour.save()
+        self.assertEqual(self.client.get(own)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(listing)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(other)['X-Page-Cache'], 'HIT')
+
+        # Настройки сайта — в шапке и подвале каждой страницы
+        SiteSettings.objects.create(phone='+66 1')
+        self.assertEqual(self.client.get(other)['X-Page-Cache'], 'MISS')
+
+    def test_menu_purged_only_when_root_crosses_zero(self):
+        blog = reverse('blog:list')
+        more = make_tour(3)
+        more.categories.add(self.cat)
+        self.client.get(blog)
+        # Меню не изменилось: страницы, не показывающие туры, остаются в кэше
+        make_tour(4).categories.add(self.cat)
+        self.assertEqual(self.client.get(blog)['X-Page-Cache'], 'HIT')
+        tours = list(self.cat.tours.all())
+        for tour in tours[:-1]:
+            tour.is_active = False
+            tour.save()
+        self.assertEqual(self.client.get(blog)['X-Page-Cache'], 'HIT')
+        tours[-1].is_active = False
+        tours[-1].save()
+        resp = self.client.get(blog)
+        self.assertEqual(resp['X-Page-Cache'], 'MISS')
+        self.assertEqual(list(resp.context['nav_tour_categories']), [])
+
+    def test_content_pages(self):
+        BlogPost.objects.create(title='Пост', slug='post', content='text', is_published=True)
+        url = reverse('blog:list')
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+        BlogPost.objects.create(title='Ещё', slug='more', content='text', is_published=True)
+        resp = self.client.get(url)
+        self.assertEqual(resp['X-Page-Cache'], 'MISS')
+        self.assertContains(resp, 'Ещё')
+
+    def test_session_bypasses_cache(self):
+        url = reverse('tours:list')
+        self.client.get(url)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'session'
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+
+    def test_stats(self):
+        url = reverse('tours:list')
+        self.client.get(url)
+        self.client.get(url)
+        stats = pagecache.stats()
+        self.assertEqual((stats['miss'], stats['hit'], stats['store']), (1, 1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        out = StringIO()
+        call_command('pagecache_stats', '--reset', stdout=out)
+        self.assertIn('hit_ratio: 0.5', out.getvalue())
+        self.assertEqual(pagecache.stats()['hit'], 0)
+
+    def test_hits_do_not_write_shared_cache(self):
+        url = reverse('tours:list')
+        self.client.get(url)
+        pagecache.stats()
+        with mock.patch('core.pagecache.increment', wraps=pagecache.increment) as increment:
+            for _ in range(5):
+                self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+            increment.assert_not_called()
+            # Раз в STATS_INTERVAL накопленное переносится в общий кэш
+            with mock.patch.object(pagecache, 'STATS_INTERVAL', 0):
+                self.client.get(url)
+            increment.assert_called_once_with('pagecache:stats:hit', 6)
+        self.assertEqual(pagecache.stats()['hit'], 6)
+
+    def submit_review(self, client):
+        page = client.get(reverse('reviews:add'))
+        self.assertIn('csrftoken', client.cookies)
+        token = page.context['csrf_token']
+        return client.post(reverse('reviews:add'), {
+            'name': 'Гость', 'message': 'Отлично', 'csrfmiddlewaretoken': str(token),
+        })
+
+    def test_page_with_csrf_form_not_shared(self):
+        first, second = Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True)
+        self.assertEqual(self.submit_review(first).status_code, 302)
+        self.assertEqual(self.submit_review(second).status_code, 302)
+        # Даже если маршрут формы окажется под кэшем, страница с токеном не сохраняется
+        with mock.patch.dict(pagecache.CACHED_VIEWS, {'reviews': None}):
+            cache.clear()
+            first, second = Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True)
+            self.submit_review(first)
+            self.assertEqual(self.submit_review(second).status_code, 302)
+
+    def test_lead_form_gets_csrf_token_separately(self):
+        client = Client(enforce_csrf_checks=True)
+        page = client.get(reverse('core:home'))
+        self.assertNotContains(page, 'csrfmiddlewaretoken')
+        token = client.get(reverse('core:csrf')).json()['token']
+        resp = client.post(reverse('core:lead_create'), {'name': 'Иван', 'phone': '+66 123'}, HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(resp.status_code, 202)
+
+
+class PrerenderTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(PRERENDER_ROOT=str(self.root))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        # Отложенный пересчёт похожих (core.related) выполняется здесь, а не в тесте
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cat = TourCategory.objects.create(name='Острова', slug='islands')
+            self.tour = make_tour(1)
+            self.tour.categories.add(self.cat)
+            self.other = make_tour(2, is_popular=True)
+
+    def page(self, url):
+        return self.root / url.strip('/') / 'index.html'
+
+    def test_full_render_writes_pages(self):
+        result = prerender.rebuild(full=True)
+        self.assertEqual(result['rendered'], len(prerender.site_paths()))
+        detail = self.tour.get_absolute_url()
+        self.assertEqual(self.page(detail).read_bytes(), self.client.get(detail, secure=True).content)
+        self.assertTrue(self.page(reverse('tours:by_category', args=['islands'])).exists())
+        self.assertTrue(self.page('/').exists())
+        self.assertTrue(self.page(detail).with_name('index.html.gz').exists())
+        self.assertFalse(any(p.name.startswith('.tmp-') for p in self.root.rglob('*')))
+        keys = PrerenderedPage.objects.get(path=detail).key_set.values_list('key', flat=True)
+        self.assertIn(f'tour:{self.tour.pk}', keys)
+
+    def test_mark_stale_matches_whole_keys(self):
+        prerender.rebuild(full=True)
+        own = self.tour.get_absolute_url()
+        # Ключ tour:10 не задевает страницы с ключом tour:1
+        self.assertEqual(prerender.mark_stale([f'tour:{self.tour.pk}0', 'tour']), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertGreater(prerender.mark_stale([f'tour:{self.tour.pk}']), 0)
+        self.assertTrue(PrerenderedPage.objects.get(path=own).is_stale)
+        self.assertFalse(self.page(own).exists())
+
+    def test_admin_save_rerenders_only_affected_pages(self):
+        prerender.rebuild(full=True)
+        own, other = self.tour.get_absolute_url(), self.other.get_absolute_url()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.title = 'Новое название'
+            self.tour.save()
+        # Устаревший файл удалён сразу: до перерисовки страницу отдаёт Django
+        self.assertFalse(self.page(own).exists())
+        self.assertTrue(self.page(other).exists())
+        self.assertTrue(PrerenderedPage.objects.get(path=own).is_stale)
+        self.assertFalse(PrerenderedPage.objects.get(path=other).is_stale)
+
+        stale = [page for page in PrerenderedPage.objects.all() if page.is_stale]
+        result = prerender.rebuild()
+        self.assertEqual(result['rendered'], len(stale))
+        self.assertLess(len(stale), PrerenderedPage.objects.count())
+        self.assertIn('Новое название', self.page(own).read_text())
+        self.assertFalse(PrerenderedPage.objects.get(path=own).is_stale)
+
+    def test_rerender_ignores_page_cache(self):
+        prerender.rebuild(full=True)
+        own = self.tour.get_absolute_url()
+        self.assertEqual(self.client.get(own)['X-Page-Cache'], 'MISS')
+        # Сброс не дошёл до кэша этого процесса: запись в кэше страниц устарела
+        Tour.objects.filter(pk=self.tour.pk).update(title='Новое название')
+        PrerenderedPage.objects.filter(path=own).update(version=F('version') + 1)
+        prerender.rebuild()
+        self.assertIn('Новое название', self.page(own).read_text())
+
+    def test_removed_objects_lose_their_pages(self):
+        prerender.rebuild(full=True)
+        url = self.tour.get_absolute_url()
+        self.tour.is_active = False
+        self.tour.save()
+        result = prerender.rebuild()
+        self.assertEqual(result['removed'], 1)
+        self.assertFalse(self.page(url).exists())
+        self.assertFalse(PrerenderedPage.objects.filter(path=url).exists())
+
+
+def make_jpeg(width, height, name='photo.jpg', color=(40, 120, 200)):
+    from PIL import Image
+    from io import BytesIO
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'JPEG', quality=95)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+def run_image_jobs():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        return imagejobs.work(executor)
+
+
+class ImageDerivativesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_upload_creates_width_stepped_variants(self):
+        tour = make_tour(1, cover=make_jpeg(1000, 500))
+        self.assertFalse(ImageAsset.objects.exists())
+        self.assertEqual(run_image_jobs(), {'done': 1, 'failed': 0})
+        asset = ImageAsset.objects.get(name=tour.cover.name)
+        self.assertEqual(asset.widths, [320, 640, 960, 1000])
+        for width in asset.widths:
+            for fmt in images.FORMATS:
+                self.assertTrue(default_storage.exists(images.derivative_name(tour.cover.name, width, fmt)))
+        small = default_storage.size(images.derivative_name(tour.cover.name, 320, 'webp'))
+        self.assertLess(small * 10, default_storage.size(tour.cover.name))
+
+    def test_picture_tag_and_fallbacks(self):
+        tour = make_tour(1, cover=make_jpeg(800, 600))
+        run_image_jobs()
+        html = Template('{% load images %}{% picture tour.cover alt=tour.title css_class="c" %}').render(
+            Context({'tour': tour})
+        )
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(images.derivative_name(tour.cover.name, 320, 'webp') + ' 320w', html)
+        self.assertIn('class="c"', html)
+
+        # Копий ещё нет — обычный <img> с оригиналом
+        images.discard(tour.cover.name)
+        html = Template('{% load images %}{% picture tour.cover %}|{{ tour.cover|image_url:640 }}').render(
+            Context({'tour': tour})
+        )
+        self.assertNotIn('<picture>', html)
+        self.assertTrue(html.endswith('|' + tour.cover.url))
+
+    def test_metadata_is_stored_and_rendered(self):
+        from PIL import Image
+        from io import BytesIO
+        image = Image.new('RGB', (900, 600), (200, 30, 30))
+        image.paste((10, 10, 10), (0, 0, 100, 100))
+        buffer = BytesIO()
+        image.save(buffer, 'PNG')
+        tour = make_tour(1, cover=SimpleUploadedFile('red.png', buffer.getvalue()))
+        run_image_jobs()
+
+        asset = ImageAsset.objects.get(name=tour.cover.name)
+        self.assertEqual((asset.width, asset.height, asset.size), (900, 600, len(buffer.getvalue())))
+        red, green, blue = (int(asset.color[i:i + 2], 16) for i in (1, 3, 5))
+        self.assertGreater(red, 180)
+        self.assertLess(max(green, blue), 60)
+        self.assertTrue(asset.placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(asset.placeholder), 1000)
+
+        # Размеры и заглушка — из записи в кэше, файл не открывается
+        template = Template('{% load images %}{% picture tour.cover alt="x" %}|{{ tour.cover|image_background:640 }}')
+        with mock.patch.object(images, '_open', side_effect=AssertionError):
+            template.render(Context({'tour': tour}))
+            with self.assertNumQueries(0):
+                html = template.render(Context({'tour': tour}))
+        self.assertIn('width="900"', html)
+        self.assertIn('height="600"', html)
+        self.assertIn(f'background-color:{asset.color}', html)
+        self.assertIn(asset.placeholder, html)
+        self.assertIn(images.derivative_name(tour.cover.name, 640, 'jpeg'), html.split('|')[1])
+
+    def test_backfill_requeues_assets_without_metadata(self):
+        tour = make_tour(1, cover=make_jpeg(400, 300))
+        run_image_jobs()
+        ImageAsset.objects.update(width=None, color='', placeholder='')
+        call_command('generate_image_derivatives', stdout=StringIO())
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.PENDING)
+        run_image_jobs()
+        self.assertEqual(ImageAsset.objects.get(name=tour.cover.name).width, 400)
+
+    def test_replacing_file_drops_old_variants(self):
+        tour = make_tour(1, cover=make_jpeg(700, 400, 'old.jpg'))
+        run_image_jobs()
+        old = tour.cover.name
+        tour.cover = make_jpeg(700, 400, 'new.jpg', color=(200, 10, 10))
+        tour.save()
+        self.assertFalse(ImageAsset.objects.filter(name=old).exists())
+        self.assertFalse(ImageJob.objects.filter(name=old).exists())
+        self.assertFalse(default_storage.exists(images.derivative_name(old, 320, 'jpeg')))
+        run_image_jobs()
+        self.assertTrue(ImageAsset.objects.filter(name=tour.cover.name).exists())
+
+    def test_processed_job_refreshes_pages_and_cards(self):
+        make_tour(1, cover=make_jpeg(1200, 800))
+        resp = self.client.get(reverse('tours:list'))
+        self.assertNotContains(resp, '640w')
+        tour_id = Tour.objects.get().pk
+        self.assertIn(str(tour_id), self.client.get(reverse('core:get_all_tours')).content.decode())
+
+        run_image_jobs()
+        resp = self.client.get(reverse('tours:list'))
+        self.assertEqual(resp['X-Page-Cache'], 'MISS')
+        self.assertContains(resp, '640w')
+        self.assertContains(resp, 'sizes="(max-width: 576px)')
+        data = self.client.get(reverse('core:get_all_tours')).content.decode()
+        self.assertIn('.640w.jpg', data)
+        self.assertIn('"cover_placeholder": "data:image/webp;base64,', data)
+
+    def test_unprocessed_file_cached_briefly(self):
+        tour = make_tour(1, cover=make_jpeg(400, 300))
+        name = tour.cover.name
+        with mock.patch('core.images.cache', mock.Mock(wraps=cache)) as spy:
+            images.prime(name)
+            self.assertEqual(spy.set_many.call_args_list[-1].args[1], images.PENDING_TIMEOUT)
+            cache.clear()
+            self.assertEqual(images.asset_info(name), {})
+            self.assertEqual(spy.set.call_args.args[2], images.PENDING_TIMEOUT)
+
+        # Сброс воркера не дошёл до кэша (forget в другом процессе) — запись истекает сама
+        with mock.patch('core.images.forget'):
+            run_image_jobs()
+        cache.delete(images.versioned_key(images.IMAGES, images._key(name)))
+        with mock.patch('core.images.cache', mock.Mock(wraps=cache)) as spy:
+            self.assertEqual(images.asset_info(name)['width'], 400)
+            self.assertEqual(spy.set.call_args.args[2], images.DEFAULT_TIMEOUT)
+
+    def test_queue_is_idempotent(self):
+        tour = make_tour(1, cover=make_jpeg(400, 300))
+        gallery = tour.images.create(image=make_jpeg(400, 300, color=(0, 200, 0)))
+        tour.save()
+        self.assertEqual(ImageJob.objects.count(), 2)
+        job = ImageJob.objects.get(name=gallery.image.name)
+        self.assertEqual(job.keys, f'tour:{tour.pk}')
+
+        self.assertEqual(run_image_jobs()['done'], 2)
+        self.assertEqual(run_image_jobs(), {'done': 0, 'failed': 0})
+        # Повторное сохранение обработанного файла задание не перезапускает
+        tour.save()
+        self.assertEqual(ImageJob.objects.filter(status=ImageJob.PENDING).count(), 0)
+
+    def test_failed_job_retries_then_fails(self):
+        tour = make_tour(1, cover=SimpleUploadedFile('broken.jpg', b'not an image'))
+        job = ImageJob.objects.get(name=tour.cover.name)
+        for attempt in range(1, imagejobs.MAX_ATTEMPTS + 1):
+            self.assertEqual(run_image_jobs()['failed'], 1)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            if job.status == ImageJob.PENDING:
+                # Следующая попытка — после паузы
+                self.assertEqual(run_image_jobs(), {'done': 0, 'failed': 0})
+                ImageJob.objects.update(available_at=timezone.now())
+        self.assertEqual(job.status, ImageJob.FAILED)
+        self.assertIn('UnidentifiedImageError', job.error)
+
+        imagejobs.retry(ImageJob.objects.all())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.PENDING, 0))
+
+    def test_cancelled_job_discards_result(self):
+        tour = make_tour(1, cover=make_jpeg(400, 300))
+        job = imagejobs.claim()[0]
+        meta = images.render(job.name)
+        Tour.objects.get(pk=tour.pk).delete()
+        self.assertFalse(imagejobs.complete(job, meta))
+        self.assertFalse(ImageAsset.objects.exists())
+        self.assertFalse(default_storage.exists(images.derivative_name(job.name, 320, 'webp')))
+
+    def test_worker_command_uses_process_pool(self):
+        tours = [make_tour(i, cover=make_jpeg(500, 300, f'c{i}.jpg', color=(i * 80, 0, 0))) for i in range(3)]
+        out = StringIO()
+        call_command('process_images', '--once', '--workers', '2', stdout=out)
+        self.assertIn('Обработано 3, ошибок 0', out.getvalue())
+        self.assertEqual(ImageAsset.objects.filter(name__in=[t.cover.name for t in tours]).count(), 3)
+
+    def test_backfill_command(self):
+        tour = make_tour(1, cover=make_jpeg(400, 300))
+        ImageJob.objects.all().delete()
+        out = StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('В очереди 1', out.getvalue())
+        self.assertEqual(ImageJob.objects.get().keys, f'tour:{tour.pk}')
+        run_image_jobs()
+        self.assertEqual(ImageAsset.objects.get(name=tour.cover.name).widths, [320, 400])
+
+
+class ContentAddressedMediaTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def files(self):
+        return sorted(p.relative_to(self.media).as_posix() for p in Path(self.media).rglob('*') if p.is_file())
+
+    def test_identical_uploads_share_one_file(self):
+        first = make_tour(1, cover=make_jpeg(400, 300, 'a.jpg'))
+        second = make_tour(2, cover=make_jpeg(400, 300, 'b.JPG'))
+        self.assertEqual(first.cover.name, second.cover.name)
+        self.assertRegex(first.cover.name, r'^cas/[0-9a-f]{2}/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(self.files(), [first.cover.name])
+        self.assertEqual(MediaFile.objects.get(name=first.cover.name).refs, 2)
+        # Копии общие: второе задание не создаётся
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+    def test_shared_file_keeps_variants_until_last_reference(self):
+        first = make_tour(1, cover=make_jpeg(400, 300))
+        second = make_tour(2, cover=make_jpeg(400, 300))
+        run_image_jobs()
+        name = first.cover.name
+
+        first.cover = make_jpeg(400, 300, color=(1, 2, 3))
+        first.save()
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+        self.assertTrue(ImageAsset.objects.filter(name=name).exists())
+
+        second.delete()
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 0)
+        self.assertFalse(ImageAsset.objects.filter(name=name).exists())
+
+    def test_sweep_removes_orphans_only(self):
+        kept = make_tour(1, cover=make_jpeg(400, 300))
+        gone = make_tour(2, cover=make_jpeg(400, 300, color=(9, 9, 9)))
+        run_image_jobs()
+        orphan = gone.cover.name
+        # Правка мимо сигналов: счётчик исправит пересчёт
+        Tour.objects.filter(pk=gone.pk).update(cover='')
+
+        out = StringIO()
+        call_command('sweep_media', '--dry-run', '--grace-hours', '0', stdout=out)
+        self.assertIn('Будет удалено файлов: 5', out.getvalue())
+        self.assertIn(orphan, self.files())
+
+        self.assertEqual(media.sweep(grace=timedelta(0)), {'files': 5, 'bytes': mock.ANY})
+        files = self.files()
+        self.assertNotIn(orphan, files)
+        self.assertIn(kept.cover.name, files)
+        self.assertIn(images.derivative_name(kept.cover.name, 320, 'webp'), files)
+        self.assertEqual(len(files), 5)
+        self.assertFalse(ImageAsset.objects.filter(name=orphan).exists())
+
+        # Свежие файлы не трогаются: объект с новой ссылкой мог ещё не сохраниться
+        default_storage.save('x.jpg', make_jpeg(10, 10))
+        self.assertEqual(media.sweep()['files'], 0)
+
+    def test_adopt_legacy_names(self):
+        from django.core.files.storage import FileSystemStorage
+        legacy = FileSystemStorage().save('tours/covers/old.jpg', make_jpeg(400, 300))
+        twin = FileSystemStorage().save('services/covers/copy.jpg', make_jpeg(400, 300))
+        tour = make_tour(1)
+        Tour.objects.filter(pk=tour.pk).update(cover=legacy)
+        other = make_tour(2)
+        Tour.objects.filter(pk=other.pk).update(cover=twin)
+
+        call_command('sweep_media', '--adopt', '--grace-hours', '0', stdout=StringIO())
+        names = set(Tour.objects.values_list('cover', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(name.startswith('cas/'))
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 2)
+        self.assertEqual(ImageJob.objects.get().name, name)
+
+
+class LeadJournalTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(LEAD_JOURNAL_PATH=str(Path(directory) / 'journal.sqlite3'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def post(self, key='form-key-0001', **data):
+        data = {'name': 'Иван', 'phone': '+66 123', 'utm_source': 'ads', **data}
+        return self.client.post(reverse('core:lead_create'), data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_request_only_appends_to_journal(self):
+        with self.assertNumQueries(0):
+            resp = self.post()
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json(), {'ok': True, 'key': 'form-key-0001'})
+        self.assertEqual(leads.pending(), 1)
+        self.assertFalse(Lead.objects.exists())
+
+    def test_flush_moves_batches_and_keeps_submission_time(self):
+        for i in range(5):
+            self.post(key=f'form-key-{i:04d}', name=f'Lead {i}')
+        submitted = timezone.now()
+        out = StringIO()
+        with CaptureQueriesContext(connection) as captured:
+            call_command('flush_leads', '--batch', '2', stdout=out)
+        # по одному INSERT на пачку
+        self.assertEqual(sum(q['sql'].startswith('INSERT') for q in captured.captured_queries), 3)
+        self.assertIn('Перенесено заявок: 5', out.getvalue())
+        self.assertEqual(leads.pending(), 0)
+        self.assertEqual(Lead.objects.count(), 5)
+        lead = Lead.objects.get(name='Lead 0')
+        self.assertEqual((lead.phone, lead.utm_source, lead.status), ('+66 123', 'ads', 'new'))
+        self.assertLessEqual(lead.created_at, submitted)
+
+    def test_retries_do_not_duplicate(self):
+        self.post()
+        self.post()
+        self.assertEqual(leads.pending(), 1)
+        leads.drain()
+        # Повтор после переноса и повторный перенос той же записи журнала
+        self.post()
+        leads.append('form-key-0001', {'name': 'Иван', 'phone': '+66 123'})
+        leads.drain()
+        self.assertEqual(Lead.objects.count(), 1)
+
+    def test_invalid_lead_rejected(self):
+        resp = self.post(related_id='abc')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('related_id', resp.json()['errors'])
+        self.assertEqual(self.post(related_type='hotel').status_code, 400)
+        self.assertEqual(leads.pending(), 0)
+        # source_page — не обязательно URL
+        self.assertEqual(self.post(source_page='how-it-works', related_id='7').status_code, 202)
+
+    def test_poison_row_moved_to_dead_letters(self):
+        leads.append('bad-key-0001', {'name': 'Иван', 'phone': '+66 1', 'related_id': 'abc'})
+        self.post(key='form-key-0002')
+        with self.assertLogs('core.leads', 'ERROR'):
+            self.assertEqual(leads.drain(), 2)
+        self.assertEqual(list(Lead.objects.values_list('idempotency_key', flat=True)), ['form-key-0002'])
+        self.assertEqual(leads.pending(), 0)
+        [(key, data, error)] = leads.dead()
+        self.assertEqual(key, 'bad-key-0001')
+        self.assertIn('related_id', error)
+        # Повторный проход не трогает записи в dead
+        self.assertEqual(leads.drain(), 0)
+
+    def test_without_journal_writes_directly(self):
+        with override_settings(LEAD_JOURNAL_PATH=''):
+            self.post()
+            self.post()
+            self.assertEqual(self.post(name='').status_code, 400)
+        self.assertEqual(Lead.objects.get().idempotency_key, 'form-key-0001')
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает письма и считает соединения."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 fake')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 fake')
+            elif command == 'DATA':
+                self.reply('354 go')
+                body = []
+                while (row := self.rfile.readline()) not in (b'.\r\n', b''):
+                    body.append(row)
+                server.messages.append(b''.join(body).decode())
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply('250 ok')
+
+
+class FakeWebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        server.ports.add(self.client_address[1])
+        status = 503 if server.failures > 0 else 200
+        server.failures -= 1
+        if status == 200:
+            server.bodies.append(json.loads(body))
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_USE_TLS=False,
+                   EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='')
+class LeadNotificationsTestCase(TestCase):
+    def start(self, server):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def setUp(self):
+        cache.clear()
+        notify.reset_stats()
+        self.smtp = self.start(socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeSMTPHandler))
+        self.smtp.daemon_threads = True
+        self.smtp.connections, self.smtp.messages = 0, []
+        self.web = self.start(ThreadingHTTPServer(('127.0.0.1', 0), FakeWebhookHandler))
+        self.web.daemon_threads = True
+        self.web.ports, self.web.bodies, self.web.failures = set(), [], 0
+        override = override_settings(EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.smtp.server_address[1])
+        override.enable()
+        self.addCleanup(override.disable)
+        SiteSettings.objects.create(
+            site_name='Site', email='site@example.com', notify_email='sales@example.com',
+            notify_webhook=f'http://127.0.0.1:{self.web.server_address[1]}/hook?chat_id=1',
+        )
+        self.dispatcher = notify.Dispatcher()
+        self.addCleanup(self.dispatcher.close)
+
+    def make_leads(self, count):
+        return [Lead.objects.create(name=f'Lead {i}', phone=f'+66 {i}') for i in range(count)]
+
+    def test_batch_reuses_connections(self):
+        self.make_leads(5)
+        result = self.dispatcher.dispatch()
+        self.assertEqual(result, {'sent': 5, 'retry': 0, 'failed': 0})
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertIn('sales@example.com', self.smtp.messages[0])
+        self.assertEqual(len(self.web.ports), 1)  # keep-alive: одно HTTP-соединение
+        self.assertEqual(self.web.bodies[0]['lead']['name'], 'Lead 0')
+        self.assertIn('+66 0', self.web.bodies[0]['text'])
+        self.assertEqual(set(Lead.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(notify.stats()['sent'], 5)
+        self.assertEqual(self.dispatcher.dispatch(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+    def test_failed_channel_retried_without_duplicating_other(self):
+        lead, = self.make_leads(1)
+        self.web.failures = 1
+        self.assertEqual(self.dispatcher.dispatch()['retry'], 1)
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, 'new')
+        self.assertEqual(lead.delivered, ['email'])
+        self.assertIn('HTTP 503', lead.last_error)
+        self.assertGreater(lead.next_attempt_at, timezone.now())
+
+        # До следующей попытки заявка не берётся
+        self.assertEqual(self.dispatcher.dispatch()['retry'], 0)
+        Lead.objects.filter(pk=lead.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatcher.dispatch()['sent'], 1)
+        lead.refresh_from_db()
+        self.assertEqual((lead.status, lead.attempts, lead.last_error), ('sent', 2, ''))
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertEqual(len(self.web.bodies), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        lead, = self.make_leads(1)
+        self.web.failures = notify.MAX_ATTEMPTS
+        for _ in range(notify.MAX_ATTEMPTS):
+            Lead.objects.filter(pk=lead.pk).update(next_attempt_at=None)
+            self.dispatcher.dispatch()
+        lead.refresh_from_db()
+        self.assertEqual((lead.status, lead.attempts), ('error', notify.MAX_ATTEMPTS))
+        self.assertEqual(notify.stats()['failed'], 1)
+
+    def test_smtp_reconnects_after_server_closes(self):
+        self.make_leads(1)
+        self.dispatcher.dispatch()
+        self.dispatcher.smtp.connection.sock.shutdown(socket.SHUT_RDWR)
+        self.make_leads(1)
+        # Первая отправка по закрытому соединению падает, повтор идёт по новому
+        self.assertEqual(self.dispatcher.dispatch()['retry'], 1)
+        Lead.objects.update(next_attempt_at=None)
+        self.assertEqual(self.dispatcher.dispatch()['sent'], 1)
+        self.assertEqual(self.smtp.connections, 2)
+
+    def test_without_targets_nothing_is_sent(self):
+        SiteSettings.objects.update(email='', notify_email='', notify_webhook='')
+        cache.clear()
+        self.make_leads(1)
+        out = StringIO()
+        call_command('dispatch_leads', stdout=out)
+        self.assertIn('Отправлено 0', out.getvalue())
+        self.assertEqual(Lead.objects.get().status, 'new')
+
+    def test_targets_follow_settings_without_cache(self):
+        self.assertEqual(self.dispatcher.targets()['email'], 'sales@example.com')
+        SiteSettings.objects.update(notify_email='boss@example.com')
+        self.assertEqual(self.dispatcher.targets()['email'], 'boss@example.com')
+
+    def test_migration_marks_history_notified(self):
+        from django.apps import apps
+        migration = importlib.import_module('core.migrations.0011_existing_leads_notified')
+        old = self.make_leads(3)
+        migration.mark_existing(apps, None)
+        self.make_leads(1)
+        self.assertEqual(self.dispatcher.dispatch(), {'sent': 1, 'retry': 0, 'failed': 0})
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertEqual({lead.status for lead in Lead.objects.filter(pk__in=[lead.pk for lead in old])}, {'done'})
+
+
+class SQLiteProfileTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        name = str(Path(directory) / 'db.sqlite3')
+        self.handler = ConnectionHandler({
+            'default': {'ENGINE': 'core.sqlite', 'NAME': name},
+            'replica': {'ENGINE': 'core.sqlite', 'NAME': name, 'OPTIONS': {'read_only': True}},
+        })
+        self.addCleanup(self.handler.close_all)
+        self.writer, self.reader = self.handler['default'], self.handler['replica']
+        with self.writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT)')
+            cursor.execute("INSERT INTO item (title) VALUES ('first')")
+
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragma_profile(self):
+        self.assertEqual(self.pragma(self.writer, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(self.writer, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(self.writer, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(self.writer, 'temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma(self.reader, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(self.reader, 'query_only'), 1)
+
+    def test_replica_rejects_writes(self):
+        with self.assertRaises(DatabaseError), self.reader.cursor() as cursor:
+            cursor.execute("INSERT INTO item (title) VALUES ('second')")
+
+    def test_reads_do_not_wait_for_open_write(self):
+        with self.writer.cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute("UPDATE item SET title = 'draft'")
+            with self.reader.cursor() as reader:
+                reader.execute('SELECT title FROM item')
+                self.assertEqual(reader.fetchone()[0], 'first')
+            cursor.execute('COMMIT')
+        with self.reader.cursor() as reader:
+            reader.execute('SELECT title FROM item')
+            self.assertEqual(reader.fetchone()[0], 'draft')
+
+    def test_router_keeps_reads_inside_write_transaction(self):
+        router = ReadReplicaRouter()
+        with replica_reads():
+            # TestCase держит открытую транзакцию default
+            self.assertEqual(router.db_for_read(Tour), 'default')
+            with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                self.assertEqual(router.db_for_read(Tour), 'replica')
+        self.assertEqual(router.db_for_write(Tour), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+
+    def test_workers_and_writes_read_from_default(self):
+        router = ReadReplicaRouter()
+        seen = {}
+
+        def view(request):
+            seen[request.method] = router.db_for_read(Lead)
+            return HttpResponse()
+
+        middleware = ReplicaReadsMiddleware(view)
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            # Вне запроса (воркер, команда) записанное сразу перечитывается из default
+            self.assertEqual(router.db_for_read(Lead), 'default')
+            middleware(RequestFactory().get('/'))
+            middleware(RequestFactory().post('/lead/create/'))
+            self.assertEqual(router.db_for_read(Lead), 'default')
+        self.assertEqual(seen, {'GET': 'replica', 'POST': 'default'})
+
+
+class BackupTestCase(TestCase):
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        self.root, self.media = directory / 'backups', directory / 'media'
+        self.db = directory / 'db.sqlite3'
+        conn = sqlite3.connect(self.db)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT)')
+        conn.executemany('INSERT INTO item (title) VALUES (?)', [(f'item {i}',) for i in range(500)])
+        conn.commit()
+        self.addCleanup(conn.close)
+        self.conn = conn
+        (self.media / 'cas' / 'ab').mkdir(parents=True)
+        (self.media / 'cas' / 'ab' / 'one.jpg').write_bytes(b'jpeg' * 1000)
+        (self.media / 'cas' / 'ab' / 'two.txt').write_bytes(b'text' * 1000)
+        (self.media / 'cas' / 'ab' / 'copy.txt').write_bytes(b'text' * 1000)
+        patcher = mock.patch.object(backup, 'LOCK_TIMEOUT', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_backup(self):
+        return backup.backup(self.root, media_root=self.media, dbs={'default': str(self.db)})
+
+    def test_second_backup_reads_only_changed_files(self):
+        first = self.run_backup()
+        self.assertEqual((first['files'], first['changed'], first['reused']), (3, 3, 0))
+        # Одинаковое содержимое — один объект: база + два разных файла
+        self.assertEqual(len(list((self.root / 'objects').glob('*/*.gz'))), 3)
+
+        (self.media / 'cas' / 'ab' / 'three.txt').write_bytes(b'new')
+        with mock.patch.object(backup, 'store', wraps=backup.store) as store:
+            second = self.run_backup()
+        self.assertEqual((second['files'], second['changed'], second['reused']), (4, 1, 3))
+        self.assertEqual(store.call_count, 2)  # снимок базы и новый файл
+        self.assertEqual(len(backup.manifests(self.root)), 2)
+
+    def test_snapshot_of_live_database_while_writing(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.execute("INSERT INTO item (title) VALUES ('uncommitted')")
+        self.run_backup()
+        self.conn.rollback()
+        target = self.root.parent / 'restored.sqlite3'
+        backup.restore(self.root, media_root=self.media, dbs={'default': str(target)})
+        restored = sqlite3.connect(target)
+        self.addCleanup(restored.close)
+        self.assertEqual(restored.execute('SELECT COUNT(*) FROM item').fetchone()[0], 500)
+
+    def test_restore_streams_and_skips_matching_files(self):
+        self.run_backup()
+        (self.media / 'cas' / 'ab' / 'two.txt').write_bytes(b'damaged')
+        (self.media / 'cas' / 'ab' / 'one.jpg').unlink()
+        target = self.root.parent / 'restored.sqlite3'
+        stats = backup.restore(self.root, media_root=self.media, dbs={'default': str(target)})
+        self.assertEqual((stats['databases'], stats['files'], stats['skipped']), (1, 2, 1))
+        self.assertEqual((self.media / 'cas' / 'ab' / 'two.txt').read_bytes(), b'text' * 1000)
+        self.assertEqual((self.media / 'cas' / 'ab' / 'one.jpg').read_bytes(), b'jpeg' * 1000)
+        # mtime из манифеста: следующая копия ничего не перечитывает
+        self.assertEqual(self.run_backup()['changed'], 0)
+
+    def test_restore_refuses_database_open_elsewhere(self):
+        self.run_backup()
+        self.conn.execute("INSERT INTO item (title) VALUES ('after backup')")
+        self.conn.commit()
+        with self.assertRaises(backup.BackupError):
+            backup.restore(self.root, media_root=self.media, dbs={'default': str(self.db)})
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM item').fetchone()[0], 501)
+
+        self.conn.close()
+        backup.restore(self.root, media_root=self.media, dbs={'default': str(self.db)})
+        restored = sqlite3.connect(self.db)
+        self.addCleanup(restored.close)
+        self.assertEqual(restored.execute('SELECT COUNT(*) FROM item').fetchone()[0], 500)
+        self.assertEqual(restored.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+
+    def test_corrupted_object_leaves_current_data(self):
+        self.run_backup()
+        entry = backup.load(self.root)['media']['cas/ab/two.txt']
+        with gzip.open(backup.object_path(self.root, entry['object']), 'wb') as fh:
+            fh.write(b'tampered')
+        (self.media / 'cas' / 'ab' / 'two.txt').write_bytes(b'current')
+        with self.assertRaises(backup.BackupError):
+            backup.restore(self.root, verify_only=True, media_root=self.media, dbs={})
+        with self.assertRaises(backup.BackupError):
+            backup.restore(self.root, media_root=self.media, dbs={'default': str(self.db)})
+        self.assertEqual((self.media / 'cas' / 'ab' / 'two.txt').read_bytes(), b'current')
+        self.assertEqual(list(self.media.rglob('.*restore-*')), [])
+
+    def test_prune_keeps_objects_of_recent_backups(self):
+        self.run_backup()
+        (self.media / 'cas' / 'ab' / 'one.jpg').unlink()
+        self.run_backup()
+        out = StringIO()
+        with override_settings(MEDIA_ROOT=str(self.media)), \
+                mock.patch.object(backup, 'databases', return_value={'default': str(self.db)}):
+            call_command('backup', '--output', str(self.root), '--keep', '1', stdout=out)
+        self.assertIn('медиафайлов: 2', out.getvalue())
+        self.assertEqual(len(backup.manifests(self.root)), 1)
+        # Объект удалённого файла больше ни одной копии не нужен
+        self.assertEqual(len(list((self.root / 'objects').glob('*/*.gz'))), 2)
+
+
+@override_settings(SQL_TRACE_SAMPLE=0)
+class QueryTraceTestCase(TestCase):
+    def setUp(self):
+        querytrace._flagged.clear()
+        self.factory = RequestFactory()
+
+    def run_view(self, view):
+        def get_response(request):
+            view()
+            return HttpResponse('ok')
+        request = self.factory.get('/tours/')
+        return request, querytrace.QueryTraceMiddleware(get_response)(request)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            querytrace.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            querytrace.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s)  LIMIT 1'),
+        )
+        self.assertNotEqual(querytrace.fingerprint('SELECT "a" FROM "t1"'), querytrace.fingerprint('SELECT "a" FROM "t2"'))
+
+    def test_server_timing_counts_queries(self):
+        make_tour(1)
+        request, response = self.run_view(lambda: list(Tour.objects.all()))
+        self.assertEqual(request.sql_trace.count, 1)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", app;dur=[\d.]+$')
+
+    def test_repeated_shape_flagged_once(self):
+        tours = [make_tour(i) for i in range(6)]
+
+        def per_row():
+            for tour in tours:
+                Tour.objects.get(pk=tour.pk)
+
+        with self.assertLogs('core.querytrace', 'WARNING') as logs:
+            request, _ = self.run_view(per_row)
+        self.assertEqual(request.sql_trace.count, 6)
+        data = json.loads(logs.records[0].getMessage().split(' ', 1)[1])
+        self.assertEqual((data['queries'], data['repeated'][0]['count']), (6, 6))
+        # Повтор той же формы в той же вьюхе не пишется, пока не прошёл FLAG_INTERVAL
+        with self.assertNoLogs('core.querytrace', 'WARNING'):
+            self.run_view(per_row)
+
+    @override_settings(SQL_TRACE_SAMPLE=0.5)
+    def test_sampled_summary(self):
+        with mock.patch('core.querytrace.random.random', return_value=0.4), \
+                self.assertLogs('core.querytrace', 'INFO') as logs:
+            self.run_view(lambda: None)
+        self.assertIn('"queries": 0', logs.output[0])
+        with mock.patch('core.querytrace.random.random', return_value=0.6), \
+                self.assertNoLogs('core.querytrace', 'INFO'):
+            self.run_view(lambda: None)
+
+    def test_admin_changelist_has_no_per_row_queries(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        category = TourCategory.objects.create(name='Sea', slug='sea')
+        for i in range(6):
+            make_tour(i).categories.add(category)
+        response = self.client.get(reverse('admin:tours_tour_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.sql_trace.repeated(), [])
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Бюджеты главной и JSON API; подкласс повторяет их на каталоге x10."""
+
+    def test_home(self):
+        self.assertBudget(reverse('core:home'), 14, 100_000)
+
+    def test_subcategories(self):
+        root = self.catalog['tour_categories'][0].parent_id
+        self.assertBudget(reverse('core:get_subcategories', args=[root]), 2, 2_000)
+
+    def test_tours_by_category(self):
+        root = self.catalog['tour_categories'][0].parent_id
+        self.assertBudget(reverse('core:get_tours_by_category', args=[root]), 4, 5_000)
+
+    def test_all_tours(self):
+        self.assertBudget(reverse('core:get_all_tours'), 3, 5_000)
+
+    def test_suggest(self):
+        self.assertBudget(reverse('core:suggest') + '?q=тур', 5, 3_000)
+
+    def test_csrf(self):
+        self.assertBudget(reverse('core:csrf'), 0, 500)
+
+    def test_lead_create(self):
+        self.assertBudget(reverse('core:lead_create'), 4, 500, status=202, data={'name': 'Иван', 'phone': '+66 1'})
+
+
+class QueryBudgetX10TestCase(QueryBudgetTestCase):
+    SCALE = 10
+
+
+class SyntheticCatalogTestCase(TestCase):
+    def snapshot(self):
+        return (
+            list(Tour.objects.order_by('slug').values_list('slug', 'title', 'price_adult', 'is_active')),
+            list(Tour.categories.through.objects.order_by('tour__slug', 'tourcategory__slug')
+                 .values_list('tour__slug', 'tourcategory__slug')),
+            list(Review.objects.order_by('email').values_list('email', 'message', 'is_approved')),
+        )
+
+    def test_same_seed_same_catalog(self):
+        call_command('generate_catalog', scale=0.02, seed=3, stdout=StringIO())
+        first = self.snapshot()
+        with self.assertRaises(CommandError):
+            call_command('generate_catalog', scale=0.02, seed=3, stdout=StringIO())
+        call_command('generate_catalog', scale=0.02, seed=3, replace=True, stdout=StringIO())
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(Tour.objects.count(), 20)
+        self.assertEqual(Review.objects.count(), 100)
+
+    def test_derived_state_rebuilt(self):
+        call_command('generate_catalog', scale=0.02, stdout=StringIO())
+        root = TourCategory.objects.get(slug='gen-tours-0')
+        leaf = TourCategory.objects.get(slug='gen-tours-0-0')
+        self.assertEqual((root.path, leaf.path), (f'/{root.pk}/', f'/{root.pk}/{leaf.pk}/'))
+        active = Tour.objects.filter(is_active=True)
+        self.assertEqual(root.tours_count, active.filter(categories__path__startswith=root.path).distinct().count())
+        tour = active.first()
+        self.assertIn(tour, Tour.objects.search(tour.title.split()[-2]))
+        self.assertTrue(tour.similar.exists())
+
+    def test_remove_keeps_real_data(self):
+        make_tour(1)
+        call_command('generate_catalog', scale=0.01, stdout=StringIO())
+        synthetic.remove()
+        self.assertEqual(list(Tour.objects.values_list('slug', flat=True)), ['tour-1'])
+        self.assertFalse(Review.objects.exists())
+
+
+class BenchmarkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        SiteSettings.objects.create(site_name='TravelWorld')
+        synthetic.insert(scale=0.01)
+        synthetic.rebuild(StringIO())
+
+    def test_every_endpoint_responds(self):
+        result = benchmark.run(requests=2, concurrency=1, warmup=0)
+        self.assertEqual(len(result['endpoints']), 22)
+        failed = {name: stats['path'] for name, stats in result['endpoints'].items() if stats['errors']}
+        self.assertEqual(failed, {})
+        self.assertEqual(result['catalog']['tours.Tour'], 10)
+        stats = result['endpoints']['tours']
+        self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+        self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+
+    def test_concurrent_run_and_baseline(self):
+        # Потоки не видят транзакцию теста — страница без запросов к базе
+        result = benchmark.run([('csrf', reverse('core:csrf'))], requests=20, concurrency=4, warmup=1)
+        stats = result['endpoints']['csrf']
+        self.assertEqual((stats['requests'], stats['errors']), (20, 0))
+        self.assertGreater(stats['rps'], 0)
+
+        path = Path(tempfile.mkdtemp()) / 'baseline.json'
+        self.addCleanup(shutil.rmtree, path.parent)
+        call_command('benchmark', endpoint=['tours'], requests=2, concurrency=1, warmup=0,
+                     output=str(path), stdout=StringIO())
+        baseline = json.loads(path.read_text())
+        baseline['endpoints']['tours'].update(rps=10 ** 9)
+        path.write_text(json.dumps(baseline))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'Регрессий: 1'):
+            call_command('benchmark', endpoint=['tours'], requests=2, concurrency=1, warmup=0,
+                         baseline=str(path), stdout=out)
+        self.assertIn('tours: rps', out.getvalue())
+
+    def test_compare(self):
+        base = {'endpoints': {'home': {'p95_ms': 10.0, 'rps': 100.0, 'errors': 0}}}
+
+        def run(**stats):
+            return {'endpoints': {'home': {'p95_ms': 10.0, 'rps': 100.0, 'errors': 0, **stats}}}
+
+        self.assertEqual(benchmark.compare(run(p95_ms=11.9, rps=81.0), base), [])
+        # +25%, но меньше MIN_DELTA_MS — шум
+        self.assertEqual(benchmark.compare(run(p95_ms=1.25), {'endpoints': {'home': {**base['endpoints']['home'], 'p95_ms': 1.0}}}), [])
+        self.assertEqual(
+            [(item['metric'], item['change']) for item in benchmark.compare(run(p95_ms=15.0, rps=50.0, errors=1), base)],
+            [('p95_ms', 0.5), ('rps', -0.5), ('errors', None)],
+        )
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 99), 4)
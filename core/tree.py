@@ -0,0 +1,202 @@
+"""
+Деревья категорий с материализованным путём.
+
+Категории туров и услуг хранят ``parent`` (список смежности) и, дополнительно,
+``path`` — цепочку id от корня до узла вида ``/3/17/42/`` — и ``depth``.
+Путь поддерживается в ``save()``: при переносе узла одним UPDATE переписываются
+пути всего поддерева. Благодаря этому одним запросом по индексу ``path``
+выбираются:
+
+  * поддерево — префикс ``path LIKE '/3/17/%'`` (``startswith``). Диапазон
+    ``'/3/17/' <= path < '/3/170'`` верен только при побайтовой сортировке:
+    локальные правила сравнения PostgreSQL (ru_RU, en_US) не учитывают ``/``
+    и перемешивают пути. Для ``startswith`` Django создаёт на PostgreSQL
+    индекс ``varchar_pattern_ops``; на SQLite LIKE идёт без индекса, но
+    категорий в дереве — десятки;
+  * предки (хлебные крошки) — ``pk IN (id из пути)``;
+  * количество активных элементов в каждом поддереве — коррелированный подзапрос.
+
+Удаление каскадное (``on_delete=CASCADE`` у ``parent``), пути оставшихся узлов
+при этом не меняются. ``rebuild_paths()`` пересчитывает пути с нуля — для
+миграции и после массовых ``update(parent=...)`` в обход ``save()``.
+"""
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
+from django.dispatch import Signal
+
+SEP = "/"
+
+# Перенос узла: отправляется из save() после переписи путей поддерева
+# (post_save приходит раньше — потомки там ещё со старыми путями): instance, old_path
+moved = Signal()
+
+
+def path_ids(path):
+    """Id узлов пути от корня: ``'/3/17/'`` -> ``[3, 17]``."""
+    return [int(part) for part in (path or "").split(SEP) if part]
+
+
+def subtree_q(path, prefix=""):
+    """Условие «узел лежит в поддереве ``path`` (включая сам узел)»."""
+    return Q(**{f"{prefix}path__startswith": path})
+
+
+def outer_subtree_q(prefix=""):
+    """Как ``subtree_q``, но для пути строки внешнего запроса (``OuterRef("path")``)."""
+    return Q(**{f"{prefix}path__startswith": OuterRef("path")})
+
+
+def count_subquery(items):
+    """Коррелированный ``COUNT(DISTINCT pk)`` по выборке ``items`` (0 вместо NULL)."""
+    items = (
+        items.order_by()
+        .annotate(_one=Value(1, output_field=IntegerField()))
+        .values("_one")
+        .annotate(n=Count("pk", distinct=True))
+        .values("n")
+    )
+    return Coalesce(Subquery(items), 0)
+
+
+class TreeQuerySet(models.QuerySet):
+    def roots(self):
+        return self.filter(parent__isnull=True)
+
+    def subtree(self, node):
+        """Узел и все его потомки."""
+        return self.filter(subtree_q(node.path))
+
+    def with_subtree_counts(self, name, relation, **filters):
+        """
+        Аннотирует каждую категорию количеством элементов ``relation``
+        (обратная связь M2M, например ``"tours"``) во всём её поддереве.
+        ``filters`` ограничивают элементы: ``is_active=True``.
+        """
+        rel = self.model._meta.get_field(relation)
+        items = rel.related_model.objects.filter(**filters).filter(outer_subtree_q(f"{rel.field.name}__"))
+        return self.annotate(**{name: count_subquery(items)})
+
+
+class MaterializedPathModel(models.Model):
+    """Абстрактная категория-дерево: требует у наследника поле ``parent`` на себя."""
+
+    path = models.CharField("Путь в дереве", max_length=255, default="", editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField("Глубина", default=0, editable=False)
+
+    objects = TreeQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Путь на момент загрузки: по нему при переносе находится поддерево.
+        # None — поле отложено (.only()/.defer()), тогда путь читается при сохранении.
+        self._saved_path = self.__dict__.get("path")
+
+    # ---------- навигация ----------
+    def ancestor_ids(self, include_self=False):
+        ids = path_ids(self.path)
+        return ids if include_self else ids[:-1]
+
+    def get_ancestors(self, include_self=False):
+        """Предки от корня к узлу — одним запросом."""
+        ids = self.ancestor_ids(include_self)
+        if not ids:
+            return []
+        return list(type(self).objects.filter(pk__in=ids).order_by("depth"))
+
+    def get_descendants(self, include_self=False):
+        qs = type(self).objects.subtree(self)
+        return qs if include_self else qs.exclude(pk=self.pk)
+
+    def is_descendant_of(self, other):
+        return bool(other.path) and self.path.startswith(other.path) and self.pk != other.pk
+
+    # ---------- поддержка пути ----------
+    def _parent_path(self):
+        if self.parent_id is None:
+            return SEP
+        parent = self.parent
+        if not parent.path:
+            # Родитель создан в обход save() (bulk_create) — достраиваем его путь
+            parent.save()
+        return parent.path
+
+    def _compute_path(self):
+        path = f"{self._parent_path()}{self.pk}{SEP}"
+        return path, len(path_ids(path)) - 1
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id and (
+            self.parent_id == self.pk or self.pk in path_ids(self.parent.path)
+        ):
+            raise ValidationError({"parent": "Категорию нельзя вложить в саму себя или в своего потомка."})
+
+    def save(self, *args, **kwargs):
+        manager = type(self)._default_manager
+        if self.pk is None:
+            # id известен только после вставки: путь дописываем UPDATE'ом,
+            # чтобы post_save не срабатывал дважды
+            super().save(*args, **kwargs)
+            self.path, self.depth = self._compute_path()
+            manager.using(self._state.db).filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            self._saved_path = self.path
+            return
+
+        if self.parent_id and (self.parent_id == self.pk or self.pk in path_ids(self.parent.path)):
+            raise ValueError("Категорию нельзя вложить в саму себя или в своего потомка")
+        old_path = self._saved_path
+        if old_path is None:
+            old_path = manager.filter(pk=self.pk).values_list("path", flat=True).first() or ""
+
+        self.path, self.depth = self._compute_path()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and old_path != self.path:
+            kwargs["update_fields"] = {*update_fields, "path", "depth"}
+        super().save(*args, **kwargs)
+
+        if old_path and old_path != self.path:
+            # Перенос: переписываем префикс пути у всех потомков одним запросом
+            delta = self.depth - (len(path_ids(old_path)) - 1)
+            manager.using(self._state.db).filter(subtree_q(old_path)).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr("path", len(old_path) + 1)),
+                depth=models.F("depth") + delta,
+            )
+            moved.send(sender=type(self), instance=self, old_path=old_path)
+        self._saved_path = self.path
+
+    save.alters_data = True
+
+
+def rebuild_paths(model):
+    """
+    Пересчитывает ``path``/``depth`` всех узлов модели по ``parent``.
+    Работает и с историческими моделями миграций (нужны только поля).
+    Возвращает количество изменённых узлов.
+    """
+    rows = list(model.objects.values_list("pk", "parent_id", "path", "depth"))
+    children = {}
+    for pk, parent_id, _, _ in rows:
+        children.setdefault(parent_id, []).append(pk)
+    current = {pk: (path, depth) for pk, _, path, depth in rows}
+
+    computed = {}
+    stack = [(pk, SEP, 0) for pk in children.get(None, [])]
+    while stack:
+        pk, parent_path, depth = stack.pop()
+        path = f"{parent_path}{pk}{SEP}"
+        computed[pk] = (path, depth)
+        stack.extend((child, path, depth + 1) for child in children.get(pk, []))
+
+    changed = [pk for pk, value in computed.items() if current[pk] != value]
+    objs = []
+    for pk in changed:
+        obj = model(pk=pk)
+        obj.path, obj.depth = computed[pk]
+        objs.append(obj)
+    model.objects.bulk_update(objs, ["path", "depth"], batch_size=500)
+    return len(objs)
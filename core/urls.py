@@ -10,4 +10,7 @@ urlpatterns = [
     path("api/categories/<int:category_id>/subcategories/", views.get_subcategories, name="get_subcategories"),                                                                                                         
     path("api/categories/<int:category_id>/tours/", views.get_tours_by_category, name="get_tours_by_category"),                                                                                                         
     path("api/tours/all/", views.get_all_tours, name="get_all_tours"),
+    path("api/suggest/", views.suggest, name="suggest"),
+    path("api/pagecache/stats/", views.pagecache_stats, name="pagecache_stats"),
+    path("csrf/", views.csrf_token, name="csrf"),
 ]
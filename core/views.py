@@ -1,10 +1,16 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count, Q
 from django.template.loader import render_to_string
-from .models import Lead
+from .cache import CATALOG
+from .conditional import conditional
+from .sampling import random_sample, pool_stats
+from . import images, leads, pagecache, suggest as suggest_index
 from tours.models import Tour, TourCategory
+from tours import cards as tour_cards
 from services.models import Service
 from reviews.models import Review
 from news.models import NewsPost
@@ -13,35 +19,34 @@ from blog.models import BlogPost
 
 def home(request):
     """Главная страница: отдаёт список актуальных туров для карточек на главной."""
-    # Для главной берём 6 случайных актуальных туров
-    tours = list(Tour.objects.filter(is_active=True))
-    services = list(Service.objects.filter(is_active=True))
-    import random
-    random.shuffle(tours)
-    random.shuffle(services)
-    tours = tours[:6]  # Изменено с 9 на 6
-    services = services[:9]
+    # Случайные карточки выбираются по первичным ключам, без загрузки таблиц целиком
+    active_tours = Tour.objects.filter(is_active=True)
+    tours = random_sample('tours', active_tours, 6)
+    services = random_sample('services', Service.objects.filter(is_active=True), 9)
     
-    # Родительские категории туров с количеством туров
+    # Родительские категории туров с количеством туров (колонка-счётчик, core.counters)
     parent_categories = TourCategory.objects.filter(
-        parent__isnull=True
-    ).annotate(
-        tours_count=Count('tours', filter=Q(tours__is_active=True))
-    ).filter(tours_count__gt=0).order_by('name')
+        parent__isnull=True, tours_count__gt=0
+    ).order_by('name')
     
-    # Общее количество активных туров
-    total_tours_count = Tour.objects.filter(is_active=True).count()
+    # Общее количество активных туров (из закэшированной сводки выборки)
+    total_tours_count = pool_stats('tours', active_tours)['count']
     
     # Случайные одобренные отзывы (макс. 3)
-    reviews = list(Review.objects.filter(is_approved=True))
-    random.shuffle(reviews)
-    reviews = reviews[:3]
+    reviews = random_sample('reviews', Review.objects.filter(is_approved=True), 3)
     # Последние три новости для главной страницы
     news_posts = list(NewsPost.objects.filter(is_published=True).order_by('-pub_date')[:3])
     # Случайные блог-посты (макс. 3)
-    blog_list = list(BlogPost.objects.filter(is_published=True))
-    random.shuffle(blog_list)
-    blog_posts = blog_list[:3]
+    blog_posts = random_sample('blog', BlogPost.objects.filter(is_published=True), 3)
+    pagecache.tag(
+        request, 'tours', 'services', 'reviews', 'news', 'blog',
+        *tours, *services, *news_posts, *blog_posts,
+    )
+    # Обложки и фото всех блоков главной — одним запросом к метаданным изображений
+    images.prime(
+        *(item.cover for item in [*tours, *services, *news_posts, *blog_posts]),
+        *(review.image for review in reviews),
+    )
     return render(request, 'index.html', {
         'tours': tours,
         'services': services,
@@ -55,38 +60,23 @@ def home(request):
 
 @require_POST
 def lead_create(request):
-    name = request.POST.get('name')
-    phone = request.POST.get('phone')
-    if not (name and phone):
-        return HttpResponseBadRequest('name and phone required')
-    lead = Lead.objects.create(
-        name=name,
-        phone=phone,
-        email=request.POST.get('email', ''),
-        message=request.POST.get('message', ''),
-        source_page=request.POST.get('source_page', request.META.get('HTTP_REFERER', '')),
-        cta=request.POST.get('cta', ''),
-        utm_source=request.POST.get('utm_source', ''),
-        utm_medium=request.POST.get('utm_medium', ''),
-        utm_campaign=request.POST.get('utm_campaign', ''),
-        utm_term=request.POST.get('utm_term', ''),
-        utm_content=request.POST.get('utm_content', ''),
-        related_type=request.POST.get('related_type', ''),
-        related_id=request.POST.get('related_id') or None,
-    )
-    return JsonResponse({'ok': True, 'id': lead.id})
+    """Приём заявки: запись в журнал (core.leads), в базу её переносит flush_leads."""
+    try:
+        key = leads.submit(request)
+    except leads.InvalidLead as exc:
+        return JsonResponse({'ok': False, 'errors': exc.errors}, status=400)
+    return JsonResponse({'ok': True, 'key': key}, status=202)
 
 
+@conditional(CATALOG)
 def get_subcategories(request, category_id):
     """API endpoint для получения подкатегорий родительской категории."""
     parent_category = get_object_or_404(TourCategory, id=category_id, parent__isnull=True)
     
     # Получаем подкатегории с количеством туров
     subcategories = TourCategory.objects.filter(
-        parent=parent_category
-    ).annotate(
-        tours_count=Count('tours', filter=Q(tours__is_active=True))
-    ).filter(tours_count__gt=0).order_by('name')
+        parent=parent_category, tours_count__gt=0
+    ).order_by('name')
     
     # Рендерим HTML для подкатегорий
     html = render_to_string('partials/subcategories.html', {
@@ -96,64 +86,48 @@ def get_subcategories(request, category_id):
     return JsonResponse({'html': html})
 
 
+@conditional(CATALOG)
 def get_tours_by_category(request, category_id):
     """API endpoint для получения туров по категории."""
-    category = get_object_or_404(TourCategory, id=category_id)
-    
-    # Получаем туры этой категории (включая подкатегории)
-    tours = Tour.objects.filter(
-        categories=category,
-        is_active=True
-    ).select_related().prefetch_related('categories')
-    
-    # Случайно перемешиваем и берем до 6
-    import random
-    tours_list = list(tours)
-    random.shuffle(tours_list)
-    tours_list = tours_list[:6]
-    
-    # Формируем данные для JSON
-    tours_data = []
-    for tour in tours_list:
-        tours_data.append({
-            'id': tour.id,
-            'title': tour.title,
-            'location': tour.location,
-            'cover': tour.cover.url if tour.cover else None,
-            'url': tour.get_absolute_url(),
-            'rating': float(tour.rating) if tour.rating else 4.5,
-            'is_popular': tour.is_popular,
-            'has_discount': tour.has_discount,
-        })
-    
-    return JsonResponse({'tours': tours_data})
+    # Случайные 6 карточек из закэшированного пула категории (tours.cards)
+    body = tour_cards.sample_cards_json(category_id, 6)
+    if body is None:
+        raise Http404('Категория не найдена')
+    return HttpResponse(body, content_type='application/json')
 
 
+@conditional(CATALOG)
 def get_all_tours(request):
     """API endpoint для получения всех туров."""
-    tours = Tour.objects.filter(is_active=True).select_related().prefetch_related('categories')
-    
-    # Случайно перемешиваем и берем до 6
-    import random
-    tours_list = list(tours)
-    random.shuffle(tours_list)
-    tours_list = tours_list[:6]
-    
-    # Формируем данные для JSON
-    tours_data = []
-    for tour in tours_list:
-        tours_data.append({
-            'id': tour.id,
-            'title': tour.title,
-            'location': tour.location,
-            'cover': tour.cover.url if tour.cover else None,
-            'url': tour.get_absolute_url(),
-            'rating': float(tour.rating) if tour.rating else 4.5,
-            'is_popular': tour.is_popular,
-            'has_discount': tour.has_discount,
-        })
-    
-    return JsonResponse({'tours': tours_data})
+    body = tour_cards.sample_cards_json(tour_cards.ALL, 6)
+    return HttpResponse(body, content_type='application/json')
+
+
+@conditional(CATALOG)
+def suggest(request):
+    """API endpoint подсказок при наборе: префиксный поиск по каталогу без запросов к БД."""
+    q = (request.GET.get('q') or '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 20)
+    except ValueError:
+        limit = 10
+    return JsonResponse({'query': q, 'suggestions': suggest_index.suggest(q, limit) if q else []})
+
+
+@never_cache
+def csrf_token(request):
+    """
+    CSRF-токен для AJAX-форм (static/js/csrf.js): закэшированные страницы
+    (core.pagecache) общие для всех посетителей и токена не содержат.
+    """
+    return JsonResponse({'token': get_token(request)})
+
+
+@staff_member_required
+@never_cache
+def pagecache_stats(request):
+    """Счётчики полностраничного кэша для мониторинга: попадания, промахи, сбросы."""
+    return JsonResponse(pagecache.stats())
 
 
 def health_ok(request):
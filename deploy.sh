@@ -23,6 +23,12 @@ docker compose -f $COMPOSE_FILE up -d
 echo "➡️  Применяем миграции..."
 docker compose -f $COMPOSE_FILE run --rm $SERVICE_NAME python manage.py migrate --noinput
 
+echo "➡️  Перестраиваем поисковый индекс..."
+docker compose -f $COMPOSE_FILE run --rm $SERVICE_NAME python manage.py rebuild_search_index
+
+echo "➡️  Пересобираем похожие туры и услуги..."
+docker compose -f $COMPOSE_FILE run --rm $SERVICE_NAME python manage.py rebuild_related
+
 echo "➡️  Собираем статику..."
 docker compose -f $COMPOSE_FILE run --rm $SERVICE_NAME python manage.py collectstatic --noinput
 
@@ -0,0 +1,21 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+
+class NewsQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Бюджеты новостей; подкласс повторяет их на каталоге x10."""
+
+    def test_list(self):
+        self.assertBudget(reverse('news:list'), 5, 50_000)
+
+    def test_page(self):
+        self.assertBudget(reverse('news:list') + '?page=2', 5, 50_000)
+
+    def test_detail(self):
+        self.assertBudget(reverse('news:detail', args=['news-1']), 5, 40_000)
+
+
+class NewsQueryBudgetX10TestCase(NewsQueryBudgetTestCase):
+    SCALE = 10
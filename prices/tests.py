@@ -0,0 +1,19 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+# Прайс намеренно выводит все туры и услуги: размер растёт с каталогом, запросы — нет
+BASE_BYTES = 40_000
+BYTES_PER_SCALE = 55_000
+
+
+class PriceQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Бюджет прайса; подкласс повторяет его на каталоге x10."""
+
+    def test_list(self):
+        self.assertBudget(reverse('prices:list'), 11, BASE_BYTES + BYTES_PER_SCALE * self.SCALE)
+
+
+class PriceQueryBudgetX10TestCase(PriceQueryBudgetTestCase):
+    SCALE = 10
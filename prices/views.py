@@ -1,37 +1,43 @@
 from django.shortcuts import render
-from django.db.models import Count, Q
 from tours.models import Tour, TourCategory
 from services.models import Service, ServiceCategory
+from core import pagecache
 from core.models import Tag
 
+# Поля строки прайса, общие для туров и услуг
+PRICE_FIELDS = (
+    'id', 'title', 'slug', 'cover', 'short_desc', 'location',
+    'price_adult', 'price_child', 'price_old_adult',
+)
+
 
 def price_list(request):
-    # Основные цены: берем price_adult как главную для туров/услуг
+    # Основные цены: берем price_adult как главную для туров/услуг.
+    # only() перечисляет все поля, которые выводит шаблон: отложенное поле
+    # догружается отдельным запросом на каждую строку прайса
     tours = (
         Tour.objects.filter(is_active=True)
-        .only('id', 'title', 'slug', 'price_adult')
+        .only(*PRICE_FIELDS, 'duration', 'price_old_child')
         .order_by('-is_popular', '-created_at')
     )
     services = (
         Service.objects.filter(is_active=True)
-        .only('id', 'title', 'slug', 'price_adult')
+        .only(*PRICE_FIELDS, 'price_extra')
         .order_by('-created_at')
     )
 
-    # Сайдбар: категории и теги
+    # Сайдбар: категории и теги (счётчики активных элементов — колонки, см. core.counters)
     # Категории для туров: используем TourCategory
     categories_tours = (
         TourCategory.objects
-        .annotate(items=Count('tours', filter=Q(tours__is_active=True)))
-        .filter(items__gt=0)
+        .filter(tours_count__gt=0)
         .order_by('name')
     )
 
     # Категории для услуг: используем ServiceCategory
     categories_services = (
         ServiceCategory.objects
-        .annotate(items=Count('services', filter=Q(services__is_active=True)))
-        .filter(items__gt=0)
+        .filter(services_count__gt=0)
         .order_by('name')
     )
 
@@ -57,6 +63,9 @@ def price_list(request):
     if not pdf:
         pdf = PricePDF.objects.order_by('-uploaded_at').first()
 
+    # Прайс перечисляет все активные элементы: сбрасывается при любом их изменении
+    pagecache.tag(request, 'prices', 'tours', 'services', 'sidebar:tours', 'sidebar:services')
+
     return render(request, 'prices/price_list.html', {
         'tours': tours,
         'services': services,
@@ -30,6 +30,39 @@ warning() {
     echo -e "${YELLOW}[WARNING]${NC} $1"
 }
 
+# Файл compose запущенного проекта: compose.yml или docker-compose.prod.yml (deploy.sh)
+COMPOSE_FILE="${COMPOSE_FILE:-compose.yml}"
+STOPPED_SERVICES=""
+
+# Останавливает запущенные сервисы compose: процессы с открытой базой
+# продолжили бы работать со старым файлом, а restore_backup откажется
+# подменять базу, пока её кто-то держит
+stop_services() {
+    if command -v docker > /dev/null && [ -f "$COMPOSE_FILE" ]; then
+        # Базу держат все сервисы приложения — кроме caddy
+        STOPPED_SERVICES=$(docker compose -f "$COMPOSE_FILE" ps --services --status running 2>/dev/null | grep -v '^caddy$' | xargs)
+        if [ -n "$STOPPED_SERVICES" ]; then
+            warning "Останавливаем сервисы: $STOPPED_SERVICES"
+            docker compose -f "$COMPOSE_FILE" stop $STOPPED_SERVICES
+            trap start_services EXIT
+        fi
+    fi
+    if pgrep -f "manage.py runserver" > /dev/null; then
+        warning "Обнаружен запущенный Django сервер. Останавливаем..."
+        pkill -f "manage.py runserver" || true
+        sleep 2
+    fi
+}
+
+# Запускает остановленные сервисы обратно (и после ошибки восстановления)
+start_services() {
+    if [ -n "$STOPPED_SERVICES" ]; then
+        log "Запускаем сервисы: $STOPPED_SERVICES"
+        docker compose -f "$COMPOSE_FILE" start $STOPPED_SERVICES
+        STOPPED_SERVICES=""
+    fi
+}
+
 # Функция показа справки
 show_help() {
     echo "Использование: $0 [ОПЦИИ] [АРХИВ]"
@@ -37,7 +70,8 @@ show_help() {
     echo "Восстанавливает базу данных и медиа файлы из архива TDP"
     echo ""
     echo "Аргументы:"
-    echo "  АРХИВ    Путь к архиву для восстановления (опционально)"
+    echo "  АРХИВ    Путь к архиву для восстановления (опционально):"
+    echo "           каталог копий backup.sh, манифест .json или старый .zip"
     echo "           Если не указан, скрипт предложит выбрать из найденных"
     echo ""
     echo "Опции:"
@@ -49,6 +83,7 @@ show_help() {
     echo "  $0                                    # Интерактивный выбор архива"
     echo "  $0 tdp_14092025_104500.zip           # Указать архив напрямую"
     echo "  $0 ~/Downloads/tdp_14092025_104500.zip"
+    echo "  $0 ~/Downloads/tdp_backups           # Последняя копия из хранилища"
     echo "  $0 --dry-run                         # Предварительный просмотр"
 }
 
@@ -113,6 +148,13 @@ if [ -z "$ARCHIVE_FILE" ]; then
         done < <(find "$HOME/Desktop" -name "tdp_*.zip" -print0 2>/dev/null)
     fi
     
+    # Хранилища копий manage.py backup
+    for store in "$HOME/Downloads/tdp_backups" "$HOME/Desktop/tdp_backups" "./tdp_backups" "${BACKUP_ROOT:-}"; do
+        if [ -n "$store" ] && [ -d "$store/manifests" ]; then
+            FOUND_ARCHIVES+=("$store")
+        fi
+    done
+
     # Поиск в текущей директории
     while IFS= read -r -d '' file; do
         FOUND_ARCHIVES+=("$file")
@@ -135,7 +177,7 @@ if [ -z "$ARCHIVE_FILE" ]; then
     echo ""
     for i in "${!FOUND_ARCHIVES[@]}"; do
         file="${FOUND_ARCHIVES[$i]}"
-        size=$(du -h "$file" | cut -f1)
+        size=$(du -sh "$file" | cut -f1)
         date=$(stat -f "%Sm" -t "%d.%m.%Y %H:%M" "$file" 2>/dev/null || stat -c "%y" "$file" 2>/dev/null | cut -d' ' -f1,2 | cut -d'.' -f1)
         echo "  $((i+1)). $(basename "$file") ($size, $date)"
     done
@@ -153,7 +195,7 @@ if [ -z "$ARCHIVE_FILE" ]; then
             elif [ "$choice" -eq $(( ${#FOUND_ARCHIVES[@]} + 1 )) ]; then
                 echo ""
                 read -p "Введите полный путь к архиву: " ARCHIVE_FILE
-                if [ -f "$ARCHIVE_FILE" ]; then
+                if [ -e "$ARCHIVE_FILE" ]; then
                     break
                 else
                     error "Файл не найден: $ARCHIVE_FILE"
@@ -177,6 +219,52 @@ if [ ! -f "manage.py" ]; then
     exit 1
 fi
 
+# Хранилище копий manage.py backup (каталог или манифест .json):
+# потоковое восстановление с проверкой хэшей и integrity_check базы
+if [ -d "$ARCHIVE_FILE" ] || [[ "$ARCHIVE_FILE" == *.json ]]; then
+    if [ -d "$ARCHIVE_FILE" ]; then
+        STORE_DIR="$ARCHIVE_FILE"
+        MANIFEST=""
+    else
+        STORE_DIR="$(dirname "$(dirname "$ARCHIVE_FILE")")"
+        MANIFEST="$ARCHIVE_FILE"
+    fi
+    log "Хранилище копий: $STORE_DIR ${MANIFEST:+(манифест $(basename "$MANIFEST"))}"
+
+    log "Проверяем целостность копии..."
+    python manage.py restore_backup $MANIFEST --input "$STORE_DIR" --verify-only
+
+    if [ "$DRY_RUN" = true ]; then
+        log "Режим dry-run: изменения не будут применены"
+        exit 0
+    fi
+
+    if [ "$FORCE" = false ]; then
+        echo ""
+        warning "ВНИМАНИЕ: Это действие перезапишет текущую базу данных и медиа файлы!"
+        read -p "Продолжить? (y/N): " -n 1 -r
+        echo
+        if [[ ! $REPLY =~ ^[Yy]$ ]]; then
+            log "Восстановление отменено"
+            exit 0
+        fi
+    fi
+
+    # Файлы подменяются только после проверки, но процессы со старой базой
+    # держат её открытой — сервисы останавливаем
+    stop_services
+
+    log "Восстанавливаем из копии..."
+    python manage.py restore_backup $MANIFEST --input "$STORE_DIR"
+
+    log "Проверяем миграции..."
+    python manage.py migrate --noinput
+
+    echo ""
+    success "Восстановление завершено успешно!"
+    exit 0
+fi
+
 # Проверяем существование архива
 if [ ! -f "$ARCHIVE_FILE" ]; then
     error "Архив не найден: $ARCHIVE_FILE"
@@ -313,13 +401,9 @@ if [ "$FORCE" = false ]; then
     fi
 fi
 
-# Останавливаем Django сервер если он запущен
+# Останавливаем сервисы и Django сервер, если они запущены
 log "Проверяем запущенные Django процессы..."
-if pgrep -f "manage.py runserver" > /dev/null; then
-    warning "Обнаружен запущенный Django сервер. Останавливаем..."
-    pkill -f "manage.py runserver" || true
-    sleep 2
-fi
+stop_services
 
 # Создаем резервную копию текущих файлов
 BACKUP_TIMESTAMP=$(date +"%d%m%Y_%H%M%S")
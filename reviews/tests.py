@@ -0,0 +1,21 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+
+class ReviewQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Бюджеты отзывов; подкласс повторяет их на каталоге x10."""
+
+    def test_list(self):
+        self.assertBudget(reverse('reviews:list'), 5, 50_000)
+
+    def test_page(self):
+        self.assertBudget(reverse('reviews:list') + '?page=last', 5, 50_000)
+
+    def test_form(self):
+        self.assertBudget(reverse('reviews:add'), 3, 40_000)
+
+
+class ReviewQueryBudgetX10TestCase(ReviewQueryBudgetTestCase):
+    SCALE = 10
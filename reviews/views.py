@@ -1,6 +1,8 @@
 from django.views.generic import ListView, CreateView
 from django.contrib import messages
 from django.urls import reverse_lazy
+from core import pagecache
+
 from .models import Review
 
 
@@ -8,8 +10,10 @@ class ReviewListView(ListView):
     model = Review
     template_name = 'reviews/review_list.html'
     context_object_name = 'reviews'
+    paginate_by = 20
 
     def get_queryset(self):
+        pagecache.tag(self.request, 'reviews')
         return Review.objects.filter(is_approved=True)
 
 
@@ -20,11 +20,15 @@ class ServiceAdmin(admin.ModelAdmin):
         ('Параметры', {'fields': ('is_active', 'is_popular', 'rating', 'reviews_count')}),
     )
 
+    def get_queryset(self, request):
+        # Категории для колонки списка — одним запросом, а не по запросу на строку
+        return super().get_queryset(request).prefetch_related('categories')
+
     def get_categories(self, obj):
         return ", ".join([c.name for c in obj.categories.all()])
     get_categories.short_description = 'Категории'
 
 @admin.register(ServiceCategory)
 class ServiceCategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'parent')
+    list_display = ('name', 'slug', 'parent', 'services_count')
     prepopulated_fields = {'slug': ('name',)}
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+from core.tree import rebuild_paths
+
+
+def fill_paths(apps, schema_editor):
+    rebuild_paths(apps.get_model('services', 'ServiceCategory'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_service_supplier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
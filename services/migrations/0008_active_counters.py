@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0007_category_tree_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='services_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных услуг'),
+        ),
+        migrations.AddIndex(
+            model_name='servicecategory',
+            index=models.Index(fields=['parent', 'services_count'], name='service_category_count_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_active_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='services.service')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='services.service')),
+            ],
+            options={
+                'ordering': ['source', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('source', 'rank'), name='related_service_rank_uniq')],
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.urls import reverse
 
+from core.tree import MaterializedPathModel
+
 class Service(models.Model):
     title        = models.CharField(max_length=200)
     supplier     = models.CharField(
@@ -72,7 +74,7 @@ class Service(models.Model):
     @property
     def has_discount(self) -> bool:
         return bool(self.price_old_adult and self.price_old_adult > self.price_adult)
-class ServiceCategory(models.Model):
+class ServiceCategory(MaterializedPathModel):
     name = models.CharField("Название", max_length=120)
     slug = models.SlugField("Слаг", unique=True)
     parent = models.ForeignKey(
@@ -80,10 +82,15 @@ class ServiceCategory(models.Model):
         related_name='children', on_delete=models.CASCADE,
         verbose_name="Родительская категория"
     )
+    # Активные услуги во всём поддереве; поддерживается core.counters
+    services_count = models.PositiveIntegerField("Активных услуг", default=0, editable=False)
 
     class Meta:
         verbose_name = 'Категория услуги'
         verbose_name_plural = 'Категории услуг'
+        indexes = [
+            models.Index(fields=["parent", "services_count"], name="service_category_count_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -100,3 +107,20 @@ class ServiceImage(models.Model):
 
     def __str__(self):
         return f"{self.service.title} #{self.id}"
+
+
+class RelatedService(models.Model):
+    """Предрасчитанные «похожие услуги» (core.related)."""
+    source = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='similar')
+    target = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='similar_to')
+    score  = models.FloatField()
+    rank   = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['source', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'rank'], name='related_service_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.source_id} → {self.target_id} ({self.score:.2f})"
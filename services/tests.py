@@ -1,25 +1,20 @@
 from django.test import TestCase
 from django.urls import reverse
-from core.models import Category, Tag
-from .models import Service
+from core.models import Tag
+from core.testing import QueryBudgetMixin, make_service
+from .models import Service, ServiceCategory
 
 
 class ServiceViewsTestCase(TestCase):
 	def setUp(self):
 		# категории и теги
-		self.cat = Category.objects.create(name='Тестовая', slug='test-cat')
+		self.cat = ServiceCategory.objects.create(name='Тестовая', slug='test-cat')
 		self.tag1 = Tag.objects.create(name='Тег1', slug='tag1')
 
 		# услуги
 		for i in range(1, 7):
-			s = Service.objects.create(
-				title=f'Service {i}', slug=f'service-{i}',
-				category=self.cat,
-				short_desc='short', description='desc',
-				price_adult=1000 + i,
-				price_child=500 + i,
-				is_active=True,
-			)
+			s = make_service(i, short_desc='short', price_child=500 + i, is_active=True)
+			s.categories.add(self.cat)
 			# добавить тег к первой услуге
 			if i == 1:
 				s.tags.add(self.tag1)
@@ -52,3 +47,38 @@ class ServiceViewsTestCase(TestCase):
 		# popular — список, длина не больше 5
 		self.assertIsInstance(popular, list)
 		self.assertLessEqual(len(popular), 5)
+
+	def test_slug_more_is_not_shadowed_by_fragment(self):
+		Service.objects.filter(slug='service-1').update(slug='more')
+		resp = self.client.get(reverse('services:detail', args=['more']))
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.context['service'].slug, 'more')
+
+
+class ServiceQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+	"""Бюджеты страниц каталога услуг; подкласс повторяет их на каталоге x10."""
+
+	def test_list(self):
+		self.assertBudget(reverse('services:list'), 15, 60_000)
+
+	def test_list_more(self):
+		self.assertBudget(reverse('services:list_more'), 4, 15_000)
+
+	def test_category(self):
+		self.assertBudget(reverse('services:by_category', args=['services-0']), 16, 60_000)
+
+	def test_category_more(self):
+		self.assertBudget(reverse('services:by_category_more', args=['services-0']), 5, 15_000)
+
+	def test_tag(self):
+		self.assertBudget(reverse('services:by_tag', args=['tag-1']), 16, 60_000)
+
+	def test_tag_more(self):
+		self.assertBudget(reverse('services:by_tag_more', args=['tag-1']), 5, 15_000)
+
+	def test_detail(self):
+		self.assertBudget(reverse('services:detail', args=['service-1']), 13, 70_000)
+
+
+class ServiceQueryBudgetX10TestCase(ServiceQueryBudgetTestCase):
+	SCALE = 10
@@ -5,7 +5,11 @@ app_name = 'services'
 
 urlpatterns = [
     path('', views.service_list, name='list'),
+    # Не 'more/': такой адрес перекрыл бы услугу со slug 'more' из '<slug:slug>/'
+    path('-/more/', views.service_list, {'fragment': True}, name='list_more'),
     path('category/<slug:slug>/', views.service_list_by_category, name='by_category'),
+    path('category/<slug:slug>/more/', views.service_list_by_category, {'fragment': True}, name='by_category_more'),
     path('tag/<slug:slug>/', views.service_list_by_tag, name='by_tag'),
+    path('tag/<slug:slug>/more/', views.service_list_by_tag, {'fragment': True}, name='by_tag_more'),
     path('<slug:slug>/', views.service_detail, name='detail'),
 ]
@@ -1,9 +1,25 @@
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, Count
+from django.http import HttpResponseBadRequest
+from django.urls import reverse
 
 from .models import Service, ServiceCategory
 from core.models import Tag
+from core import images, pagecache, search
+from core.cache import CATALOG, cached
+from core.conditional import catalog_page, field_last_modified
+from core.facets import FacetedSearch, SERVICE_FACETS
+from core.pagination import KeysetPaginator, InvalidCursor
+from core.tree import subtree_q
+
+
+PER_PAGE = 12
+SORT_ORDERINGS = {
+    'price_asc': ('price_adult', '-created_at', '-id'),
+    'price_desc': ('-price_adult', '-created_at', '-id'),
+    'newest': ('-created_at', '-id'),
+}
+DEFAULT_ORDERING = ('-created_at', '-id')
 
 
 # =========================
@@ -12,12 +28,7 @@ from core.models import Tag
 def _apply_filters_and_sort(request, qs):
     q = (request.GET.get('q') or '').strip()
     if q:
-        qs = qs.filter(
-            Q(title__icontains=q)
-            | Q(short_desc__icontains=q)
-            | Q(description__icontains=q)
-            | Q(location__icontains=q)
-        )
+        qs = search.filter_queryset(qs, q)
 
     price_min = request.GET.get('price_min')
     price_max = request.GET.get('price_max')
@@ -26,63 +37,96 @@ def _apply_filters_and_sort(request, qs):
     if price_max:
         qs = qs.filter(price_adult__lte=price_max)
 
-    sort = request.GET.get('sort')
-    if sort == 'price_asc':
-        qs = qs.order_by('price_adult', '-created_at')
-    elif sort == 'price_desc':
-        qs = qs.order_by('-price_adult', '-created_at')
-    elif sort == 'newest':
-        qs = qs.order_by('-created_at')
-    else:
-        qs = qs.order_by('-created_at')
+    ordering = _ordering(request)
+    if ordering:
+        qs = qs.order_by(*ordering)
 
     return qs
 
 
+def _ordering(request):
+    """Кортеж сортировки (последнее поле уникально) или None для порядка релевантности."""
+    sort = request.GET.get('sort')
+    if sort in SORT_ORDERINGS:
+        return SORT_ORDERINGS[sort]
+    if (request.GET.get('q') or '').strip():
+        return None
+    return DEFAULT_ORDERING
+
+
 def _sidebar_context():
-    rel_name = Service._meta.get_field('categories').remote_field.related_name or 'service_set'
-    count_expr = Count(rel_name, filter=Q(**{f"{rel_name}__is_active": True}))
+    # Кэшируется под поколением каталога, как в tours.views._sidebar_context
+    return cached(CATALOG, 'sidebar:services', _build_sidebar)
 
-    categories = ServiceCategory.objects.annotate(items=count_expr).order_by('name')
-    tags = Tag.objects.order_by('name')
+
+def _build_sidebar():
+    # services_count — активные услуги в поддереве (core.counters)
+    categories = list(ServiceCategory.objects.order_by('name'))
+    tags = list(Tag.objects.filter(services_count__gt=0).order_by('name'))
 
     # Популярные: безопасно проверяем наличие поля is_popular в модели
     field_names = {f.name for f in Service._meta.get_fields()}
+    popular = Service.objects.filter(is_active=True)
     if 'is_popular' in field_names:
-        popular = (
-            Service.objects.filter(is_active=True, is_popular=True)
-            .prefetch_related('categories', 'tags')
-            .order_by('-created_at')[:6]
-        )
-    else:
-        popular = (
-            Service.objects.filter(is_active=True)
-            .prefetch_related('categories', 'tags')
-            .order_by('-created_at')[:6]
-        )
+        popular = popular.filter(is_popular=True)
+    popular = list(popular.order_by('-created_at')[:6])
 
     return categories, tags, popular
 
 
-def _render_list(request, qs, extra_ctx=None):
+def _render_list(request, qs, extra_ctx=None, more_url=None, fragment=False):
     qs = _apply_filters_and_sort(request, qs)
-    categories, tags, popular = _sidebar_context()
-
-    paginator = Paginator(qs, 12)
-    page_number = request.GET.get('page', 1)
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+    facets = FacetedSearch(request.GET, qs, SERVICE_FACETS)
+    qs = facets.queryset
+
+    # ?paginate=cursor — курсорный режим с подгрузкой фрагментов (см. tours.views._render_list)
+    cursor_mode = fragment or request.GET.get('paginate') == 'cursor'
+    page_obj = next_url = None
+    if cursor_mode:
+        paginator = KeysetPaginator(qs, _ordering(request), PER_PAGE)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            if fragment:
+                return HttpResponseBadRequest('invalid cursor')
+            page = paginator.page()
+        services = page.object_list
+        if page.has_next and more_url:
+            params = request.GET.copy()
+            params['cursor'] = page.next_cursor
+            next_url = f"{more_url}?{params.urlencode()}"
+
+        if fragment:
+            pagecache.tag(request, 'services', *services)
+            images.prime_fields(services, 'cover')
+            response = render(request, 'services/_service_cards.html', {'services': services})
+            if next_url:
+                response['X-Next-Url'] = next_url
+            return response
+    else:
+        paginator = Paginator(qs, PER_PAGE)
+        page_number = request.GET.get('page', 1)
+        try:
+            page_obj = paginator.page(page_number)
+        except PageNotAnInteger:
+            page_obj = paginator.page(1)
+        except EmptyPage:
+            page_obj = paginator.page(paginator.num_pages)
+        services = page_obj.object_list
 
+    categories, tags, popular = _sidebar_context()
+    # Суррогатные ключи полностраничного кэша (см. tours.views._render_list)
+    pagecache.tag(request, 'services', 'sidebar:services', *services, *popular)
+    images.prime_fields([*services, *popular], 'cover')
     ctx = {
-        'services': page_obj.object_list,
+        'services': services,
         'page_obj': page_obj,
+        'next_url': next_url,
         'categories': categories,
         'tags': tags,
         'popular_services': popular,
+        'facets': facets.facets(),
+        'facets_active': facets.is_active,
     }
     if extra_ctx:
         ctx.update(extra_ctx)
@@ -93,45 +137,67 @@ def _render_list(request, qs, extra_ctx=None):
 # ==========
 # ВЬЮХИ
 # ==========
-def service_list(request):
+@catalog_page()
+def service_list(request, fragment=False):
     qs = (
         Service.objects.filter(is_active=True)
         .prefetch_related('categories', 'tags')
     )
-    return _render_list(request, qs)
+    return _render_list(request, qs, more_url=reverse('services:list_more'), fragment=fragment)
 
 
-def service_list_by_category(request, slug):
+@catalog_page()
+def service_list_by_category(request, slug, fragment=False):
     category = get_object_or_404(ServiceCategory, slug=slug)
+    # Категория вместе с подкатегориями (см. tours.views.tour_list_by_category)
+    in_subtree = Service.objects.filter(subtree_q(category.path, 'categories__')).values('pk')
     qs = (
-        Service.objects.filter(is_active=True, categories=category)
+        Service.objects.filter(is_active=True, pk__in=in_subtree)
         .prefetch_related('categories', 'tags')
     )
-    return _render_list(request, qs, extra_ctx={'active_category': category})
+    extra_ctx = {'active_category': category}
+    pagecache.tag(request, category)
+    if not fragment:
+        extra_ctx['category_ancestors'] = category.get_ancestors()
+        pagecache.tag(request, *extra_ctx['category_ancestors'])
+    return _render_list(
+        request, qs, extra_ctx=extra_ctx,
+        more_url=reverse('services:by_category_more', kwargs={'slug': slug}), fragment=fragment,
+    )
 
 
-def service_list_by_tag(request, slug):
+@catalog_page()
+def service_list_by_tag(request, slug, fragment=False):
     tag = get_object_or_404(Tag, slug=slug)
+    pagecache.tag(request, tag)
     qs = (
         Service.objects.filter(is_active=True, tags=tag)
         .prefetch_related('categories', 'tags')
     )
-    return _render_list(request, qs, extra_ctx={'active_tag': tag})
+    return _render_list(
+        request, qs, extra_ctx={'active_tag': tag},
+        more_url=reverse('services:by_tag_more', kwargs={'slug': slug}), fragment=fragment,
+    )
 
 
+@catalog_page(last_modified=field_last_modified(Service.objects.filter(is_active=True), 'updated_at'))
 def service_detail(request, slug):
     service = get_object_or_404(Service.objects.prefetch_related('categories', 'tags', 'images'), slug=slug, is_active=True)
 
-    # Похожие услуги по любой из категорий текущей услуги
+    # Похожие услуги: предрасчитанный top-K (core.related)
     related = (
-        Service.objects.filter(is_active=True, categories__in=service.categories.all())
-        .exclude(id=service.id)
-        .prefetch_related('categories', 'tags')
-        .order_by('-created_at')[:6]
+        Service.objects.filter(similar_to__source=service, is_active=True)
+        .order_by('similar_to__rank')
     )
 
     categories, tags, popular = _sidebar_context()
 
+    pagecache.tag(
+        request, service, f'related:{pagecache.key_for(service)}', 'sidebar:services',
+        *service.categories.all(), *service.tags.all(), *related, *popular,
+    )
+    images.prime(service.cover, *(img.image for img in service.images.all()), *(s.cover for s in [*related, *popular]))
+
     ctx = {
         'service': service,
         'related': related,
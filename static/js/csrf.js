@@ -0,0 +1,34 @@
+// CSRF-токен для AJAX-форм. Страницы отдаются из общего кэша (core.pagecache)
+// и токена в разметке не содержат: берём его из cookie, а если её ещё нет —
+// у /csrf/ (ответ заодно ставит cookie).
+window.getCsrfToken = (function() {
+  var pending = null;
+
+  function fromCookie() {
+    var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return match ? decodeURIComponent(match[1]) : null;
+  }
+
+  return function() {
+    var token = fromCookie();
+    if (token) return Promise.resolve(token);
+    if (!pending) {
+      pending = fetch('/csrf/', { credentials: 'same-origin', headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+        .then(function(response) { return response.json(); })
+        .then(function(data) { pending = null; return data.token; }, function(error) { pending = null; throw error; });
+    }
+    return pending;
+  };
+})();
+
+// Ключ идемпотентности заявки (core.leads): один на все попытки отправки формы,
+// поэтому повтор после сетевой ошибки не создаёт вторую заявку. Сбрасывается после успеха.
+window.leadIdempotencyKey = function(form, reset) {
+  if (reset) { delete form.dataset.idempotencyKey; return null; }
+  if (!form.dataset.idempotencyKey) {
+    form.dataset.idempotencyKey = window.crypto && crypto.randomUUID
+      ? crypto.randomUUID()
+      : Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+  return form.dataset.idempotencyKey;
+};
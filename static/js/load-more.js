@@ -0,0 +1,37 @@
+// «Показать ещё»: курсорная подгрузка карточек HTML-фрагментом (+ автоподгрузка при прокрутке).
+// Кнопка #loadMoreBtn: data-next-url — адрес фрагмента, data-grid — id контейнера карточек.
+(function() {
+  var btn = document.getElementById('loadMoreBtn');
+  if (!btn) return;
+  var grid = document.getElementById(btn.getAttribute('data-grid'));
+  if (!grid) return;
+  var loading = false;
+
+  function loadMore() {
+    var url = btn.getAttribute('data-next-url');
+    if (!url || loading) return;
+    loading = true;
+    fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+      .then(function(response) {
+        var next = response.headers.get('X-Next-Url');
+        return response.text().then(function(html) { return { html: html, next: next }; });
+      })
+      .then(function(data) {
+        grid.insertAdjacentHTML('beforeend', data.html);
+        if (data.next) {
+          btn.setAttribute('data-next-url', data.next);
+        } else {
+          btn.parentNode.removeChild(btn);
+        }
+      })
+      .catch(function(error) { console.error('Error loading cards:', error); })
+      .then(function() { loading = false; });
+  }
+
+  btn.addEventListener('click', loadMore);
+  if ('IntersectionObserver' in window) {
+    new IntersectionObserver(function(entries) {
+      if (entries[0].isIntersecting) loadMore();
+    }, { rootMargin: '400px' }).observe(btn);
+  }
+})();
@@ -0,0 +1,114 @@
+"""
+Пулы готовых карточек туров для JSON-эндпоинтов главной страницы.
+
+В общем кэше лежат:
+  * ``tour_card:<id>`` — карточка тура, уже закодированная в JSON;
+  * ``tour_pool:<category_id>`` / ``tour_pool:all`` — список id активных туров.
+
+Запрос выбирает случайные id из пула и достаёт карточки одним ``get_many``.
+Промахи добираются одним запросом ``values()`` без создания объектов модели.
+Пул категории включает туры её подкатегорий (core.tree). Сигналы
+(tours.signals) сбрасывают только затронутые карточки и пулы, включая пулы предков.
+"""
+import json
+import random
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from core import images
+from core.tree import path_ids, subtree_q
+
+from .models import Tour, TourCategory
+
+CARD_KEY = "tour_card:{}"
+POOL_KEY = "tour_pool:{}"
+ALL = "all"
+CACHE_TIMEOUT = 60 * 60 * 24
+CARD_FIELDS = (
+    "id", "title", "location", "cover", "slug",
+    "rating", "is_popular", "price_adult", "price_old_adult",
+)
+
+
+def _encode_card(row) -> str:
+    cover = images.asset_info(row["cover"]) if row["cover"] else {}
+    card = {
+        "id": row["id"],
+        "title": row["title"],
+        "location": row["location"],
+        # Уменьшенная копия под ширину карточки (core.images), пока её нет — оригинал
+        "cover": images.url_for_width(row["cover"], 640) if row["cover"] else None,
+        # Цвет и заглушка для фона до загрузки обложки
+        "cover_color": cover.get("color") or None,
+        "cover_placeholder": cover.get("placeholder") or None,
+        "url": reverse("tours:detail", kwargs={"slug": row["slug"]}),
+        "rating": float(row["rating"]) if row["rating"] else 4.5,
+        "is_popular": row["is_popular"],
+        "has_discount": bool(row["price_old_adult"] and row["price_old_adult"] > row["price_adult"]),
+    }
+    return json.dumps(card, ensure_ascii=False)
+
+
+def get_pool(category_id=ALL):
+    """
+    Список id активных туров категории вместе с подкатегориями (или всех туров для ``ALL``).
+    Возвращает None, если категории не существует.
+    """
+    key = POOL_KEY.format(category_id)
+    ids = cache.get(key)
+    if ids is None:
+        qs = Tour.objects.filter(is_active=True)
+        if category_id != ALL:
+            path = TourCategory.objects.filter(pk=category_id).values_list("path", flat=True).first()
+            if path is None:
+                return None
+            qs = qs.filter(subtree_q(path, "categories__"))
+        ids = list(qs.order_by().values_list("id", flat=True).distinct())
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+
+def get_cards(ids):
+    """Закодированные карточки для списка id в исходном порядке (неактивные пропускаются)."""
+    keys = {pk: CARD_KEY.format(pk) for pk in ids}
+    cached = cache.get_many(keys.values())
+    cards = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in ids if pk not in cards]
+    if missing:
+        rows = list(Tour.objects.filter(pk__in=missing, is_active=True).values(*CARD_FIELDS))
+        images.prime(*(row["cover"] for row in rows))
+        fresh = {row["id"]: _encode_card(row) for row in rows}
+        cache.set_many({CARD_KEY.format(pk): card for pk, card in fresh.items()}, CACHE_TIMEOUT)
+        cards.update(fresh)
+
+    return [cards[pk] for pk in ids if pk in cards]
+
+
+def sample_cards_json(category_id=ALL, n=6):
+    """Готовое тело ответа ``{"tours": [...]}`` с ``n`` случайными карточками или None."""
+    ids = get_pool(category_id)
+    if ids is None:
+        return None
+    picked = random.sample(ids, min(n, len(ids)))
+    return '{"tours": [' + ", ".join(get_cards(picked)) + "]}"
+
+
+def invalidate_cards(*tour_ids):
+    cache.delete_many([CARD_KEY.format(pk) for pk in tour_ids])
+
+
+def invalidate_pools(*category_ids):
+    cache.delete_many([POOL_KEY.format(cid) for cid in category_ids])
+
+
+def invalidate_category_pools(*category_ids):
+    """Пулы категорий и всех их предков: тур подкатегории входит и в пулы родителей."""
+    if not category_ids:
+        return
+    paths = TourCategory.objects.filter(pk__in=category_ids).values_list("path", flat=True)
+    ids = set(category_ids)
+    for path in paths:
+        ids.update(path_ids(path))
+    invalidate_pools(*ids)
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0009_category_tree_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tourcategory',
+            name='tours_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных туров'),
+        ),
+        migrations.AddIndex(
+            model_name='tourcategory',
+            index=models.Index(fields=['parent', 'tours_count'], name='tour_category_count_idx'),
+        ),
+    ]
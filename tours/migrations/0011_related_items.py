@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0010_active_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedTour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Позиция')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='tours.tour', verbose_name='Тур')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='tours.tour', verbose_name='Похожий тур')),
+            ],
+            options={
+                'verbose_name': 'Похожий тур',
+                'verbose_name_plural': 'Похожие туры',
+                'ordering': ['source', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('source', 'rank'), name='related_tour_rank_uniq')],
+            },
+        ),
+    ]
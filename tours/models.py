@@ -4,6 +4,8 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.urls import reverse
 
+from core.tree import MaterializedPathModel
+
 
 # =========================
 #  QuerySet / Manager
@@ -16,18 +18,12 @@ class TourQuerySet(models.QuerySet):
         return self.active().filter(is_popular=True)
 
     def search(self, q: str):
-        q = (q or "").strip()
-        if not q:
-            return self
-        return self.filter(
-            models.Q(title__icontains=q)
-            | models.Q(short_desc__icontains=q)
-            | models.Q(description__icontains=q)
-            | models.Q(location__icontains=q)
-        )
+        # Импорт внутри метода: core.search сам импортирует модели туров
+        from core.search import filter_queryset
+        return filter_queryset(self, q)
         
 
-class TourCategory(models.Model):
+class TourCategory(MaterializedPathModel):
     name = models.CharField("Название", max_length=120)
     slug = models.SlugField("Слаг", unique=True)
     parent = models.ForeignKey(
@@ -35,10 +31,15 @@ class TourCategory(models.Model):
         related_name='children', on_delete=models.CASCADE,
         verbose_name="Родительская категория"
     )
+    # Активные туры во всём поддереве; поддерживается core.counters
+    tours_count = models.PositiveIntegerField("Активных туров", default=0, editable=False)
 
     class Meta:
         verbose_name = 'Категория тура'
         verbose_name_plural = 'Категории туров'
+        indexes = [
+            models.Index(fields=["parent", "tours_count"], name="tour_category_count_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -248,3 +249,22 @@ class Tour(models.Model):
         return self.price_child is not None
 
 
+
+
+class RelatedTour(models.Model):
+    """Предрасчитанные «похожие туры» (core.related): top-K целей для каждого тура."""
+    source = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name="similar", verbose_name="Тур")
+    target = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name="similar_to", verbose_name="Похожий тур")
+    score = models.FloatField("Сходство")
+    rank = models.PositiveSmallIntegerField("Позиция")
+
+    class Meta:
+        verbose_name = "Похожий тур"
+        verbose_name_plural = "Похожие туры"
+        ordering = ["source", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["source", "rank"], name="related_tour_rank_uniq"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.source_id} → {self.target_id} ({self.score:.2f})"
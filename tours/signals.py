@@ -0,0 +1,79 @@
+"""
+Точечная инвалидация пулов карточек (tours.cards) при изменении туров и категорий
+и после создания уменьшенных копий обложки (core.imagejobs).
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core import imagejobs
+from core.tree import path_ids
+
+from . import cards
+from .models import Tour, TourCategory
+
+
+def _category_ids(tour):
+    """Категории тура вместе с их предками — все пулы, в которые входит тур."""
+    ids = set()
+    for path in tour.categories.values_list("path", flat=True):
+        ids.update(path_ids(path))
+    return list(ids)
+
+
+@receiver(post_save, sender=Tour, dispatch_uid="tours_cards_tour_saved")
+def tour_saved(sender, instance, **kwargs):
+    cards.invalidate_cards(instance.pk)
+    cards.invalidate_pools(cards.ALL, *_category_ids(instance))
+
+
+@receiver(pre_delete, sender=Tour, dispatch_uid="tours_cards_tour_deleting")
+def tour_deleting(sender, instance, **kwargs):
+    # После удаления связи M2M уже стёрты — запоминаем категории заранее
+    instance._card_category_ids = _category_ids(instance)
+
+
+@receiver(post_delete, sender=Tour, dispatch_uid="tours_cards_tour_deleted")
+def tour_deleted(sender, instance, **kwargs):
+    cards.invalidate_cards(instance.pk)
+    cards.invalidate_pools(cards.ALL, *getattr(instance, "_card_category_ids", []))
+
+
+@receiver(post_save, sender=TourCategory, dispatch_uid="tours_cards_category_saved")
+def category_saved(sender, instance, created, **kwargs):
+    # Сигнал приходит изнутри save(): _saved_path — путь до переноса, path — после
+    old_path = getattr(instance, "_saved_path", None)
+    if not created and old_path and old_path != instance.path:
+        cards.invalidate_pools(*path_ids(old_path), *path_ids(instance.path))
+
+
+@receiver(post_delete, sender=TourCategory, dispatch_uid="tours_cards_category_deleted")
+def category_deleted(sender, instance, **kwargs):
+    cards.invalidate_pools(instance.pk, *path_ids(instance.path))
+
+
+@receiver(m2m_changed, sender=Tour.categories.through, dispatch_uid="tours_cards_categories_changed")
+def tour_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # Для clear() pk_set не передаётся: сохраняем текущие связи до очистки
+        if reverse:
+            instance._card_cleared_ids = path_ids(instance.path) or [instance.pk]
+        else:
+            instance._card_cleared_ids = _category_ids(instance)
+        return
+    if action == "post_clear":
+        cards.invalidate_pools(*getattr(instance, "_card_cleared_ids", []))
+        return
+    if action not in ("post_add", "post_remove"):
+        return
+    if reverse:
+        # category.tours.add(...): меняются пулы категории и её предков
+        cards.invalidate_pools(instance.pk, *path_ids(instance.path))
+    else:
+        cards.invalidate_category_pools(*(pk_set or ()))
+
+
+@receiver(imagejobs.processed, dispatch_uid="tours_cards_image_processed")
+def image_processed(sender, keys, **kwargs):
+    # В карточке адрес копии обложки: до обработки там был оригинал
+    prefix = f"{Tour._meta.model_name}:"
+    cards.invalidate_cards(*(int(key[len(prefix):]) for key in keys if key.startswith(prefix)))
@@ -1,3 +1,480 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import related
+from core.models import Tag
+from core.testing import QueryBudgetMixin, make_tour
+
+from .models import Tour, TourCategory
+from . import cards, views
+
+
+# Для замеров стоимости самих вьюх: без полностраничного кэша повторный запрос не бесплатен
+WITHOUT_PAGE_CACHE = [m for m in settings.MIDDLEWARE if m != 'core.pagecache.PageCacheMiddleware']
+
+
+class TourCardPoolTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cat = TourCategory.objects.create(name='Острова', slug='islands')
+        self.other = TourCategory.objects.create(name='Горы', slug='mountains')
+        self.tours = [make_tour(i, location='Пхукет') for i in range(8)]
+        for t in self.tours[:4]:
+            t.categories.add(self.cat)
+
+    def get_json(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.content)['tours']
+
+    def test_category_endpoint_returns_only_category_cards(self):
+        data = self.get_json(reverse('core:get_tours_by_category', args=[self.cat.id]))
+        self.assertEqual({c['id'] for c in data}, {t.id for t in self.tours[:4]})
+        card = data[0]
+        self.assertEqual(set(card), {
+            'id', 'title', 'location', 'cover', 'cover_color', 'cover_placeholder',
+            'url', 'rating', 'is_popular', 'has_discount',
+        })
+        self.assertEqual(card['rating'], 4.5)
+
+    def test_all_endpoint_samples_six(self):
+        self.assertEqual(len(self.get_json(reverse('core:get_all_tours'))), 6)
+
+    def test_missing_category_is_404(self):
+        resp = self.client.get(reverse('core:get_tours_by_category', args=[9999]))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_warm_request_runs_no_queries(self):
+        url = reverse('core:get_tours_by_category', args=[self.cat.id])
+        self.client.get(url)
+        cards.get_cards([t.id for t in self.tours[:4]])
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_pools_follow_membership_changes(self):
+        url = reverse('core:get_tours_by_category', args=[self.other.id])
+        self.assertEqual(self.get_json(url), [])
+        self.tours[5].categories.add(self.other)
+        self.assertEqual([c['id'] for c in self.get_json(url)], [self.tours[5].id])
+        self.other.tours.clear()
+        self.assertEqual(self.get_json(url), [])
+
+    def test_card_reflects_tour_update_and_deactivation(self):
+        url = reverse('core:get_tours_by_category', args=[self.cat.id])
+        self.get_json(url)
+        tour = self.tours[0]
+        tour.title = 'Новое название'
+        tour.save()
+        titles = {c['title'] for c in self.get_json(url)}
+        self.assertIn('Новое название', titles)
+        tour.is_active = False
+        tour.save()
+        self.assertNotIn(tour.id, {c['id'] for c in self.get_json(url)})
+        self.tours[1].delete()
+        self.assertEqual(len(self.get_json(url)), 2)
+
+
+class TourFacetsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sea = TourCategory.objects.create(name='Море', slug='sea')
+        self.land = TourCategory.objects.create(name='Суша', slug='land')
+        self.cheap = make_tour(1, price_adult=800, duration='1 день', location='Пхукет')
+        self.mid = make_tour(2, price_adult=2000, duration='1 день', location='Краби')
+        self.pricey = make_tour(3, price_adult=6000, duration='2 дня', location='Пхукет')
+        self.cheap.categories.add(self.sea, self.land)
+        self.mid.categories.add(self.sea)
+        self.pricey.categories.add(self.land)
+
+    def facet(self, resp, name):
+        for facet in resp.context['facets']:
+            if facet['name'] == name:
+                return {v['value']: v['count'] for v in facet['values']}
+        return {}
+
+    def test_values_or_within_facet_and_across_facets(self):
+        url = reverse('tours:list')
+        resp = self.client.get(url, {'category': ['sea', 'land']})
+        self.assertEqual(len(resp.context['tours']), 3)
+        resp = self.client.get(url, {'category': 'land', 'location': 'Пхукет', 'price': '0-1000'})
+        self.assertEqual([t.pk for t in resp.context['tours']], [self.cheap.pk])
+
+    def test_counts_exclude_own_facet(self):
+        resp = self.client.get(reverse('tours:list'), {'category': 'sea'})
+        self.assertEqual(self.facet(resp, 'category'), {'sea': 2, 'land': 2})
+        self.assertEqual(self.facet(resp, 'location'), {'Пхукет': 1, 'Краби': 1})
+        self.assertEqual(self.facet(resp, 'price'), {'0-1000': 1, '1000-2500': 1})
+        self.assertEqual(self.facet(resp, 'duration'), {'1 день': 2})
+
+    def test_query_count_does_not_grow_with_facet_values(self):
+        url = reverse('tours:list')
+        self.client.get(url, {'category': 'sea'})  # прогрев кэшей сайдбара и шапки
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url, {'category': 'sea'})
+        for i in range(10, 30):
+            tour = make_tour(i, location=f'Локация {i}', duration=f'{i} часов')
+            tour.categories.add(TourCategory.objects.create(name=f'Кат {i}', slug=f'cat-{i}'))
+        self.client.get(url, {'category': 'sea'})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url, {'category': 'sea'})
+        self.assertEqual(len(small), len(large))
+
+
+@override_settings(MIDDLEWARE=WITHOUT_PAGE_CACHE)
+class TourCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Одинаковые цены и флаги — проверяем, что id разрешает «ничьи»
+        for i in range(30):
+            make_tour(i, price_adult=1000 + (i % 3) * 100, is_popular=(i % 4 == 0))
+
+    def walk(self, params):
+        url = reverse('tours:list_more') + '?' + params
+        seen = []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            seen += [t.pk for t in resp.context['tours']]
+            url = resp.get('X-Next-Url')
+        return seen
+
+    def test_cursor_walk_matches_full_ordering(self):
+        for sort, ordering in (('', ('-is_popular', '-created_at', '-id')),
+                               ('price_asc', ('price_adult', '-is_popular', '-created_at', '-id')),
+                               ('price_desc', ('-price_adult', '-is_popular', '-created_at', '-id'))):
+            expected = list(Tour.objects.order_by(*ordering).values_list('pk', flat=True))
+            self.assertEqual(self.walk(f'sort={sort}'), expected)
+
+    def test_list_page_in_cursor_mode_has_no_count(self):
+        resp = self.client.get(reverse('tours:list'), {'paginate': 'cursor'})
+        self.assertIsNone(resp.context['page_obj'])
+        self.assertTrue(resp.context['next_url'].startswith(reverse('tours:list_more')))
+
+    def test_deep_page_costs_same_as_first(self):
+        first = self.client.get(reverse('tours:list_more'))
+        second_url = first['X-Next-Url']
+        with CaptureQueriesContext(connection) as q1:
+            self.client.get(reverse('tours:list_more'))
+        with CaptureQueriesContext(connection) as q2:
+            self.client.get(second_url)
+        self.assertEqual(len(q1), len(q2))
+        self.assertFalse(any('COUNT' in q['sql'] for q in q2.captured_queries))
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(reverse('tours:list_more'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_slug_more_is_not_shadowed_by_fragment(self):
+        tour = make_tour(100, slug='more')
+        resp = self.client.get(tour.get_absolute_url())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['tour'], tour)
+
+
+class TourSidebarCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cat = TourCategory.objects.create(name='Острова', slug='islands')
+        self.tour = make_tour(1, is_popular=True)
+        self.tour.categories.add(self.cat)
+
+    def counts(self):
+        categories, _, _ = views._sidebar_context()
+        return {c.slug: c.tours_count for c in categories}
+
+    def test_warm_sidebar_runs_no_queries(self):
+        views._sidebar_context()
+        with self.assertNumQueries(0):
+            categories, tags, popular = views._sidebar_context()
+        self.assertEqual([p.pk for p in popular], [self.tour.pk])
+
+    def test_invalidated_by_catalog_changes(self):
+        self.assertEqual(self.counts(), {'islands': 1})
+        make_tour(2).categories.add(self.cat)
+        self.assertEqual(self.counts(), {'islands': 2})
+        self.cat.tours.remove(self.tour)
+        self.assertEqual(self.counts(), {'islands': 1})
+        TourCategory.objects.create(name='Горы', slug='mountains')
+        self.assertEqual(self.counts(), {'islands': 1, 'mountains': 0})
+
+        self.tour.tags.add(Tag.objects.create(name='Море', slug='sea'))
+        _, tags, _ = views._sidebar_context()
+        self.assertEqual([t.slug for t in tags], ['sea'])
+
+        self.tour.is_popular = False
+        self.tour.save()
+        _, _, popular = views._sidebar_context()
+        self.assertEqual(len(popular), 2)  # запасной вариант: топ активных
+
+
+class TourCategoryTreeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = TourCategory.objects.create(name='Острова', slug='islands')
+        self.child = TourCategory.objects.create(name='Пхи-Пхи', slug='phi-phi', parent=self.root)
+        self.leaf = TourCategory.objects.create(name='Майя', slug='maya', parent=self.child)
+        self.other = TourCategory.objects.create(name='Горы', slug='mountains')
+        self.t_root = make_tour(1)
+        self.t_leaf = make_tour(2)
+        self.t_both = make_tour(3)
+        self.t_root.categories.add(self.root)
+        self.t_leaf.categories.add(self.leaf)
+        self.t_both.categories.add(self.child, self.leaf)
+
+    def test_paths_and_move(self):
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'/{self.root.pk}/{self.child.pk}/{self.leaf.pk}/')
+        self.assertEqual(self.leaf.depth, 2)
+
+        self.child.parent = self.other
+        self.child.save()
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'/{self.other.pk}/{self.child.pk}/{self.leaf.pk}/')
+        self.assertEqual([c.slug for c in self.leaf.get_ancestors()], ['mountains', 'phi-phi'])
+
+        self.other.parent = self.leaf
+        with self.assertRaises(ValueError):
+            self.other.save()
+
+    def test_subtree_listing_and_breadcrumbs(self):
+        resp = self.client.get(reverse('tours:by_category', args=['islands']))
+        self.assertEqual({t.pk for t in resp.context['tours']}, {self.t_root.pk, self.t_leaf.pk, self.t_both.pk})
+        self.assertEqual(len(resp.context['tours']), 3)  # без дублей
+        resp = self.client.get(reverse('tours:by_category', args=['maya']))
+        self.assertEqual([c.slug for c in resp.context['category_ancestors']], ['islands', 'phi-phi'])
+        self.assertContains(resp, 'class="t-crumbs"')
+
+    def test_subtree_is_prefix_match(self):
+        # Диапазон path >= / path < ломается при локальной сортировке PostgreSQL
+        for qs in (TourCategory.objects.subtree(self.root),
+                   TourCategory.objects.with_subtree_counts('n', 'tours', is_active=True)):
+            sql = str(qs.query)
+            self.assertIn('LIKE', sql)
+            self.assertNotIn('"path" <', sql)
+        self.assertEqual(
+            {c.slug for c in TourCategory.objects.subtree(self.child)}, {'phi-phi', 'maya'}
+        )
+
+    def test_subtree_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = dict(
+                TourCategory.objects.with_subtree_counts('n', 'tours', is_active=True).values_list('slug', 'n')
+            )
+        self.assertEqual(counts, {'islands': 3, 'phi-phi': 2, 'maya': 2, 'mountains': 0})
+
+    def test_card_pool_follows_subcategories(self):
+        url = reverse('core:get_tours_by_category', args=[self.root.id])
+        ids = lambda: {c['id'] for c in json.loads(self.client.get(url).content)['tours']}
+        self.assertEqual(ids(), {self.t_root.pk, self.t_leaf.pk, self.t_both.pk})
+        extra = make_tour(4)
+        extra.categories.add(self.leaf)
+        self.assertIn(extra.pk, ids())
+        self.child.parent = self.other
+        self.child.save()
+        self.assertEqual(ids(), {self.t_root.pk})
+
+
+class TourCountersTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = TourCategory.objects.create(name='Острова', slug='islands')
+        self.child = TourCategory.objects.create(name='Пхи-Пхи', slug='phi-phi', parent=self.root)
+        self.other = TourCategory.objects.create(name='Горы', slug='mountains')
+        self.tag = Tag.objects.create(name='Море', slug='sea')
+        self.tour = make_tour(1)
+        self.tour.categories.add(self.root, self.child)
+        self.tour.tags.add(self.tag)
+
+    def counts(self):
+        counts = dict(TourCategory.objects.values_list('slug', 'tours_count'))
+        counts['#sea'] = Tag.objects.get(pk=self.tag.pk).tours_count
+        return counts
+
+    def test_counters_follow_changes(self):
+        # Тур в категории и её подкатегории считается в корне один раз
+        self.assertEqual(self.counts(), {'islands': 1, 'phi-phi': 1, 'mountains': 0, '#sea': 1})
+        second = make_tour(2)
+        self.child.tours.add(second)
+        self.assertEqual(self.counts(), {'islands': 2, 'phi-phi': 2, 'mountains': 0, '#sea': 1})
+
+        self.tour.is_active = False
+        self.tour.save()
+        self.assertEqual(self.counts(), {'islands': 1, 'phi-phi': 1, 'mountains': 0, '#sea': 0})
+        self.tour.is_active = True
+        self.tour.save()
+
+        self.child.parent = self.other
+        self.child.save()
+        self.assertEqual(self.counts(), {'islands': 1, 'phi-phi': 2, 'mountains': 2, '#sea': 1})
+
+        second.delete()
+        self.tour.tags.clear()
+        self.assertEqual(self.counts(), {'islands': 1, 'phi-phi': 1, 'mountains': 1, '#sea': 0})
+        self.child.delete()
+        self.assertEqual(self.counts(), {'islands': 1, 'mountains': 0, '#sea': 0})
+
+    def test_moving_subtree_recounts_after_paths(self):
+        # a -> c -> g, тур только во внуке g; c переносится из a в o
+        a = TourCategory.objects.create(name='A', slug='a')
+        c = TourCategory.objects.create(name='C', slug='c', parent=a)
+        g = TourCategory.objects.create(name='G', slug='g', parent=c)
+        o = TourCategory.objects.create(name='O', slug='o')
+        make_tour(2).categories.add(g)
+        c.parent = o
+        c.save()
+        counts = self.counts()
+        self.assertEqual((counts['a'], counts['o'], counts['c'], counts['g']), (0, 1, 1, 1))
+
+    def test_recount_command_repairs_drift(self):
+        TourCategory.objects.update(tours_count=7)
+        out = StringIO()
+        call_command('recount_catalog', stdout=out)
+        self.assertIn('исправлено значений: 3', out.getvalue())
+        self.assertEqual(self.counts(), {'islands': 1, 'phi-phi': 1, 'mountains': 0, '#sea': 1})
+
+    def test_navigation_reads_columns(self):
+        from core.context_processors import _nav_tour_categories
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual([c.slug for c in _nav_tour_categories()], ['islands'])
+        self.assertEqual(len(ctx), 1)
+        self.assertNotIn('COUNT', ctx.captured_queries[0]['sql'])
+
+
+class RelatedToursTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sea = TourCategory.objects.create(name='Море', slug='sea')
+        self.land = TourCategory.objects.create(name='Суша', slug='land')
+        self.snorkel = Tag.objects.create(name='Снорклинг', slug='snorkel')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.base = make_tour(1, location='Пхукет', price_adult=1000)
+            self.close = make_tour(2, location='Пхукет', price_adult=1100)
+            self.far = make_tour(3, location='Краби', price_adult=9000)
+            self.unrelated = make_tour(4, location='Бангкок', price_adult=1000)
+            self.base.categories.add(self.sea)
+            self.close.categories.add(self.sea)
+            self.far.categories.add(self.sea)
+            self.unrelated.categories.add(self.land)
+
+    def related_ids(self, tour):
+        return list(
+            Tour.objects.filter(similar_to__source=tour).order_by('similar_to__rank').values_list('pk', flat=True)
+        )
+
+    def test_ranked_by_shared_taxonomy_location_and_price(self):
+        self.assertEqual(self.related_ids(self.base), [self.close.pk, self.far.pk])
+        self.assertEqual(self.related_ids(self.unrelated), [])
+
+    def test_incremental_updates(self):
+        # Общий тег делает связанным тур из другой категории; близкая цена поднимает его выше
+        with self.captureOnCommitCallbacks(execute=True):
+            self.snorkel.tours.add(self.base, self.unrelated)
+        self.assertEqual(self.related_ids(self.base), [self.close.pk, self.far.pk, self.unrelated.pk])
+        self.assertEqual(self.related_ids(self.unrelated), [self.base.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.is_active = False
+            self.far.save()
+        self.assertEqual(self.related_ids(self.base), [self.close.pk, self.unrelated.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sea.delete()
+        # с close остались общая локация и цена (2 + 1.36), с unrelated — тег и цена (1.5 + 1.5)
+        self.assertEqual(self.related_ids(self.base), [self.close.pk, self.unrelated.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.close.delete()
+        self.assertEqual(self.related_ids(self.base), [self.unrelated.pk])
+
+    def test_only_similarity_fields_trigger_rebuild(self):
+        with mock.patch('core.related.rebuild') as rebuild, self.captureOnCommitCallbacks(execute=True):
+            self.base.title = 'Новое название'
+            self.base.save()
+            self.close.save(update_fields=['title'])
+        rebuild.assert_not_called()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.location = 'Пхукет'
+            self.far.price_adult = 1000
+            self.far.save()
+        self.assertEqual(self.related_ids(self.base), [self.far.pk, self.close.pk])
+
+    def test_incremental_rebuild_scores_only_neighbourhood(self):
+        group = [make_tour(10 + i, location='Пхукет', price_adult=1000) for i in range(30)]
+        self.sea.tours.add(*group)
+        related.rebuild(Tour)
+        # Самый старый тур с далёкой ценой не входит ни в чей top-K
+        outsider = group[0]
+        outsider.price_adult = 50000
+        outsider.save()
+        with mock.patch.object(related.Features, 'score', autospec=True, side_effect=related.Features.score) as score:
+            related.rebuild(Tour, [outsider.pk])
+        size = Tour.objects.count()
+        self.assertLess(score.call_count, size * (related.TOP_K + 2))
+        expected = {tour.pk: self.related_ids(tour) for tour in group}
+        related.rebuild(Tour)
+        self.assertEqual({tour.pk: self.related_ids(tour) for tour in group}, expected)
+
+    def test_incremental_rebuild_loads_only_neighbourhood(self):
+        strangers = [make_tour(40 + i, location='Самуи') for i in range(10)]
+        self.land.tours.add(*strangers)
+        related.rebuild(Tour)
+        loaded = []
+        features = related.Features
+        with mock.patch.object(related, 'Features', side_effect=lambda *args: loaded.append(features(*args)) or loaded[-1]):
+            self.base.price_adult = 1050
+            self.base.save()
+            related.rebuild(Tour, [self.base.pk])
+        self.assertEqual(set(loaded[-1].price), {self.base.pk, self.close.pk, self.far.pk})
+        self.assertEqual(self.related_ids(self.base), [self.close.pk, self.far.pk])
+
+    def test_detail_page_reads_precomputed_list(self):
+        resp = self.client.get(self.base.get_absolute_url())
+        self.assertEqual([t.pk for t in resp.context['related_tours']], [self.close.pk, self.far.pk])
+        out = StringIO()
+        call_command('rebuild_related', stdout=out)
+        self.assertIn('пересобрано', out.getvalue())
+        self.assertEqual(self.related_ids(self.base), [self.close.pk, self.far.pk])
+
+
+class TourQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Бюджеты страниц каталога туров; подкласс повторяет их на каталоге x10."""
+
+    def test_list(self):
+        self.assertBudget(reverse('tours:list'), 16, 120_000)
+
+    def test_list_cursor(self):
+        self.assertBudget(reverse('tours:list') + '?paginate=cursor', 15, 120_000)
+
+    def test_list_search(self):
+        self.assertBudget(reverse('tours:list') + '?q=Тур', 17, 120_000)
+
+    def test_list_more(self):
+        self.assertBudget(reverse('tours:list_more'), 4, 35_000)
+
+    def test_root_category(self):
+        self.assertBudget(reverse('tours:by_category', args=['tours-0']), 17, 120_000)
+
+    def test_child_category(self):
+        self.assertBudget(reverse('tours:by_category', args=['tours-0-0']), 18, 120_000)
+
+    def test_category_more(self):
+        self.assertBudget(reverse('tours:by_category_more', args=['tours-0']), 5, 35_000)
+
+    def test_tag(self):
+        self.assertBudget(reverse('tours:by_tag', args=['tag-1']), 17, 120_000)
+
+    def test_tag_more(self):
+        self.assertBudget(reverse('tours:by_tag_more', args=['tag-1']), 5, 35_000)
+
+    def test_detail(self):
+        self.assertBudget(reverse('tours:detail', args=['tour-1']), 13, 100_000)
+
+
+class TourQueryBudgetX10TestCase(TourQueryBudgetTestCase):
+    SCALE = 10
@@ -6,8 +6,12 @@ app_name = "tours"
 
 urlpatterns = [
     path("", views.tour_list, name="list"),
+    # Не «more/»: такой адрес перекрыл бы тур со slug «more» из «<slug:slug>/»
+    path("-/more/", views.tour_list, {"fragment": True}, name="list_more"),
     path("category/<slug:slug>/", views.tour_list_by_category, name="by_category"),
+    path("category/<slug:slug>/more/", views.tour_list_by_category, {"fragment": True}, name="by_category_more"),
     path("tag/<slug:slug>/", views.tour_list_by_tag, name="by_tag"),
+    path("tag/<slug:slug>/more/", views.tour_list_by_tag, {"fragment": True}, name="by_tag_more"),
     path("<slug:slug>/", views.tour_detail, name="detail"),
 ]
 
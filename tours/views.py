@@ -1,9 +1,25 @@
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, Count
+from django.http import HttpResponseBadRequest
+from django.urls import reverse
 
 from .models import Tour, TourCategory
 from core.models import Tag
+from core import images, pagecache, search
+from core.cache import CATALOG, cached
+from core.conditional import catalog_page, field_last_modified
+from core.facets import FacetedSearch, TOUR_FACETS
+from core.pagination import KeysetPaginator, InvalidCursor
+from core.tree import subtree_q
+
+
+PER_PAGE = 12
+SORT_ORDERINGS = {
+    "price_asc": ("price_adult", "-is_popular", "-created_at", "-id"),
+    "price_desc": ("-price_adult", "-is_popular", "-created_at", "-id"),
+    "newest": ("-created_at", "-id"),
+}
+DEFAULT_ORDERING = ("-is_popular", "-created_at", "-id")
 
 
 # =========================
@@ -12,17 +28,12 @@ from core.models import Tag
 def _apply_filters_and_sort(request, qs):
     """
     Применяет поиск (q), ценовые фильтры (price_min/price_max) и сортировку (sort) к QuerySet туров.
-    Ожидаемые поля у Tour: title, short_desc, description, location, price_adult, created_at, is_popular.
+    Ожидаемые поля у Tour: price_adult, created_at, is_popular; поиск идёт через core.search.
     """
-    # Поиск
+    # Поиск (полнотекстовый индекс core.search, результат упорядочен по релевантности)
     q = (request.GET.get("q") or "").strip()
     if q:
-        qs = qs.filter(
-            Q(title__icontains=q)
-            | Q(short_desc__icontains=q)
-            | Q(description__icontains=q)
-            | Q(location__icontains=q)
-        )
+        qs = search.filter_queryset(qs, q)
 
     # Цена
     price_min = request.GET.get("price_min")
@@ -32,76 +43,119 @@ def _apply_filters_and_sort(request, qs):
     if price_max:
         qs = qs.filter(price_adult__lte=price_max)
 
-    # Сортировка
-    sort = request.GET.get("sort")
-    if sort == "price_asc":
-        qs = qs.order_by("price_adult", "-is_popular", "-created_at")
-    elif sort == "price_desc":
-        qs = qs.order_by("-price_adult", "-is_popular", "-created_at")
-    elif sort == "newest":
-        qs = qs.order_by("-created_at")
-    else:
-        # По умолчанию: сначала популярные, потом новые
-        qs = qs.order_by("-is_popular", "-created_at")
+    # Сортировка (при поиске без явной сортировки — по релевантности)
+    ordering = _ordering(request)
+    if ordering:
+        qs = qs.order_by(*ordering)
 
     return qs
 
 
+def _ordering(request):
+    """
+    Кортеж сортировки листинга или None, если действует порядок релевантности поиска.
+    Последнее поле уникально — по кортежу работает курсорная пагинация.
+    """
+    sort = request.GET.get("sort")
+    if sort in SORT_ORDERINGS:
+        return SORT_ORDERINGS[sort]
+    if (request.GET.get("q") or "").strip():
+        return None
+    # По умолчанию: сначала популярные, потом новые
+    return DEFAULT_ORDERING
+
+
 def _sidebar_context():
     """
     Данные для сайдбара: категории с количеством активных туров, теги (просто список),
     и блок «популярных» туров (если пусто — отдаем просто топ по рейтингу/дате).
-    ВАЖНО: related_name у ForeignKey(Tour.category) может отличаться.
-    Мы определяем его динамически и безопасно формируем Count/Q.
+
+    Между правками в админке данные не меняются, поэтому хранятся в общем кэше
+    под поколением каталога (core.cache.CATALOG): сигналы core.signals сбрасывают
+    его при сохранении/удалении туров, услуг, категорий, тегов и их связей.
     """
-    # Определяем related_name для Category -> Tour (или используем 'tour_set')
-    rel_name = Tour._meta.get_field("categories").remote_field.related_name or "tour_set"
+    return cached(CATALOG, "sidebar:tours", _build_sidebar)
 
-    # Пример: Count("tours", filter=Q(tours__is_active=True))  # если related_name='tours'
-    # Мы собираем ключи динамически:
-    count_expr = Count(rel_name, filter=Q(**{f"{rel_name}__is_active": True}))
 
-    categories = TourCategory.objects.annotate(items=count_expr).order_by("name")
-    tags = Tag.objects.order_by("name")
+def _build_sidebar():
+    # Количество активных туров в поддереве — денормализованная колонка (core.counters)
+    categories = list(TourCategory.objects.order_by("name"))
+    tags = list(Tag.objects.filter(tours_count__gt=0).order_by("name"))
 
-    popular = (
+    # В сайдбаре выводятся только обложка, название и цена — без prefetch связей
+    popular = list(
         Tour.objects.filter(is_active=True, is_popular=True)
-        .prefetch_related("categories", "tags")
         .order_by("-rating", "-created_at")[:6]
     )
     if not popular:
-        popular = (
+        popular = list(
             Tour.objects.filter(is_active=True)
-            .prefetch_related("categories", "tags")
             .order_by("-rating", "-created_at")[:6]
         )
 
     return categories, tags, popular
 
 
-def _render_list(request, qs, extra_ctx=None):
+def _render_list(request, qs, extra_ctx=None, more_url=None, fragment=False):
     """
     Общий рендер листинга туров с пагинацией и данными сайдбара.
+
+    Пагинация по номерам страниц (с COUNT) — по умолчанию; ``?paginate=cursor``
+    включает курсорный режим с кнопкой «Показать ещё», которая подгружает
+    следующие карточки HTML-фрагментом с ``more_url`` (``fragment=True``).
     """
     qs = _apply_filters_and_sort(request, qs)
-    categories, tags, popular = _sidebar_context()
+    facets = FacetedSearch(request.GET, qs, TOUR_FACETS)
+    qs = facets.queryset
 
-    # Пагинация
-    paginator = Paginator(qs, 12)  # 12 карточек на страницу
-    page_number = request.GET.get("page", 1)
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+    cursor_mode = fragment or request.GET.get("paginate") == "cursor"
+    page_obj = next_url = None
+    if cursor_mode:
+        paginator = KeysetPaginator(qs, _ordering(request), PER_PAGE)
+        try:
+            page = paginator.page(request.GET.get("cursor"))
+        except InvalidCursor:
+            if fragment:
+                return HttpResponseBadRequest("invalid cursor")
+            page = paginator.page()
+        tours = page.object_list
+        if page.has_next and more_url:
+            params = request.GET.copy()
+            params["cursor"] = page.next_cursor
+            next_url = f"{more_url}?{params.urlencode()}"
 
+        if fragment:
+            pagecache.tag(request, "tours", *tours)
+            images.prime_fields(tours, "cover")
+            response = render(request, "tours/_tour_cards.html", {"tours": tours})
+            if next_url:
+                response["X-Next-Url"] = next_url
+            return response
+    else:
+        paginator = Paginator(qs, PER_PAGE)  # 12 карточек на страницу
+        page_number = request.GET.get("page", 1)
+        try:
+            page_obj = paginator.page(page_number)
+        except PageNotAnInteger:
+            page_obj = paginator.page(1)
+        except EmptyPage:
+            page_obj = paginator.page(paginator.num_pages)
+        tours = page_obj.object_list
+
+    categories, tags, popular = _sidebar_context()
+    # Суррогатные ключи полностраничного кэша (core.pagecache): состав листинга и сайдбар
+    pagecache.tag(request, "tours", "sidebar:tours", *tours, *popular)
+    # Метаданные обложек всех карточек — одним запросом, а не по запросу на карточку
+    images.prime_fields([*tours, *popular], "cover")
     ctx = {
-        "tours": page_obj.object_list,
+        "tours": tours,
         "page_obj": page_obj,
+        "next_url": next_url,
         "categories": categories,
         "tags": tags,
         "popular_tours": popular,
+        "facets": facets.facets(),
+        "facets_active": facets.is_active,
     }
     if extra_ctx:
         ctx.update(extra_ctx)
@@ -112,7 +166,8 @@ def _render_list(request, qs, extra_ctx=None):
 # ==========
 # ВЬЮХИ
 # ==========
-def tour_list(request):
+@catalog_page()
+def tour_list(request, fragment=False):
     """
     Список всех активных туров.
     """
@@ -120,54 +175,75 @@ def tour_list(request):
         Tour.objects.filter(is_active=True)
         .prefetch_related("categories", "tags")
     )
-    return _render_list(request, qs)
+    return _render_list(request, qs, more_url=reverse("tours:list_more"), fragment=fragment)
 
 
-def tour_list_by_category(request, slug):
+@catalog_page()
+def tour_list_by_category(request, slug, fragment=False):
     """
-    Список активных туров по категории.
+    Список активных туров по категории, включая её подкатегории.
     """
     category = get_object_or_404(TourCategory, slug=slug)
+    # Подзапрос по диапазону путей вместо JOIN: без дублей, если тур в нескольких подкатегориях
+    in_subtree = Tour.objects.filter(subtree_q(category.path, "categories__")).values("pk")
     qs = (
-        Tour.objects.filter(is_active=True, categories=category)
+        Tour.objects.filter(is_active=True, pk__in=in_subtree)
         .prefetch_related("categories", "tags")
     )
-    return _render_list(request, qs, extra_ctx={"active_category": category})
+    extra_ctx = {"active_category": category}
+    pagecache.tag(request, category)
+    if not fragment:
+        extra_ctx["category_ancestors"] = category.get_ancestors()
+        pagecache.tag(request, *extra_ctx["category_ancestors"])
+    return _render_list(
+        request, qs, extra_ctx=extra_ctx,
+        more_url=reverse("tours:by_category_more", kwargs={"slug": slug}), fragment=fragment,
+    )
 
 
-def tour_list_by_tag(request, slug):
+@catalog_page()
+def tour_list_by_tag(request, slug, fragment=False):
     """
     Список активных туров по тегу.
     """
     tag = get_object_or_404(Tag, slug=slug)
+    pagecache.tag(request, tag)
     qs = (
         Tour.objects.filter(is_active=True, tags=tag)
         .prefetch_related("categories", "tags")
     )
-    return _render_list(request, qs, extra_ctx={"active_tag": tag})
+    return _render_list(
+        request, qs, extra_ctx={"active_tag": tag},
+        more_url=reverse("tours:by_tag_more", kwargs={"slug": slug}), fragment=fragment,
+    )
 
 
+@catalog_page(last_modified=field_last_modified(Tour.objects.filter(is_active=True), "updated_at"))
 def tour_detail(request, slug):
     """
     Детальная страница тура.
     """
     tour = get_object_or_404(
-        Tour.objects.prefetch_related("categories", "tags"),
+        Tour.objects.prefetch_related("categories", "tags", "images"),
         slug=slug,
         is_active=True,
     )
 
-    # Похожие туры по любой из категорий текущего тура
+    # Похожие туры: предрасчитанный top-K (core.related), один запрос по индексу (source, rank)
     related = (
-        Tour.objects.filter(is_active=True, categories__in=tour.categories.all())
-        .exclude(id=tour.id)
-        .prefetch_related("categories", "tags")
-        .order_by("-is_popular", "-created_at")[:6]
+        Tour.objects.filter(similar_to__source=tour, is_active=True)
+        .order_by("similar_to__rank")
     )
 
     # Данные сайдбара
     categories, tags, popular = _sidebar_context()
 
+    pagecache.tag(
+        request, tour, f"related:{pagecache.key_for(tour)}", "sidebar:tours",
+        *tour.categories.all(), *tour.tags.all(), *related, *popular,
+    )
+    images.prime(tour.cover, *(img.image for img in tour.images.all()), *(t.cover for t in [*related, *popular]))
+
     ctx = {
         "tour": tour,
         "related_tours": related,